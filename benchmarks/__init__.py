@@ -0,0 +1,5 @@
+"""
+端到端的性能测试：生成虚拟的接口和 peer，用假的 wg / wg-quick / ping / dig 和本地 DNS 服务器运行检查周期
+
+python -m benchmarks --peers 1000 --interfaces 4 --cycles 20 --output result.json
+"""
@@ -0,0 +1,67 @@
+import argparse
+import json
+import sys
+
+from wireguard_dynamic_remote.common.timespan import parse_timespan
+
+from .runner import run
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Run check cycles against a synthetic fleet with fake wg / ping / dig and a local DNS server",
+    )
+    parser.add_argument("--interfaces", type=int, default=1, help="Number of interfaces")
+    parser.add_argument("--peers", type=int, default=100, help="Peers per interface")
+    parser.add_argument(
+        "--hostnames",
+        default="unique",
+        help="Number of distinct hostnames shared round-robin by all peers, or 'unique'",
+    )
+    parser.add_argument("--addresses-per-host", type=int, default=1)
+    parser.add_argument("--cycles", type=int, default=20, help="Measured cycles")
+    parser.add_argument("--warmup", type=int, default=1, help="Cycles run before measuring")
+    parser.add_argument(
+        "--change-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of hostnames whose address changes before each cycle",
+    )
+    parser.add_argument("--dns-latency", default="2ms", help="Delay of every DNS answer")
+    parser.add_argument("--ttl", type=int, default=0, help="TTL of DNS answers")
+    parser.add_argument("--ping-latency", default="5ms", help="Average delay of the fake ping")
+    parser.add_argument("--ping-loss", type=float, default=0.0, help="Fraction of addresses that never answer ping")
+    parser.add_argument("--probe", default="ping", help="--probe passed to the checker")
+    parser.add_argument("-j", "--jobs", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="Write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    result = run(
+        interfaces=args.interfaces,
+        peers=args.peers,
+        hostnames=None if args.hostnames == "unique" else int(args.hostnames),
+        addresses_per_host=args.addresses_per_host,
+        cycles=args.cycles,
+        warmup=args.warmup,
+        change_rate=args.change_rate,
+        dns_latency=parse_timespan(args.dns_latency),
+        ttl=args.ttl,
+        ping_latency=parse_timespan(args.ping_latency),
+        ping_loss=args.ping_loss,
+        probe=args.probe,
+        jobs=args.jobs,
+        seed=args.seed,
+    )
+
+    text = json.dumps(result, indent=2, sort_keys=True) + "\n"
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text)
+
+
+if __name__ == "__main__":
+    main()
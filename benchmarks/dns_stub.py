@@ -0,0 +1,138 @@
+"""
+本地 DNS 服务器，按 Zone 回答 A 记录，每个回答延迟 latency 秒
+
+同一个端口上也接受 TCP 查询；truncate 时 UDP 只回答带 TC 标志的空响应，客户端必须改用 TCP
+"""
+
+import asyncio
+import socket
+import struct
+import threading
+
+from .fleet import Zone
+
+QTYPE_A = 1
+RCODE_NXDOMAIN = 3
+FLAG_TC = 0x0200
+
+
+def _parse_question(data: bytes) -> tuple[str, int, int]:
+    """返回 (名称, qtype, question 结束的位置)"""
+    labels = []
+    offset = 12
+    while data[offset]:
+        length = data[offset]
+        labels.append(data[offset + 1 : offset + 1 + length].decode())
+        offset += length + 1
+    qtype = struct.unpack_from("!H", data, offset + 1)[0]
+    return ".".join(labels), qtype, offset + 5
+
+
+def build_response(data: bytes, zone: Zone, ttl: int, truncated: bool = False) -> bytes:
+    qid = data[:2]
+    name, qtype, end = _parse_question(data)
+    addresses = zone.records.get(name.lower().rstrip("."))
+    flags = 0x8180 | (RCODE_NXDOMAIN if addresses is None else 0)
+    if truncated:
+        flags |= FLAG_TC
+    answers = []
+    if addresses and qtype == QTYPE_A and not truncated:
+        for address in addresses:
+            answers.append(
+                b"\xc0\x0c"
+                + struct.pack("!HHIH", QTYPE_A, 1, ttl, 4)
+                + socket.inet_aton(address)
+            )
+    return (
+        qid
+        + struct.pack("!HHHHH", flags, 1, len(answers), 0, 0)
+        + data[12:end]
+        + b"".join(answers)
+    )
+
+
+class _Protocol(asyncio.DatagramProtocol):
+    def __init__(self, stub: "DnsStub"):
+        self.stub = stub
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr):
+        self.stub.queries += 1
+        try:
+            response = build_response(data, self.stub.zone, self.stub.ttl, self.stub.truncate)
+        except (IndexError, struct.error, UnicodeDecodeError):
+            return
+        if self.stub.latency > 0:
+            asyncio.get_running_loop().call_later(
+                self.stub.latency, self.transport.sendto, response, addr
+            )
+        else:
+            self.transport.sendto(response, addr)
+
+
+async def _serve_tcp(stub: "DnsStub", reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while True:
+            (length,) = struct.unpack("!H", await reader.readexactly(2))
+            data = await reader.readexactly(length)
+            stub.tcp_queries += 1
+            response = build_response(data, stub.zone, stub.ttl)
+            if stub.latency > 0:
+                await asyncio.sleep(stub.latency)
+            writer.write(struct.pack("!H", len(response)) + response)
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError, IndexError, struct.error, UnicodeDecodeError):
+        pass
+    finally:
+        writer.close()
+
+
+class DnsStub:
+    def __init__(self, zone: Zone, latency: float = 0.0, ttl: int = 0, truncate: bool = False):
+        self.zone = zone
+        self.latency = latency
+        self.ttl = ttl
+        self.truncate = truncate
+        self.queries = 0
+        self.tcp_queries = 0
+        self.address = ""
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="dns-stub", daemon=True)
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        transport, _ = self._loop.run_until_complete(
+            self._loop.create_datagram_endpoint(
+                lambda: _Protocol(self), local_addr=("127.0.0.1", 0)
+            )
+        )
+        host, port = transport.get_extra_info("sockname")[:2]
+        server = self._loop.run_until_complete(
+            asyncio.start_server(
+                lambda reader, writer: _serve_tcp(self, reader, writer), host, port
+            )
+        )
+        self.address = f"{host}:{port}"
+        self._ready.set()
+        self._loop.run_forever()
+        server.close()
+        transport.close()
+        # 结束还没断开的 TCP 连接，然后再关闭事件循环
+        tasks = asyncio.all_tasks(self._loop)
+        for task in tasks:
+            task.cancel()
+        self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self._loop.close()
+
+    def start(self) -> str:
+        """返回 --resolver 使用的地址"""
+        self._thread.start()
+        self._ready.wait()
+        return self.address
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
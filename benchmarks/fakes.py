@@ -0,0 +1,132 @@
+"""
+代替 wg、wg-quick、ping 和 dig 的可执行文件
+
+运行状态保存在 runtime/<接口>.json 中；ping 的延迟和丢包率由参数决定，对同一个地址的结果总是相同
+"""
+
+import os
+import sys
+from pathlib import Path
+
+_WG = r'''
+import json, os, sys
+RUNTIME = {runtime!r}
+
+def load(name):
+    try:
+        with open(os.path.join(RUNTIME, name + ".json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        print(f"Unable to access interface: No such device", file=sys.stderr)
+        sys.exit(1)
+
+def store(name, state):
+    with open(os.path.join(RUNTIME, name + ".json"), "w") as f:
+        json.dump(state, f)
+
+args = sys.argv[1:]
+if args[:3] == ["show", "all", "dump"]:
+    out = []
+    for file in sorted(os.listdir(RUNTIME)):
+        name = file[:-5]
+        state = load(name)
+        out.append(f"{{name}}\t{{state['private_key']}}\t(none)\t{{state['listen_port']}}\toff")
+        for key, peer in state["peers"].items():
+            out.append(
+                f"{{name}}\t{{key}}\t(none)\t{{peer['endpoint'] or '(none)'}}\t{{peer['allowed_ips']}}"
+                f"\t{{peer.get('handshake', 0)}}\t0\t0\toff"
+            )
+    print("\n".join(out))
+elif args[0] == "showconf":
+    state = load(args[1])
+    out = ["[Interface]", f"PrivateKey = {{state['private_key']}}", f"ListenPort = {{state['listen_port']}}"]
+    for key, peer in state["peers"].items():
+        out += ["", "[Peer]", f"PublicKey = {{key}}", f"AllowedIPs = {{peer['allowed_ips']}}"]
+        if peer["endpoint"]:
+            out.append(f"Endpoint = {{peer['endpoint']}}")
+    print("\n".join(out))
+elif args[0] == "set":
+    state = load(args[1])
+    i = 2
+    while i < len(args):
+        if args[i] == "peer":
+            peer = state["peers"].setdefault(args[i + 1], {{"endpoint": "", "allowed_ips": ""}})
+            i += 2
+        elif args[i] == "endpoint":
+            peer["endpoint"] = args[i + 1]
+            i += 2
+        else:
+            i += 2
+    store(args[1], state)
+elif args[0] == "syncconf":
+    state = load(args[1])
+    peer = None
+    for line in open(args[2]):
+        name, _, value = (part.strip() for part in line.partition("="))
+        if name == "PublicKey":
+            peer = state["peers"].setdefault(value, {{"endpoint": "", "allowed_ips": ""}})
+        elif name == "Endpoint" and peer is not None:
+            peer["endpoint"] = value
+    store(args[1], state)
+else:
+    print(f"fake wg: unsupported arguments {{args}}", file=sys.stderr)
+    sys.exit(1)
+'''
+
+_WG_QUICK = r'''
+import sys
+WG_QUICK_KEYS = ("address", "dns", "mtu", "table", "preup", "postup", "predown", "postdown", "saveconfig")
+if sys.argv[1:2] != ["strip"]:
+    print("fake wg-quick: only strip is supported", file=sys.stderr)
+    sys.exit(1)
+for line in open(sys.argv[2]):
+    line = line.split("#", 1)[0].strip()
+    if line and line.partition("=")[0].strip().lower() not in WG_QUICK_KEYS:
+        print(line)
+'''
+
+_PING = r'''
+import hashlib, sys, time
+address = sys.argv[-1]
+digest = hashlib.sha256(address.encode()).digest()
+if digest[0] / 256 < {loss!r}:
+    time.sleep({timeout!r})
+    sys.exit(1)
+time.sleep({latency!r} * (0.5 + digest[1] / 256))
+print(f"64 bytes from {{address}}: icmp_seq=1")
+'''
+
+_DIG = r'''
+import json, sys
+with open({zone!r}) as f:
+    zone = json.load(f)
+names = [a for a in sys.argv[1:] if not a.startswith(("+", "@", "-")) and a not in ("A", "AAAA") and not a.isdigit()]
+for name in dict.fromkeys(names):
+    for address in zone.get(name, []):
+        print(address)
+'''
+
+
+def _write(path: Path, body: str):
+    path.write_text(f"#!{sys.executable}\n{body}")
+    path.chmod(0o755)
+
+
+def install(
+    root: Path, ping_latency: float = 0.005, ping_loss: float = 0.0, ping_timeout: float = 1.0
+) -> Path:
+    """把假的命令写入 root/bin，返回这个目录（放在 PATH 最前面）"""
+    bin_dir = root / "bin"
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    _write(bin_dir / "wg", _WG.format(runtime=str(root / "runtime")))
+    _write(bin_dir / "wg-quick", _WG_QUICK)
+    _write(
+        bin_dir / "ping",
+        _PING.format(latency=ping_latency, loss=ping_loss, timeout=ping_timeout),
+    )
+    _write(bin_dir / "dig", _DIG.format(zone=str(root / "zone.json")))
+    return bin_dir
+
+
+def prepend_path(bin_dir: Path):
+    os.environ["PATH"] = f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}"
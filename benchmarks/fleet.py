@@ -0,0 +1,116 @@
+"""
+生成虚拟的 wg-quick 配置、运行状态和 DNS 记录（同样的参数和种子总是生成同样的结果）
+"""
+
+import base64
+import hashlib
+import json
+import random
+from pathlib import Path
+
+PORT = 51820
+
+
+def key(*parts: object) -> str:
+    """确定的、格式正确的 WireGuard 公钥"""
+    digest = hashlib.sha256("/".join(map(str, parts)).encode()).digest()
+    return base64.b64encode(digest).decode()
+
+
+class Zone:
+    """{hostname: 地址列表}，地址都在 TEST-NET 中"""
+
+    def __init__(self, hostnames: list[str], addresses_per_host: int, seed: int):
+        self.random = random.Random(seed)
+        self.addresses_per_host = addresses_per_host
+        self.records = {host: self._addresses() for host in hostnames}
+
+    def _addresses(self) -> list[str]:
+        return [
+            f"198.{self.random.randint(18, 19)}.{self.random.randint(0, 255)}.{self.random.randint(1, 254)}"
+            for _ in range(self.addresses_per_host)
+        ]
+
+    def mutate(self, rate: float) -> list[str]:
+        """按比例随机修改一些 hostname 的地址，返回被修改的 hostname"""
+        hosts = list(self.records)
+        count = min(round(len(hosts) * rate), len(hosts))
+        if rate > 0 and count == 0:
+            count = 1
+        changed = self.random.sample(hosts, count)
+        for host in changed:
+            self.records[host] = self._addresses()
+        return changed
+
+    def save(self, path: Path):
+        """给假的 dig 使用"""
+        path.write_text(json.dumps(self.records))
+
+
+class Fleet:
+    """
+    interfaces 个接口，每个 peers 个 peer；所有 peer 轮流使用 hostnames 个 hostname
+
+    hostnames 等于 peer 总数时每个 peer 的 hostname 都不同，越小共享的越多
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        interfaces: int,
+        peers: int,
+        hostnames: int,
+        addresses_per_host: int = 1,
+        seed: int = 0,
+    ):
+        self.root = root
+        self.config_dir = root / "config"
+        self.runtime_dir = root / "runtime"
+        self.interfaces = [f"bench{i}" for i in range(interfaces)]
+        self.peers = peers
+        self.zone = Zone(
+            [f"peer{i}.bench.test" for i in range(hostnames)], addresses_per_host, seed
+        )
+
+    def _peers(self, index: int):
+        hosts = list(self.zone.records)
+        for i in range(self.peers):
+            number = index * self.peers + i
+            yield key("peer", index, i), hosts[number % len(hosts)], number
+
+    def write(self):
+        self.config_dir.mkdir(parents=True, exist_ok=True)
+        self.runtime_dir.mkdir(parents=True, exist_ok=True)
+
+        for index, interface in enumerate(self.interfaces):
+            config = [
+                "[Interface]",
+                f"PrivateKey = {key('private', index)}",
+                f"ListenPort = {PORT + index}",
+                "Address = 10.255.0.1/16",
+                "",
+            ]
+            runtime = {
+                "private_key": key("private", index),
+                "listen_port": PORT + index,
+                "peers": {},
+            }
+            for public_key, host, number in self._peers(index):
+                allowed = f"10.{number >> 16 & 255}.{number >> 8 & 255}.{number & 255}/32"
+                config += [
+                    "[Peer]",
+                    f"PublicKey = {public_key}",
+                    f"AllowedIPs = {allowed}",
+                    f"Endpoint = {host}:{PORT}",
+                    "",
+                ]
+                # 启动时所有 endpoint 都是正确的，只有修改过的 hostname 需要更新
+                runtime["peers"][public_key] = {
+                    "endpoint": f"{self.zone.records[host][0]}:{PORT}",
+                    "allowed_ips": allowed,
+                }
+
+            (self.config_dir / f"{interface}.conf").write_text("\n".join(config))
+            (self.runtime_dir / f"{interface}.json").write_text(json.dumps(runtime))
+
+        self.zone.save(self.root / "zone.json")
@@ -0,0 +1,252 @@
+"""
+在当前进程中运行检查周期并统计：周期耗时的 p50/p99、每个周期创建的子进程和 read/write 系统调用、峰值内存
+"""
+
+import contextlib
+import math
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from . import fakes
+from .dns_stub import DnsStub
+from .fleet import Fleet
+
+SCHEMA = 1
+
+_AUDIT_SPAWN_EVENTS = {"subprocess.Popen", "os.fork", "os.forkpty", "os.posix_spawn", "os.system"}
+_spawned = 0
+
+
+def _audit(event: str, args):
+    global _spawned
+    if event in _AUDIT_SPAWN_EVENTS:
+        _spawned += 1
+
+
+def _io_syscalls() -> tuple[int, int] | None:
+    """/proc/self/io 中的 (read 类, write 类) 系统调用次数，没有时返回 None"""
+    try:
+        fields = dict(
+            line.split(": ")
+            for line in Path("/proc/self/io").read_text().splitlines()
+            if ": " in line
+        )
+        return int(fields["syscr"]), int(fields["syscw"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def percentile(values: list[float], p: float) -> float:
+    """nearest-rank"""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+
+def _summary(values: list[float]) -> dict:
+    return {
+        "p50": percentile(values, 50),
+        "p99": percentile(values, 99),
+        "mean": statistics.fmean(values),
+        "min": min(values),
+        "max": max(values),
+    }
+
+
+def _round(value):
+    if isinstance(value, float):
+        return round(value, 6)
+    if isinstance(value, dict):
+        return {k: _round(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_round(v) for v in value]
+    return value
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _quiet():
+    devnull = open(os.devnull, "w")
+    stack = contextlib.ExitStack()
+    stack.enter_context(devnull)
+    stack.enter_context(contextlib.redirect_stdout(devnull))
+    stack.enter_context(contextlib.redirect_stderr(devnull))
+    return stack
+
+
+def _micro(fleet: Fleet, addresses: int) -> dict:
+    from wireguard_dynamic_remote.common.networking import ping_each_ip
+    from wireguard_dynamic_remote.wireguard.config_parser import parse_config_content
+    from wireguard_dynamic_remote.wireguard.type import GlobalConfig
+
+    content = (fleet.config_dir / f"{fleet.interfaces[0]}.conf").read_text()
+    parse = []
+    for _ in range(5):
+        started = time.perf_counter()
+        parse_config_content(content, GlobalConfig)
+        parse.append(time.perf_counter() - started)
+
+    targets = [f"198.18.0.{i + 1}" for i in range(max(addresses, 3))]
+    ping = []
+    with _quiet():
+        for _ in range(3):
+            started = time.perf_counter()
+            ping_each_ip(targets)
+            ping.append(time.perf_counter() - started)
+
+    return {
+        "parse_config_content_seconds": statistics.median(parse),
+        "ping_each_ip_seconds": statistics.median(ping),
+    }
+
+
+def run(
+    interfaces: int = 1,
+    peers: int = 100,
+    hostnames: int | None = None,
+    addresses_per_host: int = 1,
+    cycles: int = 20,
+    warmup: int = 1,
+    change_rate: float = 0.0,
+    dns_latency: float = 0.002,
+    ttl: int = 0,
+    ping_latency: float = 0.005,
+    ping_loss: float = 0.0,
+    probe: str = "ping",
+    jobs: int | None = None,
+    seed: int = 0,
+) -> dict:
+    """hostnames 为 None 时每个 peer 使用不同的 hostname"""
+    params = {
+        "interfaces": interfaces,
+        "peers_per_interface": peers,
+        "hostnames": hostnames or interfaces * peers,
+        "addresses_per_host": addresses_per_host,
+        "cycles": cycles,
+        "warmup": warmup,
+        "change_rate": change_rate,
+        "dns_latency": dns_latency,
+        "ttl": ttl,
+        "ping_latency": ping_latency,
+        "ping_loss": ping_loss,
+        "probe": probe,
+        "seed": seed,
+    }
+
+    root = Path(tempfile.mkdtemp(prefix="wgdr-bench."))
+    stub = None
+    try:
+        fleet = Fleet(
+            root, interfaces, peers, params["hostnames"], addresses_per_host, seed
+        )
+        fleet.write()
+        fakes.prepend_path(fakes.install(root, ping_latency, ping_loss))
+        stub = DnsStub(fleet.zone, dns_latency, ttl)
+        resolver = stub.start()
+
+        import wireguard_dynamic_remote.common.state as state
+        import wireguard_dynamic_remote.wireguard as wireguard
+        from wireguard_dynamic_remote.common.context import DEFAULT_JOBS, RunContext
+        from wireguard_dynamic_remote.daemon.main import run_cycle
+
+        state.STATE_DIR = str(root / "state")
+        wireguard.CONFIG_FILES_DIR = fleet.config_dir
+        wireguard.select_backend("wg")
+
+        params["jobs"] = jobs or DEFAULT_JOBS
+        config = RunContext(
+            fleet.interfaces, 60, [resolver], params["jobs"], "wg", probe
+        )
+
+        sys.addaudithook(_audit)
+        durations: list[float] = []
+        spawned: list[int] = []
+        syscalls: list[tuple[int, int]] = []
+        cpu: list[tuple[float, float]] = []
+        failed = 0
+        for cycle in range(warmup + cycles):
+            if change_rate and cycle >= warmup:
+                fleet.zone.mutate(change_rate)
+                fleet.zone.save(root / "zone.json")
+
+            spawned_before = _spawned
+            io_before = _io_syscalls()
+            times_before = os.times()
+            started = time.perf_counter()
+            with _quiet():
+                ok = run_cycle(config)
+            elapsed = time.perf_counter() - started
+            times_after = os.times()
+            io_after = _io_syscalls()
+
+            if cycle < warmup:
+                continue
+            failed += not ok
+            durations.append(elapsed)
+            spawned.append(_spawned - spawned_before)
+            cpu.append(
+                (
+                    times_after.user + times_after.system - times_before.user - times_before.system,
+                    times_after.children_user
+                    + times_after.children_system
+                    - times_before.children_user
+                    - times_before.children_system,
+                )
+            )
+            if io_before and io_after:
+                syscalls.append((io_after[0] - io_before[0], io_after[1] - io_before[1]))
+
+        result = {
+            "schema": SCHEMA,
+            "params": params,
+            "environment": {
+                "commit": _commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+            },
+            "cycle_seconds": _summary(durations),
+            "failed_cycles": failed,
+            "subprocesses_per_cycle": statistics.fmean(spawned),
+            "io_syscalls_per_cycle": (
+                {
+                    "read": statistics.fmean(s[0] for s in syscalls),
+                    "write": statistics.fmean(s[1] for s in syscalls),
+                }
+                if syscalls
+                else None
+            ),
+            "cpu_seconds_per_cycle": {
+                "self": statistics.fmean(c[0] for c in cpu),
+                "children": statistics.fmean(c[1] for c in cpu),
+            },
+            "dns_queries": stub.queries,
+            "peak_rss_kib": {
+                "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+            },
+            "micro": _micro(fleet, addresses_per_host),
+        }
+        return _round(result)
+    finally:
+        if stub:
+            stub.stop()
+        shutil.rmtree(root, ignore_errors=True)
@@ -0,0 +1,173 @@
+import asyncio
+import socket
+import struct
+
+import pytest
+
+from benchmarks.dns_stub import DnsStub
+from benchmarks.fleet import Zone
+from wireguard_dynamic_remote.daemon import dns
+
+
+def _header(qid: int, flags: int, qd: int, an: int, ns: int) -> bytes:
+    return struct.pack("!HHHHHH", qid, flags, qd, an, ns, 0)
+
+
+def _record(name: bytes, rtype: int, ttl: int, rdata: bytes) -> bytes:
+    return name + struct.pack("!HHIH", rtype, 1, ttl, len(rdata)) + rdata
+
+
+# 问题段中的名称在报文的第 12 字节，答案用压缩指针指向它
+_POINTER = b"\xc0\x0c"
+
+
+def test_build_query():
+    query = dns.build_query(0x1234, "peer.example.com.", dns.QTYPE_AAAA)
+    assert query[:2] == b"\x12\x34"
+    assert query[12:] == b"\x04peer\x07example\x03com\x00" + struct.pack("!HH", dns.QTYPE_AAAA, 1)
+
+
+def test_build_query_rejects_invalid_labels():
+    with pytest.raises(dns.DnsError):
+        dns.build_query(1, "a.." + "x" * 10, dns.QTYPE_A)
+    with pytest.raises(dns.DnsError):
+        dns.build_query(1, "x" * 64 + ".example", dns.QTYPE_A)
+
+
+def test_parse_compressed_answers():
+    question = dns.build_query(7, "www.example.com", dns.QTYPE_A)[12:]
+    cname = b"\x03cdn" + _POINTER
+    data = (
+        _header(7, 0x8180, 1, 3, 0)
+        + question
+        + _record(_POINTER, 5, 30, cname)
+        + _record(_POINTER, dns.QTYPE_A, 300, socket.inet_aton("192.0.2.1"))
+        + _record(_POINTER, dns.QTYPE_A, 60, socket.inet_aton("192.0.2.2"))
+    )
+
+    qid, _, rcode, qtype, records, soa = dns.parse_response(data)
+    assert (qid, rcode, qtype, soa) == (7, dns.RCODE_NOERROR, dns.QTYPE_A, None)
+    assert [r[0] for r in records] == [5, dns.QTYPE_A, dns.QTYPE_A]
+
+    answer = dns._make_answer(dns.QTYPE_A, data)
+    assert answer.addresses == ["192.0.2.1", "192.0.2.2"]
+    assert answer.ttl == 60  # CNAME 的 TTL 不算在内
+
+
+def test_parse_negative_answer_uses_soa_minimum():
+    question = dns.build_query(8, "missing.example.com", dns.QTYPE_AAAA)[12:]
+    soa = _POINTER + _POINTER + struct.pack("!IIIII", 1, 7200, 900, 1209600, 120)
+    data = (
+        _header(8, 0x8183, 1, 0, 1)
+        + question
+        + _record(b"\xc0\x14", dns.QTYPE_SOA, 3600, soa)
+    )
+
+    answer = dns._make_answer(dns.QTYPE_AAAA, data)
+    assert answer.rcode == dns.RCODE_NXDOMAIN
+    assert answer.addresses == []
+    assert answer.ttl == 120
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"\x00" * 11,
+        _header(1, 0x8180, 1, 0, 0) + b"\x07example",
+        _header(1, 0x8180, 1, 1, 0)
+        + dns.build_query(1, "a.test", dns.QTYPE_A)[12:]
+        + _POINTER
+        + struct.pack("!HHIH", dns.QTYPE_A, 1, 60, 4)
+        + b"\xc0\x00",
+    ],
+)
+def test_parse_malformed(data):
+    with pytest.raises(dns.DnsError):
+        dns.parse_response(data)
+
+
+@pytest.mark.parametrize(
+    "server, expected",
+    [
+        ("192.0.2.1", ("192.0.2.1", 53)),
+        ("192.0.2.1:5353", ("192.0.2.1", 5353)),
+        ("[2001:db8::1]:5353", ("2001:db8::1", 5353)),
+        ("2001:db8::1", ("2001:db8::1", 53)),
+    ],
+)
+def test_parse_server(server, expected):
+    assert dns.parse_server(server) == expected
+
+
+@pytest.fixture
+def zone():
+    return Zone(["a.test", "b.test"], 2, seed=1)
+
+
+def _query(host: str, server: str, qtypes=(dns.QTYPE_A,)):
+    return asyncio.run(dns.query(host, server, qtypes, timeout=2))
+
+
+def test_query_udp(zone):
+    stub = DnsStub(zone, ttl=30)
+    server = stub.start()
+    try:
+        answers = _query("a.test", server, (dns.QTYPE_A, dns.QTYPE_AAAA))
+    finally:
+        stub.stop()
+
+    assert answers[dns.QTYPE_A].addresses == zone.records["a.test"]
+    assert answers[dns.QTYPE_A].ttl == 30
+    assert answers[dns.QTYPE_AAAA].addresses == []
+    assert stub.queries == 2
+    assert stub.tcp_queries == 0
+
+
+def test_query_nxdomain(zone):
+    stub = DnsStub(zone)
+    server = stub.start()
+    try:
+        answers = _query("missing.test", server)
+    finally:
+        stub.stop()
+
+    assert answers[dns.QTYPE_A].rcode == dns.RCODE_NXDOMAIN
+    assert answers[dns.QTYPE_A].addresses == []
+
+
+def test_query_truncated_retries_over_tcp(zone):
+    stub = DnsStub(zone, truncate=True)
+    server = stub.start()
+    try:
+        answers = _query("b.test", server, (dns.QTYPE_A, dns.QTYPE_AAAA))
+    finally:
+        stub.stop()
+
+    assert answers[dns.QTYPE_A].addresses == zone.records["b.test"]
+    assert stub.queries == 2
+    assert stub.tcp_queries == 2
+
+
+def test_query_timeout(zone):
+    # 绑定了但是从不回答的端口
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    try:
+        with pytest.raises(dns.DnsTimeout):
+            asyncio.run(dns.query("a.test", "127.0.0.1:%d" % sock.getsockname()[1], timeout=0.3))
+    finally:
+        sock.close()
+
+
+def test_queries_use_distinct_ids(zone, monkeypatch):
+    # 随机数每次都相同时，A 和 AAAA 查询的 ID 也不能相同
+    monkeypatch.setattr(dns.secrets, "randbits", lambda bits: 0x4242)
+    stub = DnsStub(zone, truncate=True)
+    server = stub.start()
+    try:
+        answers = _query("a.test", server, (dns.QTYPE_A, dns.QTYPE_AAAA))
+    finally:
+        stub.stop()
+
+    assert set(answers) == {dns.QTYPE_A, dns.QTYPE_AAAA}
+    assert answers[dns.QTYPE_A].addresses == zone.records["a.test"]
@@ -0,0 +1,137 @@
+import asyncio
+import shutil
+import ssl
+import struct
+import subprocess
+
+import pytest
+
+from benchmarks.dns_stub import build_response
+from benchmarks.fleet import Zone
+from wireguard_dynamic_remote.daemon import dns, dns_tls
+
+pytestmark = pytest.mark.skipif(shutil.which("openssl") is None, reason="needs openssl")
+
+
+@pytest.fixture(scope="module")
+def certificate(tmp_path_factory):
+    """localhost 的自签名证书，返回 (证书, 私钥)"""
+    directory = tmp_path_factory.mktemp("tls")
+    cert, key = directory / "cert.pem", directory / "key.pem"
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+            "-subj", "/CN=localhost", "-addext", "subjectAltName=DNS:localhost",
+            "-keyout", str(key), "-out", str(cert),
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return cert, key
+
+
+@pytest.fixture(autouse=True)
+def trust(certificate, monkeypatch):
+    monkeypatch.setattr(dns_tls, "_ssl_context", ssl.create_default_context(cafile=certificate[0]))
+    monkeypatch.setattr(dns_tls, "_connections", {})
+
+
+class TlsStub:
+    """本地 DoT 服务器；drop_next 时下一个查询不回答，直接关闭连接（像服务器关闭了空闲连接）"""
+
+    def __init__(self, certificate):
+        self.context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        self.context.load_cert_chain(*certificate)
+        self.zone = Zone(["a.test"], 2, seed=1)
+        self.connections = 0
+        self.queries = 0
+        self.drop_next = False
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(
+            self._serve, "127.0.0.1", 0, ssl=self.context
+        )
+        port = self.server.sockets[0].getsockname()[1]
+        return f"tls://127.0.0.1:{port}#localhost"
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while True:
+                (length,) = struct.unpack("!H", await reader.readexactly(2))
+                data = await reader.readexactly(length)
+                if self.drop_next:
+                    self.drop_next = False
+                    return
+                self.queries += 1
+                response = build_response(data, self.zone, 60)
+                writer.write(struct.pack("!H", len(response)) + response)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+def _query(server: str):
+    return dns.query("a.test", server, (dns.QTYPE_A,), timeout=2)
+
+
+def test_queries_share_one_connection(certificate):
+    async def run():
+        stub = TlsStub(certificate)
+        server = await stub.start()
+        first = await _query(server)
+        second = await _query(server)
+        stub.server.close()
+        return stub, first, second
+
+    stub, first, second = asyncio.run(run())
+    assert first[dns.QTYPE_A].addresses == stub.zone.records["a.test"]
+    assert second[dns.QTYPE_A].addresses == stub.zone.records["a.test"]
+    assert stub.connections == 1
+
+
+def test_reconnect_after_idle_close(certificate):
+    async def run():
+        stub = TlsStub(certificate)
+        server = await stub.start()
+        await _query(server)
+        stub.drop_next = True
+        answers = await _query(server)
+        stub.server.close()
+        return stub, answers
+
+    stub, answers = asyncio.run(run())
+    assert answers[dns.QTYPE_A].addresses == stub.zone.records["a.test"]
+    assert stub.connections == 2
+    assert stub.queries == 2
+
+
+def test_failed_reconnect_raises_dns_error(certificate):
+    async def run():
+        stub = TlsStub(certificate)
+        server = await stub.start()
+        await _query(server)
+        # 不再接受新连接，已有的连接在下一个查询时被关闭，重连被拒绝
+        stub.server.close()
+        stub.drop_next = True
+        await _query(server)
+
+    with pytest.raises(dns.DnsError):
+        asyncio.run(run())
+
+
+def test_untrusted_certificate_raises_dns_error(certificate, monkeypatch):
+    monkeypatch.setattr(dns_tls, "_ssl_context", ssl.create_default_context())
+
+    async def run():
+        stub = TlsStub(certificate)
+        server = await stub.start()
+        try:
+            await _query(server)
+        finally:
+            stub.server.close()
+
+    with pytest.raises(dns.DnsError):
+        asyncio.run(run())
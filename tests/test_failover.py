@@ -0,0 +1,96 @@
+import time
+
+import pytest
+
+from wireguard_dynamic_remote.daemon import failover
+from wireguard_dynamic_remote.wireguard import Backend, RuntimeSnapshot, backend
+from wireguard_dynamic_remote.wireguard.snapshot import parse_dump
+
+KEY = "peer-key="
+OLD = "192.0.2.1:51820"
+NEW = "192.0.2.2:51820"
+
+
+class FakeBackend(Backend):
+    """第一次读取（切换之前）之后，每次读取前调用 on_poll(self) 改变 peer 的握手、接收字节数和 endpoint"""
+
+    def __init__(self, on_poll):
+        self.on_poll = on_poll
+        self.reads = 0
+        self.endpoint = OLD
+        self.handshake = int(time.time()) - 300
+        self.rx = 1000
+        self.keepalive: list[int] = []
+
+    def current(self) -> RuntimeSnapshot:
+        dump = (
+            "wg0\t(none)\tpub\t51820\toff\n"
+            f"wg0\t{KEY}\t(none)\t{self.endpoint}\t10.0.0.2/32\t{self.handshake}\t{self.rx}\t0\toff\n"
+        )
+        return RuntimeSnapshot(parse_dump(dump))
+
+    def snapshot(self, interfaces):
+        self.reads += 1
+        if self.reads > 1:
+            self.on_poll(self)
+        return self.current()
+
+    def set_endpoints(self, interface, endpoints):
+        self.endpoint = endpoints[KEY]
+
+    def set_keepalive(self, interface, public_key, seconds):
+        self.keepalive.append(seconds)
+
+
+@pytest.fixture
+def use(monkeypatch):
+    monkeypatch.setattr(failover, "POLL_INTERVAL", 0.01)
+
+    def use(on_poll) -> FakeBackend:
+        fake = FakeBackend(on_poll)
+        monkeypatch.setattr(backend, "_backend", fake)
+        return fake
+
+    return use
+
+
+def _peer(fake: FakeBackend):
+    return fake.current().get("wg0").peers[0]
+
+
+def test_handshake_after_switch(use):
+    def on_poll(fake):
+        fake.handshake = int(time.time())
+
+    fake = use(on_poll)
+    assert failover.verify_endpoint("wg0", _peer(fake), NEW, 0.2)
+    # 没有 keepalive 的 peer 临时打开，之后关闭
+    assert fake.keepalive == [1, 0]
+
+
+def test_received_data_without_handshake_fails(use):
+    def on_poll(fake):
+        fake.rx += 100  # 旧会话仍然从原来的地址收到数据
+
+    fake = use(on_poll)
+    assert not failover.verify_endpoint("wg0", _peer(fake), NEW, 0.2)
+
+
+def test_roamed_back_fails(use):
+    def on_poll(fake):
+        # 旧地址发来的包让 WireGuard 漫游回原来的 endpoint
+        fake.handshake = int(time.time())
+        fake.endpoint = OLD
+
+    fake = use(on_poll)
+    assert not failover.verify_endpoint("wg0", _peer(fake), NEW, 0.2)
+
+
+def test_failover_tries_next_candidate(use):
+    def on_poll(fake):
+        if fake.endpoint == NEW:
+            fake.handshake = int(time.time())
+
+    fake = use(on_poll)
+    endpoint = failover.failover("wg0", _peer(fake), ["192.0.2.9", "192.0.2.2"], "51820", 0.1)
+    assert endpoint == NEW
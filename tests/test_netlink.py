@@ -0,0 +1,222 @@
+import base64
+import errno
+import socket
+import struct
+
+import pytest
+
+from wireguard_dynamic_remote.wireguard import netlink
+
+FAMILY_ID = 0x1F
+
+KEY_A = base64.b64encode(b"\x01" * 32).decode()
+KEY_B = base64.b64encode(b"\x02" * 32).decode()
+
+
+def _message(kind: int, flags: int, seq: int, payload: bytes) -> bytes:
+    length = 16 + len(payload)
+    header = struct.pack("=IHHII", length, kind, flags, seq, 0)
+    return header + payload + b"\0" * (netlink._align(length) - length)
+
+
+def _genl(kind: int, flags: int, seq: int, cmd: int, attrs: bytes) -> bytes:
+    return _message(kind, flags, seq, struct.pack("=BBH", cmd, 1, 0) + attrs)
+
+
+def _error(seq: int, code: int) -> bytes:
+    return _message(netlink.NLMSG_ERROR, 0, seq, struct.pack("=i", code) + b"\0" * 16)
+
+
+def _done(seq: int) -> bytes:
+    return _message(netlink.NLMSG_DONE, netlink.NLM_F_MULTI, seq, struct.pack("=i", 0))
+
+
+class FakeSocket:
+    """记录发出的请求，按 handler 返回的数据报逐个交给 recv"""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.sent: list[tuple[int, int, int, int, bytes]] = []
+        self._pending: list[bytes] = []
+
+    def bind(self, address):
+        pass
+
+    def close(self):
+        pass
+
+    def send(self, data: bytes):
+        _, kind, flags, seq, _ = struct.unpack_from("=IHHII", data)
+        cmd, _, _ = struct.unpack_from("=BBH", data, 16)
+        request = (kind, flags, seq, cmd, data[20:])
+        self.sent.append(request)
+        self._pending.extend(self.handler(*request))
+        return len(data)
+
+    def recv(self, size: int) -> bytes:
+        return self._pending.pop(0)
+
+
+def _control(kind, flags, seq, cmd, attrs):
+    assert kind == netlink.GENL_ID_CTRL
+    assert netlink.parse_attrs(attrs) == [(netlink.CTRL_ATTR_FAMILY_NAME, b"wireguard\0")]
+    reply = netlink.attr(netlink.CTRL_ATTR_FAMILY_ID, struct.pack("=H", FAMILY_ID) + b"\0\0")
+    return [_genl(netlink.GENL_ID_CTRL, 0, seq, 1, reply)]
+
+
+def _open(monkeypatch, handler) -> tuple[netlink.WireguardNetlink, FakeSocket]:
+    def dispatch(kind, flags, seq, cmd, attrs):
+        if kind == netlink.GENL_ID_CTRL:
+            return _control(kind, flags, seq, cmd, attrs)
+        assert kind == FAMILY_ID
+        return handler(flags, seq, cmd, attrs)
+
+    fake = FakeSocket(dispatch)
+    monkeypatch.setattr(netlink.socket, "socket", lambda *args: fake)
+    return netlink.WireguardNetlink(), fake
+
+
+def _allowed(address: str, cidr: int) -> bytes:
+    family = socket.AF_INET6 if ":" in address else socket.AF_INET
+    return netlink.nested(
+        0,
+        netlink.attr(netlink.WGALLOWEDIP_A_FAMILY, struct.pack("=H", family)),
+        netlink.attr(netlink.WGALLOWEDIP_A_IPADDR, socket.inet_pton(family, address)),
+        netlink.attr(netlink.WGALLOWEDIP_A_CIDR_MASK, bytes([cidr])),
+    )
+
+
+def _peer(*attrs: bytes) -> bytes:
+    return netlink.nested(0, *attrs)
+
+
+def _sent_peers(attrs: bytes) -> list[dict[int, bytes]]:
+    """从 SET_DEVICE 请求中取出每个 peer 的属性"""
+    peers = dict(netlink.parse_attrs(attrs))[netlink.WGDEVICE_A_PEERS]
+    return [dict(netlink.parse_attrs(item)) for _, item in netlink.parse_attrs(peers)]
+
+
+def test_attr_packing():
+    assert netlink.attr(1, b"abc") == struct.pack("=HH", 7, 1) + b"abc\0"
+    assert netlink.attr(2, b"abcd") == struct.pack("=HH", 8, 2) + b"abcd"
+
+    packed = netlink.nested(8, netlink.attr(1, b"x"), netlink.attr(2, b""))
+    (length, kind) = struct.unpack_from("=HH", packed)
+    assert kind == 8 | netlink.NLA_F_NESTED
+    assert length == len(packed) == 4 + 8 + 4
+    # 类型中的 NLA_F_NESTED 标志在解析时去掉
+    [(kind, value)] = netlink.parse_attrs(packed)
+    assert kind == 8
+    assert netlink.parse_attrs(value) == [(1, b"x"), (2, b"")]
+
+
+def test_sockaddr_round_trip():
+    v4 = netlink.encode_sockaddr("192.0.2.1", 51820)
+    assert len(v4) == 16
+    assert netlink.decode_sockaddr(v4) == "192.0.2.1:51820"
+
+    v6 = netlink.encode_sockaddr("2001:db8::1", 443)
+    assert len(v6) == 28
+    assert netlink.decode_sockaddr(v6) == "[2001:db8::1]:443"
+
+
+def test_get_device_merges_split_allowedips(monkeypatch):
+    def handler(flags, seq, cmd, attrs):
+        assert cmd == netlink.WG_CMD_GET_DEVICE
+        assert flags == netlink.NLM_F_REQUEST | netlink.NLM_F_DUMP
+        assert dict(netlink.parse_attrs(attrs))[netlink.WGDEVICE_A_IFNAME] == b"wg0\0"
+
+        multi = netlink.NLM_F_MULTI
+        first = netlink.attr(netlink.WGDEVICE_A_LISTEN_PORT, struct.pack("=H", 51820) + b"\0\0")
+        first += netlink.nested(
+            netlink.WGDEVICE_A_PEERS,
+            _peer(
+                netlink.attr(netlink.WGPEER_A_PUBLIC_KEY, b"\x01" * 32),
+                netlink.attr(netlink.WGPEER_A_ENDPOINT, netlink.encode_sockaddr("192.0.2.1", 51820)),
+                netlink.attr(netlink.WGPEER_A_LAST_HANDSHAKE_TIME, struct.pack("=qq", 1700000000, 0)),
+                netlink.nested(netlink.WGPEER_A_ALLOWEDIPS, _allowed("10.0.0.0", 24)),
+            ),
+        )
+        # 同一个 peer 的 AllowedIPs 在下一个消息里继续：内核会重复公钥
+        second = netlink.nested(
+            netlink.WGDEVICE_A_PEERS,
+            _peer(
+                netlink.attr(netlink.WGPEER_A_PUBLIC_KEY, b"\x01" * 32),
+                netlink.nested(netlink.WGPEER_A_ALLOWEDIPS, _allowed("fd00::", 64)),
+            ),
+            _peer(
+                netlink.attr(netlink.WGPEER_A_PUBLIC_KEY, b"\x02" * 32),
+                netlink.nested(netlink.WGPEER_A_ALLOWEDIPS, _allowed("10.1.0.0", 16)),
+            ),
+        )
+        # 不带公钥的片段也属于上一个 peer
+        third = netlink.nested(
+            netlink.WGDEVICE_A_PEERS,
+            _peer(netlink.nested(netlink.WGPEER_A_ALLOWEDIPS, _allowed("10.2.0.0", 16))),
+        )
+        return [
+            _genl(FAMILY_ID, multi, seq, cmd, first),
+            # 序号不同的消息不属于这个请求
+            _genl(FAMILY_ID, multi, seq + 100, cmd, second) + _genl(FAMILY_ID, multi, seq, cmd, second),
+            _genl(FAMILY_ID, multi, seq, cmd, third) + _done(seq),
+        ]
+
+    client, _ = _open(monkeypatch, handler)
+    assert client.family_id == FAMILY_ID
+
+    device, peers = client.get_device("wg0")
+    assert device == {"ListenPort": "51820"}
+    assert [p["PublicKey"] for p in peers] == [KEY_A, KEY_B]
+    assert peers[0]["Endpoint"] == "192.0.2.1:51820"
+    assert peers[0]["LatestHandshake"] == 1700000000
+    assert peers[0]["AllowedIPs"] == ["10.0.0.0/24", "fd00::/64"]
+    assert peers[1]["AllowedIPs"] == ["10.1.0.0/16", "10.2.0.0/16"]
+
+
+def test_get_device_missing_interface(monkeypatch):
+    client, _ = _open(monkeypatch, lambda flags, seq, cmd, attrs: [_error(seq, -errno.ENODEV)])
+    assert client.get_device("wg9") is None
+
+
+def test_set_endpoints_batches_update_only(monkeypatch):
+    client, fake = _open(monkeypatch, lambda flags, seq, cmd, attrs: [_error(seq, 0)])
+
+    endpoints = {
+        base64.b64encode(i.to_bytes(32, "big")).decode(): ("192.0.2.1", 1000 + i)
+        for i in range(1201)
+    }
+    client.set_endpoints("wg0", endpoints)
+
+    requests = fake.sent[1:]
+    batches = [_sent_peers(attrs) for _, _, _, _, attrs in requests]
+    assert [len(b) for b in batches] == [500, 500, 201]
+    for kind, flags, _, cmd, attrs in requests:
+        assert cmd == netlink.WG_CMD_SET_DEVICE
+        assert flags == netlink.NLM_F_REQUEST | netlink.NLM_F_ACK
+        assert dict(netlink.parse_attrs(attrs))[netlink.WGDEVICE_A_IFNAME] == b"wg0\0"
+
+    sent = [peer for batch in batches for peer in batch]
+    for peer, (key, (address, port)) in zip(sent, endpoints.items()):
+        assert netlink._key(peer[netlink.WGPEER_A_PUBLIC_KEY]) == key
+        # 只修改已有的 peer，不会创建新的
+        assert peer[netlink.WGPEER_A_FLAGS] == struct.pack("=I", netlink.WGPEER_F_UPDATE_ONLY)
+        assert netlink.decode_sockaddr(peer[netlink.WGPEER_A_ENDPOINT]) == f"{address}:{port}"
+
+
+def test_set_keepalive_update_only(monkeypatch):
+    client, fake = _open(monkeypatch, lambda flags, seq, cmd, attrs: [_error(seq, 0)])
+    client.set_keepalive("wg0", KEY_B, 25)
+
+    [peer] = _sent_peers(fake.sent[-1][4])
+    assert peer == {
+        netlink.WGPEER_A_PUBLIC_KEY: b"\x02" * 32,
+        netlink.WGPEER_A_FLAGS: struct.pack("=I", netlink.WGPEER_F_UPDATE_ONLY),
+        netlink.WGPEER_A_PERSISTENT_KEEPALIVE_INTERVAL: struct.pack("=H", 25),
+    }
+
+
+def test_set_endpoints_error(monkeypatch):
+    client, _ = _open(monkeypatch, lambda flags, seq, cmd, attrs: [_error(seq, -errno.EPERM)])
+    with pytest.raises(netlink.NetlinkError) as info:
+        client.set_endpoints("wg0", {KEY_A: ("192.0.2.1", 51820)})
+    assert info.value.errno == errno.EPERM
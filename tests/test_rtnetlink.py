@@ -0,0 +1,214 @@
+import asyncio
+import errno
+import socket
+import struct
+
+import pytest
+
+from wireguard_dynamic_remote.common import rtnetlink
+from wireguard_dynamic_remote.common.context import RunContext
+from wireguard_dynamic_remote.daemon import loop
+from wireguard_dynamic_remote.wireguard.netlink import attr
+
+NAMES = {1: "lo", 2: "eth0", 5: "wg0"}
+UP = rtnetlink.IFF_UP | rtnetlink.IFF_RUNNING
+
+
+def _frame(kind: int, body: bytes) -> bytes:
+    length = 16 + len(body)
+    return struct.pack("=IHHII", length, kind, 0, 0, 0) + body + b"\0" * (-length % 4)
+
+
+def _link(index: int, flags: int, kind: int = rtnetlink.RTM_NEWLINK) -> bytes:
+    name = attr(rtnetlink.IFLA_IFNAME, NAMES[index].encode() + b"\0")
+    return _frame(kind, struct.pack("=BxHiII", socket.AF_UNSPEC, 1, index, flags, 0) + name)
+
+
+def _address(index: int, scope: int = 0, flags: int = 0) -> bytes:
+    return _frame(rtnetlink.RTM_NEWADDR, struct.pack("=BBBBi", socket.AF_INET, 24, flags, scope, index))
+
+
+def _route(index: int, table: int = rtnetlink.RT_TABLE_MAIN, dst_len: int = 0) -> bytes:
+    # 大于 255 的表号只在 RTA_TABLE 中，头部是 RT_TABLE_COMPAT
+    body = struct.pack(
+        "=BBBBBBBBI", socket.AF_INET, dst_len, 0, 0, min(table, 252), 3, 0, rtnetlink.RTN_UNICAST, 0
+    )
+    body += attr(rtnetlink.RTA_TABLE, struct.pack("=I", table))
+    body += attr(rtnetlink.RTA_OIF, struct.pack("=i", index))
+    return _frame(rtnetlink.RTM_NEWROUTE, body)
+
+
+class FakeSocket:
+    """recv 依次返回数据或抛出异常，取完之后抛出 BlockingIOError"""
+
+    def __init__(self):
+        self.queue: list[bytes | OSError] = []
+
+    def setblocking(self, flag):
+        pass
+
+    def bind(self, address):
+        pass
+
+    def recv(self, size: int) -> bytes:
+        if not self.queue:
+            raise BlockingIOError
+        item = self.queue.pop(0)
+        if isinstance(item, OSError):
+            raise item
+        return item
+
+
+@pytest.fixture
+def watcher(monkeypatch):
+    monkeypatch.setattr(rtnetlink.socket, "socket", lambda *args: FakeSocket())
+    monkeypatch.setattr(rtnetlink.socket, "if_indextoname", lambda index: NAMES[index])
+    return rtnetlink.NetworkWatcher(ignore=lambda name: name == "wg0")
+
+
+def test_ignores_own_interfaces(watcher):
+    watcher._sock.queue = [
+        _link(5, UP) + _link(2, UP),
+        _address(5) + _address(2),
+        _route(5) + _route(2),
+    ]
+    assert watcher.read() == ["eth0 up", "address added to eth0", "default route via eth0 added"]
+
+
+def test_ignores_irrelevant_changes(watcher):
+    watcher._sock.queue = [
+        # 链路本地地址、还在 DAD 中的地址
+        _address(2, scope=rtnetlink.RT_SCOPE_LINK),
+        _address(2, flags=rtnetlink.IFA_F_TENTATIVE),
+        # 其他路由表、非默认路由
+        _route(2, table=51820),
+        _route(2, dst_len=24),
+    ]
+    assert watcher.read() == []
+
+
+def test_link_reports_only_state_changes(watcher):
+    watcher._sock.queue = [_link(2, UP), _link(2, UP), _link(2, rtnetlink.IFF_UP)]
+    assert watcher.read() == ["eth0 up", "eth0 down"]
+
+    watcher._sock.queue = [_link(2, 0, kind=rtnetlink.RTM_DELLINK)]
+    assert watcher.read() == ["eth0 removed"]
+
+
+def test_overrun_only_for_enobufs(watcher):
+    watcher._sock.queue = [OSError(errno.ENOBUFS, "No buffer space"), _link(2, UP)]
+    assert watcher.read() == ["netlink overrun", "eth0 up"]
+
+    watcher._sock.queue = [OSError(errno.EBADF, "Bad file descriptor")]
+    with pytest.raises(OSError) as info:
+        watcher.read()
+    assert info.value.errno == errno.EBADF
+
+
+class FakeWatcher:
+    """用 socketpair 让事件循环看到可读，read() 返回 events 中的事件"""
+
+    instances: list["FakeWatcher"] = []
+
+    def __init__(self, ignore):
+        self.ignore = ignore
+        self.events: list[str] = []
+        self.error: OSError | None = None
+        self._reader, self._writer = socket.socketpair()
+        self._reader.setblocking(False)
+        FakeWatcher.instances.append(self)
+
+    def fileno(self) -> int:
+        return self._reader.fileno()
+
+    def push(self, *events: str):
+        self.events.extend(events)
+        self._writer.send(b"x")
+
+    def read(self) -> list[str]:
+        self._reader.recv(4096)
+        if self.error:
+            raise self.error
+        events, self.events = self.events, []
+        return events
+
+    def close(self):
+        self._reader.close()
+        self._writer.close()
+
+
+class FakeTrigger:
+    def __init__(self):
+        self.requests: list[tuple[float, set[str]]] = []
+
+    def request(self, interfaces):
+        self.requests.append((asyncio.get_running_loop().time(), interfaces))
+
+
+@pytest.fixture
+def network(monkeypatch):
+    monkeypatch.setattr(rtnetlink, "NetworkWatcher", FakeWatcher)
+    monkeypatch.setattr(loop, "NET_SETTLE", 0.1)
+    monkeypatch.setattr(loop, "NET_SETTLE_MAX", 0.3)
+    FakeWatcher.instances.clear()
+    yield
+    for watcher in FakeWatcher.instances:
+        watcher.close()
+
+
+def test_network_change_settles(network):
+    async def run():
+        trigger = FakeTrigger()
+        watcher = loop._watch_network(RunContext(["wg0", "wg1"], 60), trigger)
+        assert watcher.ignore("wg0") and not watcher.ignore("eth0")
+
+        started = asyncio.get_running_loop().time()
+        watcher.push("eth0 down")
+        await asyncio.sleep(0.05)
+        watcher.push("eth0 up")
+        # 最后一个事件之后安静 NET_SETTLE 秒才检查，多个事件合并成一次
+        await asyncio.sleep(0.08)
+        assert trigger.requests == []
+        await asyncio.sleep(0.1)
+
+        [(at, interfaces)] = trigger.requests
+        assert interfaces == {"wg0", "wg1"}
+        assert at - started >= 0.15
+
+    asyncio.run(run())
+
+
+def test_network_change_settle_is_capped(network):
+    async def run():
+        trigger = FakeTrigger()
+        watcher = loop._watch_network(RunContext(["wg0"], 60), trigger)
+
+        # 事件一直不停时，最多推迟 NET_SETTLE_MAX 秒
+        started = asyncio.get_running_loop().time()
+        while asyncio.get_running_loop().time() - started < 0.6:
+            watcher.push("address added to eth0")
+            await asyncio.sleep(0.03)
+
+        assert trigger.requests
+        first_at = trigger.requests[0][0]
+        assert 0.25 <= first_at - started < 0.45
+
+    asyncio.run(run())
+
+
+def test_network_watch_stops_on_error(network):
+    async def run():
+        trigger = FakeTrigger()
+        watcher = loop._watch_network(RunContext(["wg0"], 60), trigger)
+
+        watcher.error = OSError(errno.EBADF, "Bad file descriptor")
+        watcher.push()
+        await asyncio.sleep(0.05)
+        # 读取出错后不再监视，之后的事件不会触发检查
+        watcher.error = None
+        watcher.push("eth0 up")
+        await asyncio.sleep(0.2)
+        assert trigger.requests == []
+        assert not asyncio.get_running_loop().remove_reader(watcher.fileno())
+
+    asyncio.run(run())
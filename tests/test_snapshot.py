@@ -0,0 +1,114 @@
+import subprocess
+
+import pytest
+
+from wireguard_dynamic_remote.wireguard import backend
+from wireguard_dynamic_remote.wireguard.snapshot import format_dump, parse_dump
+
+DUMP = "\n".join(
+    [
+        "wg0\tcHJpdmF0ZQ==\tcHVibGlj\t51820\toff",
+        "wg0\tpeerA=\t(none)\t192.0.2.1:51820\t10.0.0.2/32,fd00::2/128"
+        "\t1700000000\t1024\t2048\t25",
+        "wg0\tpeerB=\tcHNr\t(none)\t(none)\t0\t0\t0\toff",
+        "wg1\t(none)\tcHVibGlj\t0\t0x1234",
+        "wg1\tpeerC=\t(none)\t[2001:db8::1]:443\t0.0.0.0/0\t1700000100\t1\t2\toff",
+        "wg2\t(none)\tcHVibGlj\t0\toff",
+    ]
+)
+
+SHOWCONF = """[Interface]
+ListenPort = 51820
+
+[Peer]
+PublicKey = peerA=
+Endpoint = 192.0.2.1:51820
+AllowedIPs = 10.0.0.2/32
+"""
+
+
+def test_parse_multiple_interfaces():
+    devices = parse_dump(DUMP)
+    assert list(devices) == ["wg0", "wg1", "wg2"]
+
+    wg0 = devices["wg0"]
+    assert (wg0.PrivateKey, wg0.ListenPort, wg0.FwMark) == ("cHJpdmF0ZQ==", "51820", "")
+    assert [p.PublicKey for p in wg0.peers] == ["peerA=", "peerB="]
+    peer = wg0.peers[0]
+    assert peer.Endpoint == "192.0.2.1:51820"
+    assert peer.AllowedIPs == "10.0.0.2/32, fd00::2/128"
+    assert peer.latest_handshake() == 1700000000
+    assert (peer.TransferRx, peer.TransferTx, peer.PersistentKeepalive) == ("1024", "2048", "25")
+
+    wg1 = devices["wg1"]
+    assert (wg1.PrivateKey, wg1.ListenPort, wg1.FwMark) == ("", "", "0x1234")
+    assert wg1.peers[0].Endpoint == "[2001:db8::1]:443"
+
+    # 没有 peer 的接口也要出现，不能和接口不存在混淆
+    assert devices["wg2"].peers == []
+
+
+def test_parse_none_fields():
+    peer = parse_dump(DUMP)["wg0"].peers[1]
+    # 从未收到过数据的 peer 没有 endpoint
+    assert peer.Endpoint == ""
+    assert peer.AllowedIPs == ""
+    assert peer.PresharedKey == "cHNr"
+    assert peer.PersistentKeepalive == ""
+    assert peer.latest_handshake() == 0
+
+
+def test_format_dump_round_trip():
+    device = parse_dump(DUMP)["wg0"]
+    again = parse_dump(format_dump("wg0", device))["wg0"]
+    assert [(p.PublicKey, p.Endpoint, p.AllowedIPs) for p in again.peers] == [
+        (p.PublicKey, p.Endpoint, p.AllowedIPs) for p in device.peers
+    ]
+
+
+def _fake_wg(monkeypatch, showconf: dict[str, str], dump: str | None = None):
+    """dump 为 None 时 `wg show all dump` 失败；showconf 中没有的接口不存在，内容为空时读取出错"""
+    calls: list[list[str]] = []
+
+    def fail(commandline, reason: str):
+        stderr = f"Unable to access interface: {reason}\n"
+        return subprocess.CalledProcessError(1, commandline, "", stderr)
+
+    def execute_capture(commandline, error="raise", **kwargs):
+        calls.append(commandline)
+        if commandline[:2] == ["wg", "show"]:
+            if dump is None:
+                raise fail(commandline, "Operation not permitted")
+            return dump
+        interface = commandline[-1]
+        if interface not in showconf:
+            raise fail(commandline, "No such device")
+        if not showconf[interface]:
+            raise fail(commandline, "Operation not permitted")
+        return showconf[interface]
+
+    monkeypatch.setattr(backend, "execute_capture", execute_capture)
+    return calls
+
+
+def test_cli_snapshot_single_command(monkeypatch):
+    calls = _fake_wg(monkeypatch, {}, dump=DUMP)
+    snapshot = backend.CliBackend().snapshot(["wg0", "wg2", "wg9"])
+    assert calls == [["wg", "show", "all", "dump"]]
+    assert list(snapshot.devices) == ["wg0", "wg2"]
+
+
+def test_cli_snapshot_falls_back_when_dump_fails(monkeypatch):
+    calls = _fake_wg(monkeypatch, {"wg0": SHOWCONF})
+    snapshot = backend.CliBackend().snapshot(["wg0", "wg9"])
+
+    # 失败时逐个读取，而不是当作没有任何接口
+    assert calls[1:] == [["wg", "showconf", "wg0"], ["wg", "showconf", "wg9"]]
+    assert "wg0" in snapshot and "wg9" not in snapshot
+    assert snapshot.get("wg0").peers[0].Endpoint == "192.0.2.1:51820"
+
+
+def test_cli_snapshot_fallback_raises_real_errors(monkeypatch):
+    _fake_wg(monkeypatch, {"wg0": ""})
+    with pytest.raises(RuntimeError):
+        backend.CliBackend().snapshot(["wg0"])
@@ -1,8 +1,11 @@
 import argparse
 import sys
 
-from .common import logger
-from .common.context import RunContext
+from .common import logger, profiling, trace
+from .common.context import DEFAULT_JOBS, DEFAULT_PROBE_TIMEOUT, RunContext
+from .common.prober import PROBE_MODES
+from .common.timespan import parse_timespan
+from .wireguard import BACKENDS, select_backend
 
 
 def main():
@@ -21,22 +24,106 @@ def main():
     )
     parser.add_argument(
         "--resolver",
-        type=str,
-        default=None,
-        help="Custom DNS resolver to use for domain resolution",
+        action="append",
+        help="Custom DNS resolver to use for domain resolution, can be given multiple times (or comma separated) to race queries between them",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=DEFAULT_JOBS,
+        help="Number of interfaces (and peers) to check concurrently",
+    )
+    parser.add_argument(
+        "--wg-backend",
+        choices=BACKENDS,
+        default="auto",
+        help="How to talk to WireGuard: kernel netlink or the wg command (default: netlink if available)",
+    )
+    parser.add_argument(
+        "--probe",
+        choices=PROBE_MODES,
+        default="icmp",
+        help="How to pick among multiple addresses: in-process ICMP echo, UDP port-unreachable probe, or the ping command",
+    )
+    parser.add_argument(
+        "--probe-timeout",
+        type=float,
+        default=DEFAULT_PROBE_TIMEOUT,
+        help="Seconds to wait for probe replies",
+    )
+    parser.add_argument(
+        "--metrics-listen",
+        help="Serve Prometheus metrics from the daemon on [host:]port (localhost by default) or unix:/path",
+    )
+    parser.add_argument(
+        "--metrics-textfile",
+        help="Write Prometheus metrics to this file after every check (node_exporter textfile collector)",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="FILE",
+        help="Record timing of every check stage and subprocess to a Chrome trace-event JSON file",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="FILE",
+        help="Run under cProfile and write the statistics to a .pstats file",
+    )
+    parser.add_argument(
+        "--simulate",
+        metavar="SCENARIO",
+        help="Check virtual interfaces against in-memory WireGuard, DNS, probes and services driven by a JSON scenario file, or 'builtin' for the built-in one",
+    )
+    parser.add_argument(
+        "--record",
+        metavar="FILE",
+        help="Append every check cycle's WireGuard state, resolver answers, probe results and changes to FILE (.gz to compress)",
+    )
+    parser.add_argument(
+        "--from",
+        dest="replay_from",
+        metavar="FILE",
+        help="With replay: the recording (written by --record) to read",
+    )
+    parser.add_argument(
+        "--realtime",
+        action="store_true",
+        help="With replay: keep the recorded timing instead of running as fast as possible",
+    )
+    parser.add_argument(
+        "--timer",
+        action="store_true",
+        help="Install as a oneshot service fired by a timer instead of a resident daemon",
     )
     parser.add_argument(
         "action",
-        choices=["start", "install", "uninstall"],
+        choices=["start", "daemon", "install", "uninstall", "history", "replay"],
         help="Action to perform",
     )
     args = parser.parse_args()
 
+    if args.trace:
+        trace.enable()
+    if args.profile:
+        profiling.start()
+    try:
+        _run(args)
+    finally:
+        if args.profile:
+            profiling.write(args.profile)
+        if args.trace:
+            trace.write(args.trace)
+
+
+def _run(args: argparse.Namespace):
     # detect interval is number
     input_interval: str = args.interval
     interval = 0
     if input_interval.isdigit():
         interval = int(input_interval)
+    elif _simple_timespan(input_interval) is not None:
+        interval = _simple_timespan(input_interval)
     elif sys.platform == "linux":
         from .systemd.tools import parse_timespan
 
@@ -46,20 +133,68 @@ def main():
             f"Non-numeric interval '{input_interval}' is only supported on Linux platform."
         )
 
-    config = RunContext(args.interface, interval, args.resolver)
+    resolvers = [
+        resolver.strip()
+        for value in args.resolver or []
+        for resolver in value.split(",")
+        if resolver.strip()
+    ]
+
+    config = RunContext(
+        args.interface,
+        interval,
+        resolvers,
+        args.jobs,
+        args.wg_backend,
+        args.probe,
+        args.probe_timeout,
+        args.metrics_listen,
+        args.metrics_textfile,
+    )
+
+    if args.simulate is not None:
+        if args.action not in ("start", "daemon"):
+            logger.fatal("--simulate only works with start and daemon")
+        from .simulate import install
+
+        install(args.simulate, config)
+    if args.record and args.action not in ("start", "daemon"):
+        logger.fatal("--record only works with start and daemon")
+    if (args.replay_from or args.realtime) and args.action != "replay":
+        logger.fatal("--from and --realtime only work with replay")
 
     if args.action == "start":
         from .daemon import daemon_main
 
         config.validate(check_interfaces=True, expand_interfaces=True)
+        _prepare(args, config)
         daemon_main(config)
+    elif args.action == "daemon":
+        from .daemon import daemon_loop
+
+        config.validate(check_interfaces=True, expand_interfaces=True, resident=True)
+        _prepare(args, config)
+        daemon_loop(config)
+    elif args.action == "replay":
+        from .replay import replay
+
+        if not args.replay_from:
+            logger.fatal("replay needs the recording given by --from FILE")
+        if not replay(args.replay_from, config, realtime=args.realtime):
+            sys.exit(1)
+    elif args.action == "history":
+        from .daemon import print_history
+
+        print_history(args.interface)
     elif args.action == "install":
-        config.validate(check_interfaces=True, expand_interfaces=False)
+        config.validate(
+            check_interfaces=True, expand_interfaces=False, resident=not args.timer
+        )
 
         if sys.platform == "linux":
             from .systemd.control import install_service
 
-            install_service(config)
+            install_service(config, timer=args.timer)
 
         elif sys.platform == "win32":
             logger.fatal("Win32 service is not supported at this time.")
@@ -81,6 +216,22 @@ def main():
         raise ValueError("Invalid action")
 
 
+def _prepare(args: argparse.Namespace, config: RunContext):
+    if args.simulate is None:
+        select_backend(config.wg_backend)
+    if args.record:
+        from .replay import install_recorders
+
+        install_recorders(args.record)
+
+
+def _simple_timespan(timespan: str) -> int | None:
+    try:
+        return int(parse_timespan(timespan))
+    except ValueError:
+        return None
+
+
 if __name__ == "__main__":
 
     if sys.platform == "linux":
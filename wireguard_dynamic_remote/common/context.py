@@ -2,25 +2,73 @@ from pathlib import Path
 
 from ..wireguard import get_static_config_file, list_config_files
 from . import logger
+from .metrics import parse_listen
+from .prober import DEFAULT_TIMEOUT as DEFAULT_PROBE_TIMEOUT
+
+DEFAULT_JOBS = 8
 
 
 class RunContext:
     def __init__(
-        self, interfaces: list[str], interval: int, resolver: None | str = None
+        self,
+        interfaces: list[str],
+        interval: int,
+        resolvers: list[str] | None = None,
+        jobs: int = DEFAULT_JOBS,
+        wg_backend: str = "auto",
+        probe: str = "icmp",
+        probe_timeout: float = DEFAULT_PROBE_TIMEOUT,
+        metrics_listen: str | None = None,
+        metrics_textfile: str | None = None,
     ):
         self.interfaces = interfaces or []
+        # 没有指定接口时使用配置目录中的全部接口，常驻模式下会随目录变化
+        self.expanded = False
         self.interval = interval
-        self.resolver = resolver
+        self.resolvers = resolvers or []
+        self.jobs = jobs
+        self.wg_backend = wg_backend
+        self.probe = probe
+        self.probe_timeout = probe_timeout
+        self.metrics_listen = metrics_listen
+        self.metrics_textfile = metrics_textfile
 
-    def validate(self, check_interfaces: bool = False, expand_interfaces: bool = False):
-        if self.interval < 30:
-            logger.fatal(f"Interval must be at least 30 seconds, got {self.interval}")
+    def validate(
+        self,
+        check_interfaces: bool = False,
+        expand_interfaces: bool = False,
+        resident: bool = False,
+    ):
+        # 常驻模式没有启动开销，允许更短的间隔
+        min_interval = 5 if resident else 30
+        if self.interval < min_interval:
+            logger.fatal(
+                f"Interval must be at least {min_interval} seconds, got {self.interval}"
+            )
         elif self.interval > 30 * 60:
             logger.fatal(f"Interval must be at most 30 minutes, got {self.interval}")
 
+        if self.probe_timeout <= 0:
+            logger.fatal(f"Probe timeout must be positive, got {self.probe_timeout}")
+
+        if self.jobs < 1:
+            logger.fatal(f"Jobs must be at least 1, got {self.jobs}")
+
+        if self.metrics_listen:
+            if not resident:
+                logger.fatal("--metrics-listen needs the resident daemon, use --metrics-textfile")
+            try:
+                parse_listen(self.metrics_listen)
+            except ValueError as e:
+                logger.fatal(f"Invalid --metrics-listen: {e}")
+
+        if self.metrics_textfile and not Path(self.metrics_textfile).is_absolute():
+            logger.fatal(f"--metrics-textfile must be an absolute path, got {self.metrics_textfile}")
+
         if not self.interfaces or len(self.interfaces) == 0:
             if expand_interfaces:
                 self.interfaces = list_config_files()
+                self.expanded = True
         else:
             if check_interfaces:
                 self.check_interfaces()
@@ -36,6 +84,26 @@ class RunContext:
         for interface in self.interfaces:
             args.extend(["--interface", interface])
 
-        if self.resolver:
-            args.extend(["--resolver", self.resolver])
+        args.extend(["--interval", str(self.interval)])
+
+        for resolver in self.resolvers:
+            args.extend(["--resolver", resolver])
+
+        if self.jobs != DEFAULT_JOBS:
+            args.extend(["--jobs", str(self.jobs)])
+
+        if self.wg_backend != "auto":
+            args.extend(["--wg-backend", self.wg_backend])
+
+        if self.probe != "icmp":
+            args.extend(["--probe", self.probe])
+
+        if self.probe_timeout != DEFAULT_PROBE_TIMEOUT:
+            args.extend(["--probe-timeout", str(self.probe_timeout)])
+
+        if self.metrics_listen:
+            args.extend(["--metrics-listen", self.metrics_listen])
+
+        if self.metrics_textfile:
+            args.extend(["--metrics-textfile", self.metrics_textfile])
         return args
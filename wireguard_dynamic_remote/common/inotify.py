@@ -0,0 +1,112 @@
+"""
+最小的 inotify 封装（ctypes 调用 libc），只支持监视单个目录
+"""
+
+import ctypes
+import ctypes.util
+import os
+import struct
+from pathlib import Path
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_CLOSE_WRITE
+    | IN_MODIFY
+    | IN_ATTRIB
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+)
+
+_EVENT = struct.Struct("iIII")
+
+_libc = None
+
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    return _libc
+
+
+class DirectoryWatcher:
+    """
+    监视目录，read() 返回发生变化的文件名；None 表示无法确定（需要全部重新检查）
+
+    目录被删除或者改名（例如被整个替换）后重新监视同一个路径；
+    路径不存在时 watching 变为 False，调用者不能再依赖通知
+    """
+
+    def __init__(self, directory: Path):
+        libc = _get_libc()
+        self.directory = directory
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, f"inotify_init1: {os.strerror(code)}")
+
+        self.wd = libc.inotify_add_watch(self.fd, str(directory).encode(), WATCH_MASK)
+        if self.wd < 0:
+            code = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(code, f"inotify_add_watch {directory}: {os.strerror(code)}")
+
+    @property
+    def watching(self) -> bool:
+        return self.wd >= 0
+
+    def _rewatch(self):
+        libc = _get_libc()
+        if self.wd >= 0:
+            # 改名后旧的监视仍然跟着原来的目录；已经删除的目录会失败，忽略
+            libc.inotify_rm_watch(self.fd, self.wd)
+        self.wd = libc.inotify_add_watch(self.fd, str(self.directory).encode(), WATCH_MASK)
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def read(self) -> set[str] | None:
+        changed: set[str] = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+
+            offset = 0
+            while offset + _EVENT.size <= len(data):
+                wd, mask, _, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = data[offset : offset + length].rstrip(b"\0").decode(errors="replace")
+                offset += length
+
+                if mask & IN_Q_OVERFLOW:
+                    return None
+                if wd != self.wd:  # 已经被替换的旧监视
+                    continue
+                if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                    self._rewatch()
+                    return None
+                if name:
+                    changed.add(name)
+
+    def close(self):
+        os.close(self.fd)
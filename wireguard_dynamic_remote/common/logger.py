@@ -1,27 +1,87 @@
 import subprocess
 import sys
+import threading
 
-_indent = ""
+# 缩进和输出缓冲都是线程独立的，并发检查时每个任务的日志先收集起来，最后整段输出
+_local = threading.local()
+_print_lock = threading.Lock()
+
+
+def _get_indent() -> str:
+    return getattr(_local, "indent", "")
+
+
+def _emit(line: str):
+    buffer: list[str] | None = getattr(_local, "buffer", None)
+    if buffer is not None:
+        buffer.append(line)
+        return
+
+    with _print_lock:
+        print(line, file=sys.stderr, flush=True)
 
 
 def output(message: str):
-    print(f"{_indent}{message}", file=sys.stderr, flush=True)
+    _emit(f"{_get_indent()}{message}")
 
 
 def error(message: str):
-    print(f"\x1b[38;5;9m{_indent}{message}\x1b[0m", file=sys.stderr, flush=True)
-    
+    _emit(f"\x1b[38;5;9m{_get_indent()}{message}\x1b[0m")
+
+
 def warning(message: str):
-    print(f"\x1b[38;5;11m{_indent}{message}\x1b[0m", file=sys.stderr, flush=True)
+    _emit(f"\x1b[38;5;11m{_get_indent()}{message}\x1b[0m")
 
 
 def indent(chars="    "):
-    global _indent
-    _indent += chars
+    _local.indent = _get_indent() + chars
 
     return _Indenter()
 
 
+class capture:
+    """
+    在当前线程收集日志而不是直接输出
+
+    with logger.capture(base_indent) as lines:
+        ...
+    logger.replay(lines)
+    """
+
+    def __init__(self, base_indent: str = ""):
+        self.lines: list[str] = []
+        self.base_indent = base_indent
+
+    def __enter__(self) -> list[str]:
+        self._saved = (getattr(_local, "buffer", None), _get_indent())
+        _local.buffer = self.lines
+        _local.indent = self.base_indent
+        return self.lines
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.buffer, _local.indent = self._saved
+        if exc_type is not None:
+            # 出错时（包括 fatal 退出）不能丢掉已经收集的日志
+            replay(self.lines)
+
+
+def current_indent() -> str:
+    return _get_indent()
+
+
+def replay(lines: list[str]):
+    """输出 capture() 收集的日志（如果当前也在 capture 中，就追加到外层）"""
+    buffer: list[str] | None = getattr(_local, "buffer", None)
+    if buffer is not None:
+        buffer.extend(lines)
+        return
+
+    with _print_lock:
+        for line in lines:
+            print(line, file=sys.stderr)
+        sys.stderr.flush()
+
+
 class _Indenter:
     def __enter__(self):
         pass
@@ -31,8 +91,7 @@ class _Indenter:
 
 
 def dedent():
-    global _indent
-    _indent = _indent[:-4]
+    _local.indent = _get_indent()[:-4]
 
 
 def fatal(message: str):
@@ -53,9 +112,9 @@ def check(process: subprocess.CompletedProcess, ignore=False):
     output(f" - Return code: {process.returncode}")
     output(f" - Output:")
     if process.stdout:
-        print(process.stdout.strip(), file=sys.stderr)
+        _emit(process.stdout.strip())
     if process.stderr:
-        print(process.stderr.strip(), file=sys.stderr)
+        _emit(process.stderr.strip())
     if not ignore:
         sys.exit(process.returncode)
 
@@ -0,0 +1,280 @@
+"""
+Prometheus 文本格式的指标
+
+常驻模式通过 --metrics-listen 提供 HTTP 接口（TCP 或 unix socket），
+oneshot 模式通过 --metrics-textfile 写入 node_exporter 的 textfile 目录；
+写入 textfile 时计数器保存在状态目录中，每次运行在上一次的基础上累加，rate() 才有意义
+"""
+
+import asyncio
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from . import logger
+from .state import load_json, save_json
+
+PREFIX = "wireguard_dynamic_remote_"
+COUNTERS_FILE = "metrics-counters.json"
+
+# 秒
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_lock = threading.Lock()
+
+type Labels = tuple[tuple[str, str], ...]
+
+
+def _labels(labels: dict[str, str]) -> Labels:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{key}="{_escape(value)}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str):
+        self.name = PREFIX + name
+        self.help = help
+        _registry.append(self)
+
+    def header(self, name: str | None = None) -> list[str]:
+        name = name or self.name
+        return [f"# HELP {name} {self.help}", f"# TYPE {name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self._values: dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = _labels(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        # 文本格式 0.0.4 中 HELP / TYPE 使用和样本相同的 _total 名称，否则 expfmt 会当作另一个没有类型的指标
+        name = self.name + "_total"
+        return self.header(name) + [
+            f"{name}{_format_labels(key)} {_number(value)}" for key, value in self._values.items()
+        ]
+
+    def dump(self) -> list:
+        return [[list(map(list, key)), value] for key, value in self._values.items()]
+
+    def restore(self, items: list):
+        for key, value in items:
+            if not isinstance(value, (int, float)):
+                raise TypeError(f"invalid counter value {value!r}")
+            key = tuple((str(k), str(v)) for k, v in key)
+            self._values[key] = self._values.get(key, 0) + value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self._values: dict[Labels, float] = {}
+
+    def set(self, value: float, **labels: str):
+        with _lock:
+            self._values[_labels(labels)] = value
+
+    def clear(self, **labels: str):
+        """删除包含这些标签值的所有序列"""
+        selector = set(labels.items())
+        with _lock:
+            for key in [key for key in self._values if selector <= set(key)]:
+                del self._values[key]
+
+    def render(self) -> list[str]:
+        return self.header() + [
+            f"{self.name}{_format_labels(key)} {_number(value)}"
+            for key, value in self._values.items()
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...] = BUCKETS):
+        super().__init__(name, help)
+        self.buckets = buckets
+        # {标签: [每个桶的计数..., 总和]}，桶计数不累加，输出时再累加
+        self._values: dict[Labels, list[float]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = _labels(labels)
+        with _lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            index = len(self.buckets)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    index = i
+                    break
+            counts[index] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        for key, counts in self._values.items():
+            total = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                total += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(key, le)} {total}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_number(counts[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {total}")
+        return lines
+
+
+_registry: list[_Metric] = []
+
+stage_seconds = Histogram(
+    "stage_seconds",
+    "Time spent in each stage of a check cycle (config, runtime, resolve, probe, apply)",
+)
+cycle_seconds = Histogram("cycle_seconds", "Duration of a whole check cycle")
+interval_seconds = Gauge("interval_seconds", "Configured --interval")
+last_cycle_seconds = Gauge("last_cycle_seconds", "Duration of the latest check cycle")
+last_cycle_success = Gauge("last_cycle_success", "Whether the latest check cycle succeeded")
+last_cycle_timestamp = Gauge(
+    "last_cycle_timestamp_seconds", "Unix time when the latest check cycle finished"
+)
+endpoint_changes = Counter("endpoint_changes", "Endpoints changed")
+resolve_failures = Counter("resolve_failures", "Peers whose hostname failed to resolve")
+probe_failures = Counter("probe_failures", "Probes where no address responded")
+apply_failures = Counter("apply_failures", "Failed attempts to change endpoints of an interface")
+handshake_age = Gauge(
+    "handshake_age_seconds", "Seconds since the latest handshake of each peer"
+)
+
+
+def render() -> str:
+    with _lock:
+        lines: list[str] = []
+        for metric in _registry:
+            lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+_restored = False
+
+
+def _persist_counters():
+    """第一次调用时加上之前运行保存的计数，然后保存当前的计数"""
+    global _restored
+    counters = [metric for metric in _registry if isinstance(metric, Counter)]
+    with _lock:
+        if not _restored:
+            _restored = True
+            data = load_json(COUNTERS_FILE)
+            if isinstance(data, dict):
+                for counter in counters:
+                    try:
+                        counter.restore(data.get(counter.name, []))
+                    except (TypeError, ValueError):
+                        continue
+        data = {counter.name: counter.dump() for counter in counters}
+    save_json(COUNTERS_FILE, data)
+
+
+def write_textfile(path: str):
+    """原子地写入 textfile，node_exporter 不会读到一半的文件"""
+    _persist_counters()
+    file = Path(path)
+    temp = file.with_name(f".{file.name}.{os.getpid()}.tmp")
+    try:
+        temp.write_text(render())
+        os.replace(temp, file)
+    except OSError as e:
+        logger.warning(f"Cannot write metrics to {path}: {e}")
+
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 5)
+        method, _, rest = request.decode("latin-1").partition(" ")
+        path = rest.partition(" ")[0]
+        if method != "GET":
+            status, body = "405 Method Not Allowed", b""
+        elif path.partition("?")[0] not in ("/metrics", "/"):
+            status, body = "404 Not Found", b""
+        else:
+            status, body = "200 OK", render().encode()
+        writer.write(
+            (
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n"
+                "\r\n"
+            ).encode()
+            + body
+        )
+        await writer.drain()
+    except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+        pass
+    finally:
+        writer.close()
+
+
+def parse_listen(address: str) -> tuple[str, int | None]:
+    """
+    解析 --metrics-listen：返回 (unix socket 路径, None) 或者 (host, port)
+
+    address 为 "unix:/path"、"host:port"、":port" 或者 "port"，没有 host 时只监听 127.0.0.1
+    """
+    if address.startswith("unix:"):
+        path = address[len("unix:") :]
+        if not path.startswith("/"):
+            raise ValueError(f"unix socket path must be absolute: '{path}'")
+        return path, None
+
+    host, _, port = address.rpartition(":")
+    if not port.isdigit() or not 0 < int(port) < 65536:
+        raise ValueError(f"invalid port in '{address}'")
+    return host.strip("[]") or "127.0.0.1", int(port)
+
+
+async def serve(address: str) -> asyncio.AbstractServer:
+    host, port = parse_listen(address)
+    if port is None:
+        try:
+            os.unlink(host)
+        except FileNotFoundError:
+            pass
+        return await asyncio.start_unix_server(_handle, host)
+    return await asyncio.start_server(_handle, host, port)
@@ -2,6 +2,55 @@ import platform
 import subprocess
 import time
 
+from . import aio, logger, trace
+from .prober import DEFAULT_TIMEOUT, ProbeUnavailable, probe_all
+
+
+class Prober:
+    """探测地址是否可达的方式"""
+
+    def probe(
+        self, addresses: list[str], mode: str, timeout: float
+    ) -> list[tuple[str, float]]:
+        raise NotImplementedError()
+
+
+class SystemProber(Prober):
+    def probe(self, addresses: list[str], mode: str, timeout: float):
+        if mode != "ping":
+            try:
+                return aio.run(probe_all(addresses, mode, timeout))
+            except ProbeUnavailable as e:
+                logger.warning(f"{e}, falling back to ping command")
+
+        with trace.span("ping_each_ip", "subprocess", addresses=addresses):
+            found = ping_each_ip(addresses)
+        return [(found, 0.0)] if found else []
+
+
+_prober: Prober = SystemProber()
+
+
+def use_prober(prober: Prober):
+    """替换探测的实现（--simulate / --record / replay）"""
+    global _prober
+    _prober = prober
+
+
+def get_prober() -> Prober:
+    return _prober
+
+
+def probe_addresses(
+    addresses: list[str], mode: str = "icmp", timeout: float = DEFAULT_TIMEOUT
+) -> list[tuple[str, float]]:
+    """
+    探测所有地址，返回按 RTT 排序的 (地址, RTT 秒) 列表
+
+    mode 为 "ping" 或当前环境不能使用 ICMP socket 时使用 ping 命令，此时最多只有一个结果且没有 RTT
+    """
+    return _prober.probe(addresses, mode, timeout)
+
 
 def ping_each_ip(addresses: list[str]) -> str | None:
     """Ping each IP address in the list and return the first one that responds in 5 seconds."""
@@ -0,0 +1,180 @@
+"""
+进程内的可达性探测，替代每个地址一个 ping 进程的方式
+
+- icmp: ICMP echo，优先使用非特权的 ICMP datagram socket (net.ipv4.ping_group_range)，不允许时使用 raw socket
+- udp: 向一个关闭的 UDP 端口发包，收到 ICMP 端口不可达（或任何回复）就认为主机可达，适合屏蔽了 ping 的主机
+
+所有地址同时发出，结果按到达顺序（也就是 RTT 顺序）返回
+"""
+
+import asyncio
+import ipaddress
+import os
+import socket
+import struct
+import time
+from typing import AsyncIterator
+
+PROBE_MODES = ["icmp", "udp", "ping"]
+DEFAULT_TIMEOUT = 5.0
+DEFAULT_UDP_PORT = 33434
+# 第一个回复之后再等待其他回复的时间
+GRACE = 0.2
+
+_ICMP_ECHO_REQUEST = 8
+_ICMP_ECHO_REPLY = 0
+_ICMPV6_ECHO_REQUEST = 128
+_ICMPV6_ECHO_REPLY = 129
+
+
+class ProbeUnavailable(Exception):
+    """当前环境不能创建探测用的 socket"""
+
+
+def _checksum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b"\0"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def _icmp_socket(version: int) -> tuple[socket.socket, bool]:
+    """返回 (socket, 是否 raw)"""
+    if version == 4:
+        family, proto = socket.AF_INET, socket.IPPROTO_ICMP
+    else:
+        family, proto = socket.AF_INET6, socket.IPPROTO_ICMPV6
+
+    for kind in (socket.SOCK_DGRAM, socket.SOCK_RAW):
+        try:
+            sock = socket.socket(family, kind, proto)
+        except PermissionError:
+            continue
+        sock.setblocking(False)
+        return sock, kind == socket.SOCK_RAW
+
+    raise ProbeUnavailable("Not allowed to create ICMP sockets")
+
+
+async def _probe_icmp(address: str, identifier: int) -> None:
+    ip = ipaddress.ip_address(address)
+    sock, raw = _icmp_socket(ip.version)
+    loop = asyncio.get_running_loop()
+    try:
+        request = _ICMP_ECHO_REQUEST if ip.version == 4 else _ICMPV6_ECHO_REQUEST
+        reply = _ICMP_ECHO_REPLY if ip.version == 4 else _ICMPV6_ECHO_REPLY
+        sequence = 1
+        payload = b"wireguard-dynamic-remote"
+        header = struct.pack("!BBHHH", request, 0, 0, identifier, sequence)
+        packet = struct.pack("!BBHHH", request, 0, _checksum(header + payload), identifier, sequence) + payload
+
+        await loop.sock_sendto(sock, packet, (address, 0))
+        while True:
+            data, source = await loop.sock_recvfrom(sock, 2048)
+            if ipaddress.ip_address(source[0].split("%")[0]) != ip:
+                continue
+            if raw and ip.version == 4:
+                data = data[(data[0] & 0x0F) * 4 :]  # 去掉 IP 头
+            if len(data) < 8:
+                continue
+            kind, _, _, reply_id, reply_sequence = struct.unpack("!BBHHH", data[:8])
+            # datagram socket 的 identifier 由内核改写，只能校验 raw socket 的
+            if kind == reply and reply_sequence == sequence and (not raw or reply_id == identifier):
+                return
+    finally:
+        sock.close()
+
+
+async def _probe_udp(address: str, port: int) -> None:
+    ip = ipaddress.ip_address(address)
+    family = socket.AF_INET if ip.version == 4 else socket.AF_INET6
+    sock = socket.socket(family, socket.SOCK_DGRAM)
+    sock.setblocking(False)
+    loop = asyncio.get_running_loop()
+    try:
+        sock.connect((address, port))
+        await loop.sock_sendall(sock, b"\0")
+        try:
+            await loop.sock_recv(sock, 512)
+        except ConnectionRefusedError:
+            pass  # ICMP 端口不可达，说明主机在线
+    finally:
+        sock.close()
+
+
+async def probe(
+    addresses: list[str],
+    mode: str = "icmp",
+    timeout: float = DEFAULT_TIMEOUT,
+    port: int = DEFAULT_UDP_PORT,
+) -> AsyncIterator[tuple[str, float]]:
+    """同时探测所有地址，按到达顺序产生 (地址, RTT 秒)；超时没有回复的地址不会出现"""
+    identifier = os.getpid() & 0xFFFF
+    started = time.monotonic()
+
+    async def one(address: str):
+        if mode == "udp":
+            await _probe_udp(address, port)
+        else:
+            await _probe_icmp(address, identifier)
+        return address, time.monotonic() - started
+
+    tasks = [asyncio.ensure_future(one(address)) for address in addresses]
+    unavailable: ProbeUnavailable | None = None
+    succeeded = 0
+    try:
+        for next_done in asyncio.as_completed(tasks, timeout=timeout):
+            try:
+                address, rtt = await next_done
+            except asyncio.TimeoutError:
+                break
+            except ProbeUnavailable as e:
+                unavailable = e
+                continue
+            except OSError:
+                continue  # 网络不可达等
+            succeeded += 1
+            yield address, rtt
+    finally:
+        for task in tasks:
+            if task.done() and not task.cancelled():
+                task.exception()  # 标记为已处理，避免 "exception was never retrieved"
+            task.cancel()
+
+    if unavailable and succeeded == 0:
+        raise unavailable
+
+
+async def probe_all(
+    addresses: list[str],
+    mode: str = "icmp",
+    timeout: float = DEFAULT_TIMEOUT,
+    grace: float = GRACE,
+    port: int = DEFAULT_UDP_PORT,
+) -> list[tuple[str, float]]:
+    """
+    返回按 RTT 排序的可达地址
+
+    第一个回复到达后再最多等待 grace 秒收集其他回复，不必等到整个超时
+    """
+    results: list[tuple[str, float]] = []
+    first_at: float | None = None
+    iterator = probe(addresses, mode, timeout, port).__aiter__()
+    try:
+        while len(results) < len(addresses):
+            wait = None
+            if first_at is not None:
+                wait = max(first_at + grace - time.monotonic(), 0)
+            try:
+                result = await asyncio.wait_for(iterator.__anext__(), wait)
+            except (StopAsyncIteration, asyncio.TimeoutError):
+                break
+            results.append(result)
+            if first_at is None:
+                first_at = time.monotonic()
+    finally:
+        await iterator.aclose()
+
+    return sorted(results, key=lambda r: r[1])
@@ -0,0 +1,32 @@
+"""
+--profile：用 cProfile 记录整个运行，退出时写入 .pstats 文件
+
+cProfile 基于 sys.monitoring，在主线程启用的一个 Profile 就记录所有线程（接口 / peer 线程池、事件循环），
+而且同时只能启用一个；用 python -m pstats 或 snakeviz 查看
+"""
+
+import cProfile
+import pstats
+
+from . import logger
+
+_profile: cProfile.Profile | None = None
+
+
+def start():
+    global _profile
+    _profile = cProfile.Profile()
+    _profile.enable()
+
+
+def write(path: str):
+    if _profile is None:
+        return
+    _profile.disable()
+
+    try:
+        pstats.Stats(_profile).dump_stats(path)
+    except OSError as e:
+        logger.error(f"Cannot write profile to {path}: {e}")
+        return
+    logger.output(f"Profile written to {path}")
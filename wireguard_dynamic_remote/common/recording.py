@@ -0,0 +1,162 @@
+"""
+--record：把每个检查周期读到的 WireGuard 状态、解析结果、探测结果和做出的修改追加到文件，供 replay 使用
+
+每个周期是连续的若干行 json：第一行是 {"t": "cycle", ...}，之后是周期内按发生顺序记录的事件，
+"dt" 是距离周期开始的秒数；周期结束后一次写入。文件名以 .gz 结尾时每个周期写成一个 gzip member
+
+配置文件只在内容变化时记录一次；私钥和预共享密钥不会被记录
+"""
+
+import gzip
+import json
+import os
+import re
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from . import logger
+
+VERSION = 1
+
+_SECRET = re.compile(r"^(\s*(?:PrivateKey|PresharedKey)\s*=).*$", re.IGNORECASE | re.MULTILINE)
+
+
+class RecordingError(Exception):
+    pass
+
+
+_path: str | None = None
+_events: list[dict] | None = None
+_started = 0.0
+_configs: dict[str, str] = {}
+_lock = threading.Lock()
+_warned = False
+# 当前线程正在检查的 peer，peer 内的事件带上 "p"，replay 时按 peer 对应，不受线程调度顺序影响
+_local = threading.local()
+
+
+def enable(path: str):
+    global _path
+    _path = path
+
+
+def enabled() -> bool:
+    return _path is not None
+
+
+def redact(content: str) -> str:
+    return _SECRET.sub(r"\1 (none)", content)
+
+
+@contextmanager
+def peer(interface: str, public_key: str) -> Iterator[None]:
+    _local.peer = f"{interface}/{public_key}"
+    try:
+        yield
+    finally:
+        _local.peer = None
+
+
+def current_peer() -> str | None:
+    return getattr(_local, "peer", None)
+
+
+def record(kind: str, **fields):
+    """在当前周期中记录一个事件，没有启用或不在周期中时什么也不做"""
+    if _events is None:
+        return
+    event = {"t": kind, "dt": round(time.monotonic() - _started, 6), **fields}
+    if current_peer():
+        event["p"] = current_peer()
+    with _lock:
+        if _events is not None:
+            _events.append(event)
+
+
+@contextmanager
+def cycle(interfaces: list[str], only: dict[str, set[str] | None] | None) -> Iterator[None]:
+    global _events, _started
+    if _path is None:
+        yield
+        return
+
+    from ..wireguard import get_static_config_file
+
+    events: list[dict] = [
+        {
+            "t": "cycle",
+            "v": VERSION,
+            "at": time.time(),
+            "i": interfaces,
+            "only": None
+            if only is None
+            else {i: None if hosts is None else sorted(hosts) for i, hosts in only.items()},
+        }
+    ]
+    for interface in interfaces:
+        try:
+            content = redact(get_static_config_file(interface).read_text())
+        except OSError:
+            continue
+        if _configs.get(interface) != content:
+            _configs[interface] = content
+            events.append({"t": "config", "i": interface, "c": content})
+
+    with _lock:
+        _started = time.monotonic()
+        _events = events
+    try:
+        yield
+    finally:
+        with _lock:
+            _events = None
+        _write(events)
+
+
+def _write(events: list[dict]):
+    global _warned
+    assert _path is not None
+
+    data = "".join(json.dumps(e, separators=(",", ":")) + "\n" for e in events).encode()
+    if _path.endswith(".gz"):
+        data = gzip.compress(data)
+    try:
+        # 一次 write 追加整个周期，进程被中断时不会留下半个周期
+        fd = os.open(_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+    except OSError as e:
+        if not _warned:
+            logger.warning(f"Cannot write recording {_path}: {e}")
+            _warned = True
+
+
+def read(path: str) -> Iterator[list[dict]]:
+    """按顺序读取每个周期的事件列表（第一个是 cycle），损坏的行被跳过"""
+    opener = gzip.open if path.endswith(".gz") else open
+    current: list[dict] | None = None
+    with opener(path, "rb") as f:
+        try:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                if not isinstance(event, dict):
+                    continue
+                if event.get("t") == "cycle":
+                    if event.get("v") != VERSION:
+                        raise RecordingError(f"Unsupported recording version {event.get('v')}")
+                    if current:
+                        yield current
+                    current = [event]
+                elif current is not None:
+                    current.append(event)
+        except EOFError:
+            current = None  # 最后一个 gzip member 不完整，丢掉这个周期
+    if current:
+        yield current
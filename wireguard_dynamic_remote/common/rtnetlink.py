@@ -0,0 +1,145 @@
+"""
+订阅 rtnetlink 的网卡、地址和默认路由变化通知（只支持 Linux）
+
+只关心会影响隧道外层连接的变化：网卡启用/停用、地址增删、main 表默认路由变化；
+WireGuard 接口自己的变化（例如 wg-quick 添加的路由）由调用者忽略
+"""
+
+import errno
+import socket
+import struct
+from typing import Callable
+
+from ..wireguard.netlink import parse_attrs
+
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+RTMGRP_IPV6_IFADDR = 0x100
+RTMGRP_IPV6_ROUTE = 0x400
+
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+RTM_NEWROUTE = 24
+RTM_DELROUTE = 25
+
+IFF_UP = 0x1
+IFF_RUNNING = 0x40
+
+IFLA_IFNAME = 3
+IFA_F_TENTATIVE = 0x40
+RT_SCOPE_LINK = 253
+RT_TABLE_MAIN = 254
+RTN_UNICAST = 1
+RTA_OIF = 4
+RTA_TABLE = 15
+
+_NLMSGHDR = struct.Struct("=IHHII")
+_IFINFOMSG = struct.Struct("=BxHiII")
+_IFADDRMSG = struct.Struct("=BBBBi")
+_RTMSG = struct.Struct("=BBBBBBBBI")
+
+
+class NetworkWatcher:
+    """read() 返回新收到的相关变化的描述；ignore(网卡名) 为真的网卡上的变化不算"""
+
+    def __init__(self, ignore: Callable[[str], bool] = lambda name: False):
+        self.ignore = ignore
+        self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+        self._sock.setblocking(False)
+        self._sock.bind(
+            (
+                0,
+                RTMGRP_LINK
+                | RTMGRP_IPV4_IFADDR
+                | RTMGRP_IPV6_IFADDR
+                | RTMGRP_IPV4_ROUTE
+                | RTMGRP_IPV6_ROUTE,
+            )
+        )
+        # 网卡每次状态变化都会发送 NEWLINK，只有 UP / RUNNING 变化才算
+        self._link_flags: dict[int, int] = {}
+
+    def fileno(self) -> int:
+        return self._sock.fileno()
+
+    def close(self):
+        self._sock.close()
+
+    def read(self) -> list[str]:
+        """其他的 OSError（例如 socket 已经关闭）不会自己恢复，直接抛出"""
+        events: list[str] = []
+        while True:
+            try:
+                data = self._sock.recv(1 << 16)
+            except BlockingIOError:
+                return events
+            except OSError as e:
+                if e.errno != errno.ENOBUFS:
+                    raise
+                # 接收缓冲区满，丢失了通知，当作有变化
+                events.append("netlink overrun")
+                continue
+
+            offset = 0
+            while offset + _NLMSGHDR.size <= len(data):
+                length, kind, _, _, _ = _NLMSGHDR.unpack_from(data, offset)
+                if length < _NLMSGHDR.size:
+                    break
+                event = self._parse(kind, data[offset + _NLMSGHDR.size : offset + length])
+                if event:
+                    events.append(event)
+                offset += (length + 3) & ~3
+
+    def _name(self, index: int) -> str:
+        try:
+            return socket.if_indextoname(index)
+        except OSError:
+            return f"#{index}"
+
+    def _parse(self, kind: int, message: bytes) -> str | None:
+        if kind in (RTM_NEWLINK, RTM_DELLINK) and len(message) >= _IFINFOMSG.size:
+            _, _, index, flags, _ = _IFINFOMSG.unpack_from(message)
+            name = self._name(index)
+            for attr_kind, value in parse_attrs(message[_IFINFOMSG.size :]):
+                if attr_kind == IFLA_IFNAME:
+                    name = value.rstrip(b"\0").decode(errors="replace")
+            if self.ignore(name):
+                return None
+
+            state = flags & (IFF_UP | IFF_RUNNING)
+            if kind == RTM_DELLINK:
+                self._link_flags.pop(index, None)
+                return f"{name} removed"
+            if self._link_flags.get(index) == state:
+                return None
+            self._link_flags[index] = state
+            return f"{name} {'up' if state == IFF_UP | IFF_RUNNING else 'down'}"
+
+        if kind in (RTM_NEWADDR, RTM_DELADDR) and len(message) >= _IFADDRMSG.size:
+            _, _, flags, scope, index = _IFADDRMSG.unpack_from(message)
+            if scope == RT_SCOPE_LINK or flags & IFA_F_TENTATIVE:
+                return None
+            name = self._name(index)
+            if self.ignore(name):
+                return None
+            return f"address {'added to' if kind == RTM_NEWADDR else 'removed from'} {name}"
+
+        if kind in (RTM_NEWROUTE, RTM_DELROUTE) and len(message) >= _RTMSG.size:
+            _, dst_len, _, _, table, _, _, route_type, _ = _RTMSG.unpack_from(message)
+            index = None
+            for attr_kind, value in parse_attrs(message[_RTMSG.size :]):
+                if attr_kind == RTA_TABLE:
+                    (table,) = struct.unpack("=I", value[:4])
+                elif attr_kind == RTA_OIF:
+                    (index,) = struct.unpack("=i", value[:4])
+            if dst_len != 0 or table != RT_TABLE_MAIN or route_type != RTN_UNICAST:
+                return None
+            name = self._name(index) if index is not None else "?"
+            if self.ignore(name):
+                return None
+            return f"default route via {name} {'added' if kind == RTM_NEWROUTE else 'removed'}"
+
+        return None
@@ -3,7 +3,7 @@ import sys
 from tabnanny import check
 from typing import Literal
 
-from . import logger
+from . import logger, trace
 
 type ErrorBehavior = Literal["ignore", "print", "raise", "fatal"]
 
@@ -11,17 +11,22 @@ type ErrorBehavior = Literal["ignore", "print", "raise", "fatal"]
 def execute_print(
     commandline: list[str],
 ) -> None:
-    subprocess.run(
-        commandline,
-        check=False,
-        stdout=sys.stderr,
-        stderr=subprocess.STDOUT,
-        stdin=subprocess.DEVNULL,
-    )
+    with trace.span(commandline[0], "subprocess", argv=commandline) as span:
+        p = subprocess.run(
+            commandline,
+            check=False,
+            stdout=sys.stderr,
+            stderr=subprocess.STDOUT,
+            stdin=subprocess.DEVNULL,
+        )
+        span.set("exit_code", p.returncode)
 
 
-def execute_drop(commandline: list[str], error: ErrorBehavior = "fatal") -> None:
-    _execute(commandline, capture=False, error=error)
+def execute_drop(
+    commandline: list[str], error: ErrorBehavior = "fatal", input: str | None = None
+) -> None:
+    """input 不为 None 时作为命令的标准输入"""
+    _execute(commandline, capture=False, error=error, input=input)
 
 
 def execute_capture(commandline: list[str], error: ErrorBehavior = "fatal") -> str:
@@ -39,16 +44,25 @@ def execute_capture(commandline: list[str], error: ErrorBehavior = "fatal") -> s
     assert output is not None
     return output
 
-def _execute(commandline: list[str], capture=False, error: ErrorBehavior = "fatal"):
+def _execute(
+    commandline: list[str],
+    capture=False,
+    error: ErrorBehavior = "fatal",
+    input: str | None = None,
+):
     try:
-        p = subprocess.run(
-            commandline,
-            check=error == "raise",
-            text=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE if capture else subprocess.STDOUT,
-            stdin=subprocess.DEVNULL,
-        )
+        with trace.span(commandline[0], "subprocess", argv=commandline) as span:
+            p = subprocess.run(
+                commandline,
+                check=False,
+                text=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE if capture else subprocess.STDOUT,
+                **({"stdin": subprocess.DEVNULL} if input is None else {"input": input}),
+            )
+            span.set("exit_code", p.returncode)
+        if error == "raise":
+            p.check_returncode()
     except Exception as e:
         logger.error(f"Failed to execute command: {' '.join(commandline)}")
         raise e
@@ -0,0 +1,49 @@
+import json
+import os
+from os import environ
+from pathlib import Path
+from typing import Any
+
+from . import logger
+
+SYSTEMD_SERVICE_NAME = "wireguard-dynamic-remote"
+
+IS_STARTED_BY_SYSTEMD = environ.get("INVOCATION_ID") is not None
+STATE_DIR = (
+    IS_STARTED_BY_SYSTEMD
+    and environ.get("STATE_DIRECTORY")
+    or f"/var/lib/{SYSTEMD_SERVICE_NAME}"
+)
+
+_warned = False
+
+
+def state_file(name: str) -> Path:
+    return Path(STATE_DIR, name)
+
+
+def load_json(name: str) -> Any | None:
+    """读取状态目录中的 json 文件，不存在或损坏时返回 None"""
+    try:
+        return json.loads(state_file(name).read_text())
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring broken state file {name}: {e}")
+        return None
+
+
+def save_json(name: str, data: Any):
+    """原子地写入状态目录中的 json 文件；目录不可写时只警告一次"""
+    global _warned
+
+    file = state_file(name)
+    temp = file.with_name(f".{file.name}.tmp")
+    try:
+        file.parent.mkdir(parents=True, exist_ok=True)
+        temp.write_text(json.dumps(data, separators=(",", ":")))
+        os.replace(temp, file)
+    except OSError as e:
+        if not _warned:
+            logger.warning(f"Cannot write state directory {STATE_DIR}: {e}")
+            _warned = True
@@ -0,0 +1,50 @@
+import re
+
+_UNITS = {
+    "ms": 0.001,
+    "msec": 0.001,
+    "s": 1,
+    "sec": 1,
+    "second": 1,
+    "seconds": 1,
+    "m": 60,
+    "min": 60,
+    "minute": 60,
+    "minutes": 60,
+    "h": 3600,
+    "hr": 3600,
+    "hour": 3600,
+    "hours": 3600,
+    "d": 86400,
+    "day": 86400,
+    "days": 86400,
+}
+
+_PART = re.compile(r"(\d+(?:\.\d+)?)\s*([a-z]*)")
+
+
+def parse_timespan(timespan: str) -> float:
+    """
+    解析 systemd 风格的时间长度，返回秒数
+
+    支持 "150"、"150s"、"2min"、"1h 30m"、"500ms" 等，没有单位时按秒处理
+    """
+    text = timespan.strip().lower()
+    if not text:
+        raise ValueError("Empty timespan")
+
+    total = 0.0
+    position = 0
+    for match in _PART.finditer(text):
+        if text[position : match.start()].strip():
+            break
+        number, unit = match.groups()
+        if unit not in _UNITS and unit != "":
+            raise ValueError(f"Unknown time unit '{unit}' in '{timespan}'")
+        total += float(number) * _UNITS.get(unit, 1)
+        position = match.end()
+
+    if text[position:].strip() or position == 0:
+        raise ValueError(f"Cannot parse timespan: {timespan}")
+
+    return total
@@ -0,0 +1,124 @@
+"""
+--trace：记录检查流程各阶段和每个子进程的耗时，写成 Chrome trace-event JSON
+
+用 chrome://tracing、https://ui.perfetto.dev 或 speedscope 打开；没有启用时 span() 只返回一个空对象
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Any
+
+from . import logger
+
+# 常驻模式下一直记录，超过后不再记录，避免占用太多内存
+MAX_EVENTS = 1_000_000
+
+_events: list[dict] | None = None
+_threads: dict[int, str] = {}
+_lock = threading.Lock()
+
+
+def enable():
+    global _events
+    _events = []
+
+
+def enabled() -> bool:
+    return _events is not None
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, key: str, value: Any):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("name", "category", "args", "start")
+
+    def __init__(self, name: str, category: str, args: dict[str, Any]):
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def set(self, key: str, value: Any):
+        """在 span 中补充参数，例如子进程的退出码"""
+        self.args[key] = value
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        end = time.perf_counter_ns()
+        if kind is not None:
+            self.args["error"] = kind.__name__
+        _record(
+            {
+                "name": self.name,
+                "cat": self.category,
+                "ph": "X",
+                "ts": self.start / 1000,
+                "dur": (end - self.start) / 1000,
+                "pid": os.getpid(),
+                "tid": threading.get_native_id(),
+                "args": self.args,
+            }
+        )
+        return False
+
+
+def span(name: str, category: str = "stage", **args: Any) -> _Span | _NullSpan:
+    """with trace.span("resolve", interface="wg0"): ..."""
+    if _events is None:
+        return _NULL_SPAN
+    return _Span(name, category, args)
+
+
+def _record(event: dict):
+    with _lock:
+        if _events is None or len(_events) >= MAX_EVENTS:
+            return
+        _events.append(event)
+        tid = event["tid"]
+        if tid not in _threads:
+            _threads[tid] = threading.current_thread().name
+
+
+def write(path: str):
+    with _lock:
+        events = list(_events or [])
+        threads = dict(_threads)
+    metadata = [
+        {
+            "name": "thread_name",
+            "ph": "M",
+            "pid": os.getpid(),
+            "tid": tid,
+            "args": {"name": name},
+        }
+        for tid, name in threads.items()
+    ]
+    try:
+        with open(path, "w") as f:
+            json.dump(
+                {"traceEvents": metadata + events, "displayTimeUnit": "ms"},
+                f,
+                separators=(",", ":"),
+            )
+    except OSError as e:
+        logger.error(f"Cannot write trace to {path}: {e}")
+        return
+    if len(events) >= MAX_EVENTS:
+        logger.warning(f"Trace was truncated at {MAX_EVENTS} events")
+    logger.output(f"Trace written to {path} ({len(events)} events)")
@@ -1 +1,3 @@
+from .loop import main as daemon_loop
 from .main import main as daemon_main
+from .peer_state import print_history
@@ -0,0 +1,372 @@
+"""
+最小的 DNS stub 客户端：只做 A / AAAA 查询
+
+- 两个查询在同一个 UDP socket 上同时发出
+- 响应被截断 (TC) 时改用 TCP 重新查询
+- 每个查询都有截止时间，期间会重发一次 UDP
+- 加密的服务器 (tls:// https://) 见 dns_tls
+"""
+
+import asyncio
+import ipaddress
+import secrets
+import socket
+import struct
+from pathlib import Path
+
+QTYPE_A = 1
+QTYPE_SOA = 6
+QTYPE_AAAA = 28
+
+RCODE_NOERROR = 0
+RCODE_NXDOMAIN = 3
+
+DEFAULT_PORT = 53
+DEFAULT_TIMEOUT = 3.0
+
+_FLAG_TC = 0x0200
+_FLAG_RD = 0x0100
+
+
+class DnsError(Exception):
+    pass
+
+
+class DnsTimeout(DnsError):
+    pass
+
+
+class Answer:
+    """一个 (name, type) 查询的结果"""
+
+    def __init__(self, qtype: int, rcode: int, addresses: list[str], ttl: int):
+        self.qtype = qtype
+        self.rcode = rcode
+        self.addresses = addresses
+        # 正常结果取所有记录的最小 TTL；否定结果取 SOA 的 minimum
+        self.ttl = ttl
+
+    def __repr__(self) -> str:
+        return f"Answer(qtype={self.qtype}, rcode={self.rcode}, addresses={self.addresses}, ttl={self.ttl})"
+
+
+def parse_server(server: str, default_port: int = DEFAULT_PORT) -> tuple[str, int]:
+    """解析 '1.1.1.1' / '1.1.1.1:5353' / '[::1]:53' / '::1' 形式的服务器地址"""
+    if server.startswith("["):
+        host = server[1 : server.index("]")]
+        rest = server[server.index("]") + 1 :]
+        port = int(rest[1:]) if rest.startswith(":") else default_port
+        return host, port
+
+    if server.count(":") == 1:
+        host, port = server.split(":")
+        return host, int(port)
+
+    return server, default_port
+
+
+def is_encrypted(server: str) -> bool:
+    return server.startswith("tls://") or server.startswith("https://")
+
+
+def system_nameservers() -> list[str]:
+    """读取 /etc/resolv.conf 中的 nameserver"""
+    try:
+        content = Path("/etc/resolv.conf").read_text()
+    except OSError:
+        return []
+
+    servers = []
+    for line in content.splitlines():
+        parts = line.split()
+        if len(parts) >= 2 and parts[0] == "nameserver":
+            # IPv6 地址需要加上括号，才能和 "host:port" 区分
+            servers.append(f"[{parts[1]}]" if ":" in parts[1] else parts[1])
+    return servers
+
+
+def build_query(qid: int, host: str, qtype: int) -> bytes:
+    header = struct.pack("!HHHHHH", qid, _FLAG_RD, 1, 0, 0, 0)
+    qname = b""
+    for label in host.rstrip(".").split("."):
+        try:
+            encoded = label.encode("idna")
+        except UnicodeError:  # 过长或者不合法的国际化标签
+            raise DnsError(f"Invalid hostname '{host}'")
+        if not 0 < len(encoded) < 64:
+            raise DnsError(f"Invalid hostname '{host}'")
+        qname += bytes([len(encoded)]) + encoded
+    return header + qname + b"\x00" + struct.pack("!HH", qtype, 1)
+
+
+def _skip_name(data: bytes, offset: int) -> int:
+    while True:
+        if offset >= len(data):
+            raise DnsError("Malformed response: name out of range")
+        length = data[offset]
+        if length == 0:
+            return offset + 1
+        if length & 0xC0 == 0xC0:  # 压缩指针
+            return offset + 2
+        offset += length + 1
+
+
+def parse_response(data: bytes):
+    """返回 (id, flags, rcode, 问题类型, 记录列表[(type, ttl, rdata)], 权威段 SOA minimum)"""
+    if len(data) < 12:
+        raise DnsError("Malformed response: too short")
+
+    qid, flags, qdcount, ancount, nscount, _ = struct.unpack("!HHHHHH", data[:12])
+    offset = 12
+    qtype = 0
+    for _ in range(qdcount):
+        offset = _skip_name(data, offset)
+        (qtype,) = struct.unpack("!H", data[offset : offset + 2])
+        offset += 4
+
+    records: list[tuple[int, int, bytes]] = []
+    soa_minimum: int | None = None
+    for index in range(ancount + nscount):
+        offset = _skip_name(data, offset)
+        rtype, _, ttl, rdlength = struct.unpack("!HHIH", data[offset : offset + 10])
+        offset += 10
+        rdata = data[offset : offset + rdlength]
+        if len(rdata) != rdlength:
+            raise DnsError("Malformed response: record out of range")
+        offset += rdlength
+
+        if index < ancount:
+            records.append((rtype, ttl, rdata))
+        elif rtype == QTYPE_SOA and rdlength >= 20:
+            (minimum,) = struct.unpack("!I", rdata[-4:])
+            soa_minimum = min(ttl, minimum)
+
+    return qid, flags, flags & 0x000F, qtype, records, soa_minimum
+
+
+def _make_answer(qtype: int, data: bytes) -> Answer:
+    _, _, rcode, _, records, soa_minimum = parse_response(data)
+
+    addresses: list[str] = []
+    ttls: list[int] = []
+    for rtype, ttl, rdata in records:
+        if rtype != qtype:  # CNAME 等
+            continue
+        if rtype == QTYPE_A and len(rdata) == 4:
+            addresses.append(str(ipaddress.IPv4Address(rdata)))
+        elif rtype == QTYPE_AAAA and len(rdata) == 16:
+            addresses.append(str(ipaddress.IPv6Address(rdata)))
+        else:
+            continue
+        ttls.append(ttl)
+
+    if addresses:
+        ttl = min(ttls)
+    else:
+        ttl = soa_minimum if soa_minimum is not None else 0
+
+    return Answer(qtype, rcode, addresses, ttl)
+
+
+class _UdpProtocol(asyncio.DatagramProtocol):
+    def __init__(self) -> None:
+        self.waiters: dict[int, tuple[asyncio.Future[bytes], bytes]] = {}
+
+    def expect(self, qid: int, query: bytes) -> asyncio.Future[bytes]:
+        future = asyncio.get_running_loop().create_future()
+        self.waiters[qid] = (future, query)
+        return future
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        if len(data) < 12:
+            return
+        (qid,) = struct.unpack("!H", data[:2])
+        waiter = self.waiters.get(qid)
+        if waiter is None:
+            return
+        future, query = waiter
+        # 问题段必须和请求一致，防止伪造的响应
+        if data[12 : len(query)] != query[12:]:
+            return
+        if not future.done():
+            future.set_result(data)
+
+    def error_received(self, exc: Exception) -> None:
+        for future, _ in self.waiters.values():
+            if not future.done():
+                future.set_exception(DnsError(f"UDP error: {exc}"))
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        for future, _ in self.waiters.values():
+            if not future.done():
+                future.set_exception(DnsError("UDP socket closed"))
+
+
+def _family_of(host: str) -> int:
+    try:
+        return socket.AF_INET6 if ipaddress.ip_address(host).version == 6 else socket.AF_INET
+    except ValueError:
+        return 0
+
+
+async def _query_udp(
+    host: str, port: int, queries: dict[int, tuple[int, bytes]], timeout: float
+) -> dict[int, bytes]:
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(
+        _UdpProtocol, remote_addr=(host, port), family=_family_of(host)
+    )
+    try:
+        futures = {}
+        for qtype, (qid, query) in queries.items():
+            futures[qtype] = protocol.expect(qid, query)
+            transport.sendto(query)
+
+        # 一半时间后还没回复的查询重发一次
+        pending = set(futures.values())
+        _, pending = await asyncio.wait(pending, timeout=timeout / 2)
+        if pending:
+            for qtype, future in futures.items():
+                if future in pending:
+                    transport.sendto(queries[qtype][1])
+            _, pending = await asyncio.wait(pending, timeout=timeout / 2)
+
+        result: dict[int, bytes] = {}
+        error: BaseException | None = None
+        for qtype, future in futures.items():
+            if future in pending:
+                future.cancel()
+            elif future.exception():
+                error = future.exception()
+            else:
+                result[qtype] = future.result()
+
+        if not result:
+            if error:
+                raise error
+            raise DnsTimeout(f"DNS server {host}:{port} did not respond in {timeout}s")
+        return result
+    finally:
+        # 被取消时还在等待的查询不再需要结果，关闭 socket 前先取消，避免未处理的异常
+        for future, _ in protocol.waiters.values():
+            future.cancel()
+        transport.close()
+
+
+async def _query_tcp(
+    host: str, port: int, queries: dict[int, tuple[int, bytes]], timeout: float
+) -> dict[int, bytes]:
+    async def exchange():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            # 同一个连接上连续发出所有查询，再按 ID 收取
+            for _, query in queries.values():
+                writer.write(struct.pack("!H", len(query)) + query)
+            await writer.drain()
+
+            by_id = {qid: qtype for qtype, (qid, _) in queries.items()}
+            result: dict[int, bytes] = {}
+            while len(result) < len(queries):
+                (length,) = struct.unpack("!H", await reader.readexactly(2))
+                data = await reader.readexactly(length)
+                qtype = by_id.get(struct.unpack("!H", data[:2])[0])
+                if qtype is not None:
+                    result[qtype] = data
+            return result
+        finally:
+            writer.close()
+
+    try:
+        return await asyncio.wait_for(exchange(), timeout)
+    except asyncio.TimeoutError:
+        raise DnsTimeout(f"DNS server {host}:{port} (tcp) did not respond in {timeout}s")
+    except (OSError, asyncio.IncompleteReadError) as e:
+        raise DnsError(f"DNS server {host}:{port} (tcp) failed: {e}")
+
+
+class Transport:
+    """把查询发给服务器的方式"""
+
+    # 查询失败后是否允许使用 dig 等外部命令
+    allow_fallback = True
+
+    async def query(
+        self, host: str, server: str, qtypes: tuple[int, ...], timeout: float
+    ) -> dict[int, Answer]:
+        raise NotImplementedError()
+
+
+class NetworkTransport(Transport):
+    async def query(self, host, server, qtypes, timeout):
+        return await _query_network(host, server, qtypes, timeout)
+
+
+_transport: Transport = NetworkTransport()
+
+
+def use_transport(transport: Transport):
+    """替换查询的实现（--simulate）"""
+    global _transport
+    _transport = transport
+
+
+def get_transport() -> Transport:
+    return _transport
+
+
+async def query(
+    host: str,
+    server: str,
+    qtypes: tuple[int, ...] = (QTYPE_A, QTYPE_AAAA),
+    timeout: float = DEFAULT_TIMEOUT,
+) -> dict[int, Answer]:
+    """
+    查询 host 的多种记录，返回 {qtype: Answer}；全部失败时抛出 DnsError
+
+    server 可以是 'host[:port]'（UDP，截断时用 TCP），也可以是 'tls://...' 或 'https://...'
+    """
+    return await _transport.query(host, server, qtypes, timeout)
+
+
+async def _query_network(
+    host: str,
+    server: str,
+    qtypes: tuple[int, ...] = (QTYPE_A, QTYPE_AAAA),
+    timeout: float = DEFAULT_TIMEOUT,
+) -> dict[int, Answer]:
+    # 同一个 socket / 连接上按 ID 区分回复，每个查询的 ID 必须不同
+    base = secrets.randbits(16)
+    queries = {}
+    for index, qtype in enumerate(qtypes):
+        qid = base ^ index
+        queries[qtype] = (qid, build_query(qid, host, qtype))
+
+    if is_encrypted(server):
+        from . import dns_tls
+
+        raw = await dns_tls.exchange(
+            server, {qtype: query for qtype, (_, query) in queries.items()}, timeout
+        )
+        return {qtype: _make_answer(qtype, data) for qtype, data in raw.items()}
+
+    server_host, server_port = parse_server(server)
+
+    deadline = asyncio.get_running_loop().time() + timeout
+    try:
+        raw = await _query_udp(server_host, server_port, queries, timeout)
+    except OSError as e:
+        raise DnsError(f"DNS server {server} failed: {e}")
+
+    truncated = {
+        qtype: queries[qtype]
+        for qtype, data in raw.items()
+        if struct.unpack("!H", data[2:4])[0] & _FLAG_TC
+    }
+    if truncated:
+        remaining = max(deadline - asyncio.get_running_loop().time(), 0.5)
+        raw.update(await _query_tcp(server_host, server_port, truncated, remaining))
+
+    if not raw:
+        raise DnsTimeout(f"DNS server {server} did not respond in {timeout}s")
+
+    return {qtype: _make_answer(qtype, data) for qtype, data in raw.items()}
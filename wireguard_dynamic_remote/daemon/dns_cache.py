@@ -0,0 +1,124 @@
+"""
+按 (hostname, resolver, 记录类型) 缓存 DNS 结果，遵守 TTL
+
+- 没有记录 (NXDOMAIN / NODATA) 的结果也会缓存（否定缓存），时长取 SOA minimum
+- 查询失败时可以使用已过期的结果（serve-stale），最多过期 STALE_MAX 秒
+- 保存在状态目录，oneshot 运行和重启后都能直接使用
+"""
+
+import threading
+import time
+
+from ..common.state import load_json, save_json
+from .dns import RCODE_NOERROR, RCODE_NXDOMAIN, Answer
+
+CACHE_FILE = "dns-cache.json"
+
+MAX_TTL = 24 * 3600
+NEGATIVE_TTL_DEFAULT = 30
+NEGATIVE_TTL_MAX = 3600
+STALE_MAX = 24 * 3600
+
+type CacheKey = tuple[str, str, int]
+
+
+class CacheEntry:
+    __slots__ = ("addresses", "expires", "rcode")
+
+    def __init__(self, addresses: list[str], expires: float, rcode: int):
+        self.addresses = addresses
+        self.expires = expires
+        self.rcode = rcode
+
+
+class DnsCache:
+    def __init__(self, file: str = CACHE_FILE):
+        self.file = file
+        self._entries: dict[CacheKey, CacheEntry] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._loaded = False
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+
+        data = load_json(self.file)
+        if not isinstance(data, list):
+            return
+        for item in data:
+            try:
+                host, resolver, qtype, expires, rcode, addresses = item
+                self._entries[(host, resolver, qtype)] = CacheEntry(
+                    addresses, expires, rcode
+                )
+            except (TypeError, ValueError):
+                continue
+
+    def lookup(
+        self,
+        host: str,
+        resolver: str,
+        qtypes: tuple[int, ...],
+        stale: bool = False,
+    ) -> list[str] | None:
+        """所有类型都命中时返回合并后的地址列表，否则返回 None"""
+        now = time.time()
+        limit = now - STALE_MAX if stale else now
+        addresses: list[str] = []
+        with self._lock:
+            self._load()
+            for qtype in qtypes:
+                entry = self._entries.get((host, resolver, qtype))
+                if entry is None or entry.expires <= limit:
+                    return None
+                for address in entry.addresses:
+                    if address not in addresses:
+                        addresses.append(address)
+        return addresses
+
+    def expires(self, host: str, resolver: str, qtypes: tuple[int, ...]) -> float | None:
+        """返回这些记录中最早的过期时间"""
+        with self._lock:
+            self._load()
+            times = []
+            for qtype in qtypes:
+                entry = self._entries.get((host, resolver, qtype))
+                if entry is None:
+                    return None
+                times.append(entry.expires)
+        return min(times) if times else None
+
+    def store(self, host: str, resolver: str, answers: dict[int, Answer]):
+        now = time.time()
+        with self._lock:
+            self._load()
+            for qtype, answer in answers.items():
+                if answer.rcode not in (RCODE_NOERROR, RCODE_NXDOMAIN):
+                    continue  # SERVFAIL 等不缓存
+                if answer.addresses:
+                    ttl = min(answer.ttl, MAX_TTL)
+                else:
+                    ttl = answer.ttl or NEGATIVE_TTL_DEFAULT
+                    ttl = min(ttl, NEGATIVE_TTL_MAX)
+                if ttl <= 0:
+                    continue
+
+                self._entries[(host, resolver, qtype)] = CacheEntry(
+                    answer.addresses, now + ttl, answer.rcode
+                )
+                self._dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            limit = time.time() - STALE_MAX
+            data = [
+                [host, resolver, qtype, round(entry.expires), entry.rcode, entry.addresses]
+                for (host, resolver, qtype), entry in self._entries.items()
+                if entry.expires > limit
+            ]
+            self._dirty = False
+        save_json(self.file, data)
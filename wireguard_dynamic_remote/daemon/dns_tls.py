@@ -0,0 +1,303 @@
+"""
+加密的 DNS 传输：DNS-over-TLS (tls://) 和 DNS-over-HTTPS (https://)
+
+连接在同一个事件循环中一直保持，多个查询复用，TLS 握手只在第一次查询（或连接被服务器关闭后）进行
+
+- tls://host[:port][#name]：一个 TCP 连接上同时发出多个查询，按 ID 匹配回复 (RFC 7858)；
+  host 是 IP 地址时可以用 #name 指定证书中的名称
+- https://host[:port]/path：使用 POST application/dns-message (RFC 8484)；
+  标准库没有 HTTP/2，所以用一组 HTTP/1.1 keep-alive 连接，每个连接同时只有一个请求
+"""
+
+import asyncio
+import ssl
+import struct
+from urllib.parse import urlsplit
+
+from .dns import DnsError, DnsTimeout, parse_server
+
+DOT_PORT = 853
+DOH_PORT = 443
+# 每个 DoH 服务器最多同时打开的连接数
+DOH_CONNECTIONS = 4
+
+_CONNECTION_ERRORS = (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError)
+
+_ssl_context: ssl.SSLContext | None = None
+
+
+def _context() -> ssl.SSLContext:
+    global _ssl_context
+    if _ssl_context is None:
+        _ssl_context = ssl.create_default_context()
+    return _ssl_context
+
+
+class _TlsConnection:
+    def __init__(self, host: str, port: int, name: str):
+        self.host = host
+        self.port = port
+        self.name = name
+        self.loop = asyncio.get_running_loop()
+        self.writer: asyncio.StreamWriter | None = None
+        self.waiters: dict[int, asyncio.Future[bytes]] = {}
+        self._lock = asyncio.Lock()
+        self._next_id = 0
+
+    async def _ensure_connected(self) -> bool:
+        """返回是否新建立了连接"""
+        async with self._lock:
+            if self.writer is not None:
+                return False
+            reader, writer = await asyncio.open_connection(
+                self.host, self.port, ssl=_context(), server_hostname=self.name
+            )
+            self.writer = writer
+            asyncio.ensure_future(self._read_loop(reader, writer))
+            return True
+
+    async def _read_loop(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                (length,) = struct.unpack("!H", await reader.readexactly(2))
+                data = await reader.readexactly(length)
+                future = self.waiters.pop(struct.unpack("!H", data[:2])[0], None)
+                if future is not None and not future.done():
+                    future.set_result(data)
+        except _CONNECTION_ERRORS as e:
+            self._close(writer, DnsError(f"connection to {self.host} closed: {e or 'EOF'}"))
+        except asyncio.CancelledError:
+            self._close(writer, DnsError(f"connection to {self.host} closed"))
+
+    def _close(self, writer: asyncio.StreamWriter, error: DnsError):
+        if self.writer is writer:
+            self.writer = None
+        writer.close()
+        waiters, self.waiters = self.waiters, {}
+        for future in waiters.values():
+            if not future.done():
+                future.set_exception(error)
+
+    def _allocate_id(self) -> int:
+        # 同一个连接上同时进行的查询 ID 不能重复，所以由连接分配而不是随机
+        while True:
+            self._next_id = (self._next_id + 1) & 0xFFFF
+            if self._next_id not in self.waiters:
+                return self._next_id
+
+    async def _connect(self, timeout: float) -> bool:
+        """和 _ensure_connected 相同，但是失败时抛出 DnsError"""
+        try:
+            return await asyncio.wait_for(self._ensure_connected(), timeout)
+        except asyncio.TimeoutError:
+            raise DnsTimeout(f"DNS server {self.host}:{self.port} (tls) did not connect in {timeout}s")
+        except OSError as e:
+            raise DnsError(f"DNS server {self.host}:{self.port} (tls) failed: {e}")
+
+    async def exchange(self, queries: dict[int, bytes], timeout: float) -> dict[int, bytes]:
+        fresh = await self._connect(timeout)
+        try:
+            return await self._send(queries, timeout)
+        except DnsTimeout:
+            raise
+        except DnsError:
+            if fresh:
+                raise
+        # 服务器可能关闭了空闲的连接，重新连接后再试一次
+        await self._connect(timeout)
+        return await self._send(queries, timeout)
+
+    async def _send(self, queries: dict[int, bytes], timeout: float) -> dict[int, bytes]:
+        writer = self.writer
+        if writer is None:
+            raise DnsError(f"connection to {self.host} closed")
+
+        futures: dict[int, tuple[int, asyncio.Future[bytes]]] = {}
+        for qtype, query in queries.items():
+            qid = self._allocate_id()
+            future = self.loop.create_future()
+            self.waiters[qid] = future
+            futures[qtype] = (qid, future)
+            query = struct.pack("!H", qid) + query[2:]
+            writer.write(struct.pack("!H", len(query)) + query)
+        try:
+            await writer.drain()
+        except OSError as e:
+            self._close(writer, DnsError(f"connection to {self.host} closed: {e}"))
+
+        pending = {future for _, future in futures.values()}
+        _, pending = await asyncio.wait(pending, timeout=timeout)
+
+        result: dict[int, bytes] = {}
+        error: BaseException | None = None
+        for qtype, (qid, future) in futures.items():
+            if future in pending:
+                self.waiters.pop(qid, None)
+                future.cancel()
+            elif future.exception():
+                error = future.exception()
+            else:
+                result[qtype] = future.result()
+
+        if not result:
+            if error:
+                raise error
+            raise DnsTimeout(f"DNS server {self.host}:{self.port} (tls) did not respond in {timeout}s")
+        return result
+
+
+class _HttpsConnection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.usable = True
+
+    async def post(self, host: str, path: str, body: bytes) -> bytes:
+        self.writer.write(
+            (
+                f"POST {path} HTTP/1.1\r\n"
+                f"Host: {host}\r\n"
+                "Content-Type: application/dns-message\r\n"
+                "Accept: application/dns-message\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "\r\n"
+            ).encode()
+            + body
+        )
+        await self.writer.drain()
+
+        status_line = await self.reader.readuntil(b"\r\n")
+        parts = status_line.decode("latin-1").split(" ", 2)
+        if len(parts) < 2 or not parts[1].isdigit():
+            raise DnsError(f"Invalid HTTP response from {host}")
+        status = int(parts[1])
+
+        headers: dict[str, str] = {}
+        while True:
+            line = (await self.reader.readuntil(b"\r\n")).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            body = b""
+            while True:
+                size = int((await self.reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                chunk = await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                body += chunk[:-2]
+        elif "content-length" in headers:
+            body = await self.reader.readexactly(int(headers["content-length"]))
+        else:
+            body = await self.reader.read()
+            self.usable = False
+
+        if headers.get("connection", "").lower() == "close":
+            self.usable = False
+        if status != 200:
+            raise DnsError(f"DNS server {host} returned HTTP {status}")
+        return body
+
+    def close(self):
+        self.usable = False
+        self.writer.close()
+
+
+class _HttpsPool:
+    def __init__(self, url: str):
+        parts = urlsplit(url)
+        if not parts.hostname:
+            raise DnsError(f"Invalid DoH url '{url}'")
+        self.host = parts.hostname
+        self.port = parts.port or DOH_PORT
+        self.authority = parts.netloc
+        self.path = parts.path or "/dns-query"
+        self.loop = asyncio.get_running_loop()
+        self.idle: list[_HttpsConnection] = []
+        self.limit = asyncio.Semaphore(DOH_CONNECTIONS)
+
+    async def _open(self) -> _HttpsConnection:
+        reader, writer = await asyncio.open_connection(
+            self.host, self.port, ssl=_context(), server_hostname=self.host
+        )
+        return _HttpsConnection(reader, writer)
+
+    async def post(self, body: bytes) -> bytes:
+        async with self.limit:
+            connection = self.idle.pop() if self.idle else None
+            data = None
+            try:
+                if connection is not None:
+                    try:
+                        data = await connection.post(self.authority, self.path, body)
+                    except _CONNECTION_ERRORS:
+                        # 复用的连接可能已经被服务器关闭，换一个新连接重试
+                        connection.close()
+                        connection = None
+                if connection is None:
+                    connection = await self._open()
+                    data = await connection.post(self.authority, self.path, body)
+            except _CONNECTION_ERRORS as e:
+                if connection:
+                    connection.close()
+                raise DnsError(f"DNS server {self.authority} (https) failed: {e}")
+            except BaseException:
+                if connection:
+                    connection.close()
+                raise
+
+            if connection.usable:
+                self.idle.append(connection)
+            else:
+                connection.close()
+            return data
+
+    async def exchange(self, queries: dict[int, bytes], timeout: float) -> dict[int, bytes]:
+        async def one(query: bytes):
+            # RFC 8484 建议 ID 为 0，方便 HTTP 缓存
+            return await self.post(b"\0\0" + query[2:])
+
+        qtypes = list(queries)
+        tasks = [asyncio.ensure_future(one(queries[qtype])) for qtype in qtypes]
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+
+        result: dict[int, bytes] = {}
+        error: BaseException | None = None
+        for qtype, task in zip(qtypes, tasks):
+            if task in pending:
+                task.cancel()
+            elif task.exception():
+                error = task.exception()
+            else:
+                result[qtype] = task.result()
+
+        if not result:
+            if error:
+                raise error
+            raise DnsTimeout(f"DNS server {self.authority} (https) did not respond in {timeout}s")
+        return result
+
+
+_connections: dict[str, _TlsConnection | _HttpsPool] = {}
+
+
+def _connection(server: str) -> _TlsConnection | _HttpsPool:
+    loop = asyncio.get_running_loop()
+    connection = _connections.get(server)
+    # 连接属于创建它的事件循环
+    if connection is None or connection.loop is not loop:
+        if server.startswith("https://"):
+            connection = _HttpsPool(server)
+        else:
+            address, _, name = server[len("tls://") :].partition("#")
+            host, port = parse_server(address, DOT_PORT)
+            connection = _TlsConnection(host, port, name or host)
+        _connections[server] = connection
+    return connection
+
+
+async def exchange(server: str, queries: dict[int, bytes], timeout: float) -> dict[int, bytes]:
+    """在 server 的持久连接上发送 {qtype: 查询报文}，返回 {qtype: 回复报文}"""
+    return await _connection(server).exchange(queries, timeout)
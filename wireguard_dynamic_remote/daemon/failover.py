@@ -0,0 +1,76 @@
+"""
+设置新地址后确认 WireGuard 真的能通：等待切换之后的握手，并且 endpoint 仍然是这个地址，超时就换下一个地址
+
+ICMP 能通不代表 WireGuard 端口能通，而且很多服务器屏蔽了 ping，所以这里直接看 WireGuard 自己的状态。
+接收字节数不能作为依据：旧会话还可能从原来的地址收到数据，WireGuard 的漫游还会把 endpoint 改回去
+"""
+
+import time
+
+from ..common import logger
+from ..wireguard import Endpoint, RuntimePeerConfig, get_backend
+
+POLL_INTERVAL = 0.5
+
+
+def _peer_status(interface: str, public_key: str) -> tuple[int, str]:
+    """返回 (最近握手时间, 当前 endpoint)"""
+    device = get_backend().snapshot([interface]).get(interface)
+    if device is None:
+        return 0, ""
+    for peer in device.peers:
+        if peer.PublicKey == public_key:
+            assert isinstance(peer, RuntimePeerConfig)
+            return peer.latest_handshake(), peer.Endpoint or ""
+    return 0, ""
+
+
+def verify_endpoint(
+    interface: str,
+    peer: RuntimePeerConfig,
+    endpoint: str,
+    window: float,
+) -> bool:
+    """设置 endpoint 并在 window 秒内等待切换之后的握手，成功返回 True"""
+    backend = get_backend()
+    handshake_before, _ = _peer_status(interface, peer.PublicKey)
+
+    # 握手时间只精确到秒，比它更早的握手一定属于旧地址
+    switched_at = int(time.time())
+    backend.set_endpoints(interface, {peer.PublicKey: endpoint})
+
+    # 没有设置 keepalive 时临时打开，内核会立即发出一个 keepalive，会话过期时随之发起握手
+    trigger = not peer.PersistentKeepalive
+    if trigger:
+        backend.set_keepalive(interface, peer.PublicKey, 1)
+
+    try:
+        deadline = time.monotonic() + window
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            handshake, current = _peer_status(interface, peer.PublicKey)
+            if handshake > handshake_before and handshake >= switched_at and current == endpoint:
+                return True
+    finally:
+        if trigger:
+            backend.set_keepalive(interface, peer.PublicKey, 0)
+
+    return False
+
+
+def failover(
+    interface: str,
+    peer: RuntimePeerConfig,
+    candidates: list[str],
+    port: str,
+    window: float,
+) -> str | None:
+    """依次尝试候选地址，返回第一个确认可用的 endpoint"""
+    for address in candidates:
+        endpoint = Endpoint.format(address, port)
+        logger.output(f"Trying {endpoint}, waiting up to {window:.0f}s for handshake...")
+        if verify_endpoint(interface, peer, endpoint, window):
+            logger.output(f"  → handshake received.")
+            return endpoint
+        logger.warning(f"  → no handshake.")
+    return None
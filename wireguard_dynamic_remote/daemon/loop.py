@@ -0,0 +1,272 @@
+import asyncio
+import signal
+import sys
+import time
+
+from ..common import logger, metrics
+from ..common.context import RunContext
+from ..wireguard import get_repository
+from .main import Targets, run_cycle
+from .prefetch import Prefetcher
+from .schedule import Schedule
+
+if sys.platform == "linux":
+    from ..systemd import sd_notify
+else:
+    sd_notify = None
+
+
+class _Cycle:
+    """记录当前正在运行的检查周期，供看门狗判断进程是否卡死"""
+
+    def __init__(self) -> None:
+        self.started_at: float | None = None
+        self.last_ok: bool | None = None
+        self.last_duration = 0.0
+
+    def running_for(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return time.monotonic() - self.started_at
+
+
+# 收到变化通知后再等一会，把连续的多个事件合并成一次检查
+DEBOUNCE = 0.5
+# 网络变化（DHCP 等）通常是一连串事件：安静 NET_SETTLE 秒后再检查，最多推迟 NET_SETTLE_MAX 秒
+NET_SETTLE = 2.0
+NET_SETTLE_MAX = 10.0
+# 两次按计划的检查之间至少间隔多久，把差不多同时到期的 peer 合并到一次检查
+MIN_WAIT = 1.0
+
+
+class _Trigger:
+    """在定时检查之外请求立即检查部分接口或部分 peer"""
+
+    def __init__(self) -> None:
+        self.event = asyncio.Event()
+        self.targets: Targets = {}
+        # 请求了全部接口（例如配置目录被替换），和"没有请求"不同，不看是否到期
+        self.everything = False
+
+    def request(self, interfaces: set[str] | None):
+        """检查这些接口的全部 peer，interfaces 为 None 表示全部接口"""
+        if interfaces is None:
+            self.everything = True
+        else:
+            self.request_peers({interface: None for interface in interfaces})
+        self.event.set()
+
+    def request_peers(self, targets: Targets):
+        """只检查使用这些 hostname 的 peer，{接口: hostname 集合}"""
+        for interface, hostnames in targets.items():
+            if interface in self.targets and self.targets[interface] is None:
+                continue
+            if hostnames is None:
+                self.targets[interface] = None
+            else:
+                current = self.targets.get(interface) or set()
+                self.targets[interface] = current | hostnames
+        self.event.set()
+
+    def take(self, interfaces: list[str]) -> Targets:
+        """取出请求的检查；请求了全部接口时返回当前所有接口"""
+        targets = self.targets
+        if self.everything:
+            targets = {interface: None for interface in interfaces}
+        self.targets = {}
+        self.everything = False
+        self.event.clear()
+        return targets
+
+
+def _describe(targets: Targets) -> str:
+    return ", ".join(
+        interface if hostnames is None else f"{interface} ({', '.join(sorted(hostnames))})"
+        for interface, hostnames in sorted(targets.items())
+    )
+
+
+def main(config: RunContext):
+    if len(config.interfaces) == 0:
+        print("No interfaces specified. Exiting.")
+        return
+
+    asyncio.run(_serve(config))
+
+
+async def _serve(config: RunContext):
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # windows
+            pass
+
+    cycle = _Cycle()
+    watchdog_task = None
+    if sd_notify:
+        interval = sd_notify.watchdog_interval()
+        if interval:
+            watchdog_task = asyncio.create_task(_watchdog(interval, cycle, config))
+        sd_notify.ready()
+
+    trigger = _Trigger()
+
+    def on_config_change(interfaces: set[str] | None):
+        logger.output(f"Config changed: {', '.join(sorted(interfaces or ['(all)']))}")
+        trigger.request(interfaces)
+
+    watcher = None
+    try:
+        watcher = get_repository().watch(on_config_change)
+    except OSError as e:
+        logger.warning(f"Can not watch config directory, changes will be noticed by timer: {e}")
+
+    network = _watch_network(config, trigger) if sys.platform == "linux" else None
+
+    metrics_server = None
+    if config.metrics_listen:
+        try:
+            metrics_server = await metrics.serve(config.metrics_listen)
+            logger.output(f"Serving metrics on {config.metrics_listen}")
+        except OSError as e:
+            logger.error(f"Can not serve metrics on {config.metrics_listen}: {e}")
+
+    prefetcher = Prefetcher(config, trigger.request_peers)
+    prefetch_task = asyncio.create_task(prefetcher.run())
+
+    schedule = Schedule(config.interval)
+    logger.output(
+        f"Daemon started, checking every {config.interval}s, "
+        f"stable peers back off up to {schedule.cap:.0f}s."
+    )
+
+    while not stop.is_set():
+        if config.expanded:
+            config.interfaces = get_repository().list_interfaces()
+
+        # 没有立即检查的请求时，按计划检查到期的 peer
+        only = trigger.take(config.interfaces) if trigger.event.is_set() else None
+        if only is None:
+            _status(f"Checking {len(config.interfaces)} interfaces...")
+        else:
+            logger.output(f"Re-checking {_describe(only)}")
+            _status(f"Checking {_describe(only)}...")
+
+        cycle.started_at = time.monotonic()
+        try:
+            cycle.last_ok = await asyncio.to_thread(run_cycle, config, only, schedule)
+        except Exception as e:
+            logger.error(f"Check cycle failed: {e}")
+            cycle.last_ok = False
+        cycle.last_duration = time.monotonic() - cycle.started_at
+        cycle.started_at = None
+
+        now = time.monotonic()
+        if only is None:
+            schedule.prune(now)
+        _status(
+            f"Last check {'succeeded' if cycle.last_ok else 'failed'} "
+            f"in {cycle.last_duration:.2f}s, {schedule.describe(now)}."
+        )
+
+        # 最多等待一个 interval：新的 peer（还没有计划）也会被及时检查
+        wait = config.interval
+        next_due = schedule.next_due()
+        if next_due is not None:
+            wait = min(wait, max(next_due - now, MIN_WAIT))
+        await _sleep(stop, trigger, wait)
+
+    logger.output("Daemon stopping.")
+    if sd_notify:
+        sd_notify.stopping()
+    if watchdog_task:
+        watchdog_task.cancel()
+    prefetch_task.cancel()
+    if metrics_server:
+        metrics_server.close()
+    for source in (watcher, network):
+        if source:
+            loop.remove_reader(source.fileno())
+            source.close()
+
+
+def _watch_network(config: RunContext, trigger: _Trigger):
+    """网卡、地址或默认路由变化时，立即重新检查所有接口"""
+    from ..common.rtnetlink import NetworkWatcher
+
+    loop = asyncio.get_running_loop()
+    try:
+        # WireGuard 接口自己的变化不影响外层连接
+        watcher = NetworkWatcher(ignore=lambda name: name in config.interfaces)
+    except OSError as e:
+        logger.warning(f"Can not watch network changes: {e}")
+        return None
+
+    pending: list[str] = []
+    first_at = 0.0
+    timer: asyncio.TimerHandle | None = None
+
+    def fire():
+        nonlocal timer
+        timer = None
+        logger.output(f"Network changed: {', '.join(dict.fromkeys(pending))}")
+        pending.clear()
+        trigger.request(set(config.interfaces))
+
+    def readable():
+        nonlocal timer, first_at
+        try:
+            events = watcher.read()
+        except OSError as e:
+            # 不会自己恢复的错误，继续监视只会让事件循环空转
+            logger.warning(f"Stopped watching network changes: {e}")
+            loop.remove_reader(watcher.fileno())
+            return
+        if not events:
+            return
+        if not pending:
+            first_at = loop.time()
+        pending.extend(events)
+        if timer:
+            timer.cancel()
+        delay = min(NET_SETTLE, max(first_at + NET_SETTLE_MAX - loop.time(), 0))
+        timer = loop.call_later(delay, fire)
+
+    loop.add_reader(watcher.fileno(), readable)
+    return watcher
+
+
+async def _sleep(stop: asyncio.Event, trigger: _Trigger, timeout: float):
+    """等到超时、收到停止信号，或者有立即检查的请求"""
+    waiters = [
+        asyncio.create_task(stop.wait()),
+        asyncio.create_task(trigger.event.wait()),
+    ]
+    try:
+        await asyncio.wait(waiters, timeout=max(timeout, 0), return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for waiter in waiters:
+            waiter.cancel()
+
+    if trigger.event.is_set() and not stop.is_set():
+        await asyncio.sleep(DEBOUNCE)
+
+
+async def _watchdog(interval: float, cycle: _Cycle, config: RunContext):
+    # 按要求间隔的一半发送心跳；如果某个周期运行超过 2 倍检查间隔，就停止心跳让 systemd 重启服务
+    # （WatchdogSec 本身比这个宽松得多，不能用它判断周期是否卡住）
+    assert sd_notify is not None
+    limit = config.interval * 2
+    while True:
+        if cycle.running_for() < limit:
+            sd_notify.watchdog()
+        else:
+            logger.error(f"Check cycle stuck for {cycle.running_for():.0f}s.")
+        await asyncio.sleep(interval / 2)
+
+
+def _status(message: str):
+    if sd_notify:
+        sd_notify.status(message)
@@ -1,41 +1,322 @@
+import subprocess
 import sys
+import threading
+import time
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
-from ..common import logger
+from ..common import logger, metrics, recording, trace
 from ..common.context import RunContext
-from ..common.networking import ping_each_ip
-from ..wireguard import get_runtime_interface, get_static_interface, set_peer_address, Endpoint
-from .resolve import resolve
+from ..common.networking import probe_addresses
+from ..wireguard import (
+    Endpoint,
+    GlobalConfig,
+    PeerConfig,
+    RuntimeConfig,
+    RuntimePeerConfig,
+    RuntimeSnapshot,
+    get_repository,
+    get_runtime_snapshot,
+    get_static_interface,
+    set_peer_address,
+    set_peer_addresses,
+    sync_interface,
+)
+from . import peer_state
+from .failover import failover
+from .resolve import resolve, resolve_many, save_cache
+from .schedule import Schedule
 from .service_control import cross_platform_start_service
 
 
 def main(config: RunContext):
-    interfaces = config.interfaces
-
-    if len(interfaces) == 0:
+    if len(config.interfaces) == 0:
         print("No interfaces specified. Exiting.")
         return
 
+    ok = run_cycle(config)
+    sys.exit(0 if ok else 1)
+
+
+# 只检查部分 peer 时的范围：{接口: 只检查使用这些 hostname 的 peer，None 表示全部 peer}
+type Targets = dict[str, set[str] | None]
+# 不属于单个接口的阶段（一次获取 / 解析所有接口）的 interface 标签
+ALL = "*"
+
+
+def run_cycle(
+    config: RunContext,
+    only: Targets | None = None,
+    schedule: Schedule | None = None,
+) -> bool:
+    """
+    检查所有接口，only 不为 None 时只检查其中的接口 / peer
+
+    给出 schedule 时只检查到期的 peer，并按结果安排下次检查；指定了 only 时不看是否到期
+    """
+    started = time.monotonic()
+    ok = False
+    try:
+        with trace.span("cycle"), recording.cycle(config.interfaces, only):
+            ok = _run_cycle(config, only, schedule)
+        return ok
+    finally:
+        elapsed = time.monotonic() - started
+        metrics.cycle_seconds.observe(elapsed)
+        metrics.interval_seconds.set(config.interval)
+        metrics.last_cycle_seconds.set(elapsed)
+        metrics.last_cycle_success.set(1 if ok else 0)
+        metrics.last_cycle_timestamp.set(time.time())
+        if config.metrics_textfile:
+            metrics.write_textfile(config.metrics_textfile)
+
+
+@contextmanager
+def _stage(stage: str, interface: str) -> Iterator[None]:
+    """记录一个阶段的耗时（指标和 --trace）"""
+    with trace.span(stage, interface=interface), metrics.stage_seconds.time(
+        stage=stage, interface=interface
+    ):
+        yield
+
+
+def _run_cycle(
+    config: RunContext,
+    only: Targets | None,
+    schedule: Schedule | None,
+) -> bool:
+    interfaces = config.interfaces
+    if only is not None:
+        interfaces = [interface for interface in interfaces if interface in only]
+        due = None
+    else:
+        due = schedule
+
     logger.output(f"Checking {len(interfaces)} interfaces: {', '.join(interfaces)}")
 
-    ok = True
-    for interface in interfaces:
+    with _stage("runtime", ALL):
+        snapshot = get_runtime_snapshot(interfaces)
+
+    # 很多 peer 使用同一个 hostname，每个只解析一次，并且同时进行
+    hostnames = plan_hostnames(interfaces, snapshot, only, due)
+    answers = {}
+    if hostnames:
+        with _stage("resolve", ALL):
+            answers = resolve_many(hostnames, config.resolvers)
+
+    # 每个接口的日志单独收集，按接口顺序整段输出，避免并发时交错
+    with ThreadPoolExecutor(
+        max_workers=config.jobs, thread_name_prefix="interface"
+    ) as pool:
+        futures = [
+            pool.submit(
+                _check_interface_captured,
+                interface,
+                config,
+                snapshot,
+                answers,
+                only.get(interface) if only else None,
+                due,
+                schedule,
+            )
+            for interface in interfaces
+        ]
+
+        ok = True
+        for future in futures:
+            _ok, lines, error = future.result()
+            logger.replay(lines)
+            if error:
+                raise error
+            ok = ok and _ok
+
+    save_cache()
+    peer_state.save()
+    get_repository().save()
+    logger.output("")
+
+    return ok
+
+
+def plan_hostnames(
+    interfaces: list[str],
+    snapshot: RuntimeSnapshot,
+    only: Targets | None = None,
+    due: Schedule | None = None,
+) -> list[str]:
+    """收集本周期需要解析的 hostname（去重，保持首次出现的顺序）"""
+    hostnames: dict[str, None] = {}
+    now = time.time()
+    now_mono = time.monotonic()
+    # 配置中的问题在检查接口时才输出，这里忽略
+    with logger.capture():
+        for interface in interfaces:
+            cfg = get_static_interface(interface)
+            device = snapshot.get(interface)
+            if not cfg or not device:
+                continue
+
+            skip_within = cfg.skip_if_handshake_within()
+            wanted = only.get(interface) if only else None
+            for peer in device.peers:
+                cfg_peer = cfg.get_peer_by_public_key(peer.PublicKey)
+                if cfg_peer is None:
+                    continue
+                endpoint = cfg_peer.endpoint()
+                if endpoint is None or not endpoint.is_hostname:
+                    continue
+                if wanted is not None and endpoint.addr not in wanted:
+                    continue
+                if due and not due.is_due(interface, peer.PublicKey, now_mono):
+                    continue
+                handshake = peer.latest_handshake()
+                if skip_within is not None and handshake and now - handshake < skip_within:
+                    continue
+                hostnames.setdefault(endpoint.addr)
+
+    return list(hostnames)
+
+
+def _check_interface_captured(
+    interface: str,
+    config: RunContext,
+    snapshot: RuntimeSnapshot,
+    answers: dict[str, list[str]],
+    hostnames: set[str] | None,
+    due: Schedule | None,
+    schedule: Schedule | None,
+):
+    with logger.capture() as lines:
         logger.output("")
         logger.output(f"Checking interface {interface}:")
         with logger.indent():
-            _ok = check_interface(interface, config)
-            ok = ok and _ok
+            try:
+                with trace.span("interface", interface=interface):
+                    result = check_interface(
+                        interface, config, snapshot, answers, hostnames, due, schedule
+                    )
+                return result, lines, None
+            except BaseException as e:  # 包括 fatal() 的 SystemExit，交给调用者按顺序输出后再抛出
+                return None, lines, e
 
-    logger.output("")
 
-    sys.exit(0 if ok else 1)
+_peer_pool: ThreadPoolExecutor | None = None
+_peer_pool_lock = threading.Lock()
+
+
+def _get_peer_pool(config: RunContext) -> ThreadPoolExecutor:
+    # 接口和 peer 使用不同的线程池，接口任务等待 peer 任务时不会死锁
+    global _peer_pool
+    with _peer_pool_lock:
+        if _peer_pool is None:
+            _peer_pool = ThreadPoolExecutor(
+                max_workers=config.jobs, thread_name_prefix="peer"
+            )
+        return _peer_pool
+
+
+_MODE_NAMES = {"update": "command set", "sync": "syncconf", "restart": "restart"}
+# DNS 回答没有变化时，多久之后才重新探测当前地址是否仍然最快（SwitchMargin）
+REPROBE_AFTER = 600
+
+
+class InterfacePolicy:
+    """接口级别的行为设置（来自配置文件中的注释扩展键）"""
+
+    def __init__(self, cfg: GlobalConfig):
+        logger.output(f"OnChange is '{cfg.OnChange}'")
+        # update: 只修改 endpoint；sync: 像 wg syncconf 一样按配置文件同步；restart: 重启 wg-quick
+        self.mode = "update"
+        if cfg.OnChange in ("restart", "sync"):
+            self.mode = cfg.OnChange
+        elif cfg.OnChange != "update" and cfg.OnChange != "":
+            logger.output(f"OnChange '{cfg.OnChange}' is invalid")
+        logger.output(f"Updating endpoints by {_MODE_NAMES[self.mode]}.")
+
+        self.skip_within = cfg.skip_if_handshake_within()
+        if self.skip_within is not None:
+            logger.output(
+                f"Skipping peers with handshake in last {self.skip_within:.0f}s."
+            )
+
+        self.verify_window = cfg.verify_handshake()
+        if self.verify_window is not None:
+            if self.mode == "update":
+                logger.output(
+                    f"Verifying new endpoints by handshake within {self.verify_window:.0f}s."
+                )
+            else:
+                logger.output(f"VerifyHandshake is ignored as OnChange is '{self.mode}'")
+                self.verify_window = None
+
+        # 轮询 / geo DNS 的地址阻尼：只在当前地址失效或者明显更差时切换
+        self.min_dwell = cfg.min_dwell()
+        self.switch_margin = cfg.switch_margin()
+        self.damping = self.min_dwell is not None or self.switch_margin is not None
+        if self.damping and self.mode == "restart":
+            logger.output(f"SwitchMargin and MinDwell are ignored as OnChange is 'restart'")
+            self.damping = False
+        if self.damping:
+            logger.output(
+                f"Damping endpoint changes: margin {_describe_margin(self.switch_margin)}, "
+                f"minimum dwell {self.min_dwell or 0:.0f}s."
+            )
+
+    def is_better(self, current_rtt: float, new_rtt: float) -> bool:
+        """新地址的 RTT 是否比当前地址好出 SwitchMargin"""
+        if self.switch_margin is None:
+            return False
+        margin, relative = self.switch_margin
+        if relative:
+            return new_rtt < current_rtt * (1 - margin)
+        return new_rtt < current_rtt - margin
+
 
+def _describe_margin(margin: tuple[float, bool] | None) -> str:
+    if margin is None:
+        return "none"
+    value, relative = margin
+    return f"{value * 100:.0f}%" if relative else f"{value * 1000:.0f}ms"
 
-def check_interface(interface: str, config: RunContext):
-    cfg = get_static_interface(interface)
+
+class PeerResult:
+    def __init__(
+        self,
+        changed: bool = False,
+        errored: bool = False,
+        endpoint: str | None = None,
+        applied: str | None = None,
+    ):
+        self.changed = changed
+        self.errored = errored
+        # 需要在应用阶段设置的新 endpoint（已经设置过的为 None）
+        self.endpoint = endpoint
+        # failover 已经设置的、或者重启后将使用的 endpoint，只用于记录状态，应用阶段不处理
+        self.applied = applied
+        # 本次解析到的地址（没有解析时为 None）
+        self.addresses: list[str] | None = None
+
+
+def check_interface(
+    interface: str,
+    config: RunContext,
+    snapshot: RuntimeSnapshot,
+    answers: dict[str, list[str]] | None = None,
+    hostnames: set[str] | None = None,
+    due: Schedule | None = None,
+    schedule: Schedule | None = None,
+):
+    """
+    hostnames 不为 None 时，只检查 endpoint 是这些 hostname 的 peer；
+    due 不为 None 时，只检查按计划到期的 peer；检查结果记录到 schedule 中
+    """
+    with _stage("config", interface):
+        cfg = get_static_interface(interface)
     if not cfg:
         raise RuntimeError(f"Interface config file {interface} does not exist.")
 
-    device = get_runtime_interface(interface)
+    device = snapshot.get(interface)
 
     if not device:
         logger.output(f"Not exist: starting service and ignoring.")
@@ -46,86 +327,405 @@ def check_interface(interface: str, config: RunContext):
         logger.output(f"No peers configured, skipping.")
         return
 
-    logger.output(f"OnChange is '{cfg.OnChange}'")
-    update_by_set = True
-    if cfg.OnChange == "restart":
-        update_by_set = False
-    elif cfg.OnChange != "update" and cfg.OnChange != "":
-        logger.output(f"OnChange '{cfg.OnChange}' is invalid")
-    logger.output(
-        f"Updating endpoints by {'command set' if update_by_set else 'restart'}."
-    )
+    metrics.handshake_age.clear(interface=interface)
+    for peer in device.peers:
+        if peer.latest_handshake():
+            metrics.handshake_age.set(
+                time.time() - peer.latest_handshake(), interface=interface, peer=peer.PublicKey
+            )
 
-    something_changed = False
-    something_errored = False
+    policy = InterfacePolicy(cfg)
+    pool = _get_peer_pool(config)
+    indent = logger.current_indent()
+    now = time.monotonic()
+    tasks = []
+    deferred: list[str] = []
     for peer in device.peers:
         cfg_peer = cfg.get_peer_by_public_key(peer.PublicKey)
         if cfg_peer is None:
             logger.output(f"Peer {peer.PublicKey} not found in config, ignoring.")
             continue
+        if hostnames is not None:
+            endpoint = cfg_peer.endpoint()
+            if endpoint is None or endpoint.addr not in hostnames:
+                continue
+        if due and not due.is_due(interface, peer.PublicKey, now):
+            deferred.append(peer.PublicKey)
+            continue
 
-        logger.output(f"Peer: {peer.PublicKey}")
-        with logger.indent():
-            # logger.output(f"Checking peer {peer.asdict()} // TODO")
-            # logger.output(f"config peer {cfg_peer.asdict()} // TODO")
+        tasks.append(
+            (
+                peer,
+                pool.submit(
+                    _check_peer_captured,
+                    indent,
+                    interface,
+                    peer,
+                    cfg_peer,
+                    config,
+                    policy,
+                    answers or {},
+                ),
+            )
+        )
+    if deferred:
+        recording.record("deferred", i=interface, peers=deferred)
 
-            correct_endpoint = cfg_peer.endpoint()
-            if correct_endpoint is None:
-                logger.output(f"Endpoint is passive, ignoring.")
-                continue
+    results: list[PeerResult] = []
+    endpoints: dict[str, str] = {}
+    for peer, task in tasks:
+        public_key = peer.PublicKey
+        result, lines, error = task.result()
+        logger.replay(lines)
+        if isinstance(error, _WG_ERRORS):
+            # failover 中修改这个 peer 失败，不影响其他 peer
+            with logger.indent():
+                logger.error(f"Failed to update peer {public_key}: {_describe_error(error)}")
+            metrics.apply_failures.inc(interface=interface)
+            result = PeerResult(errored=True)
+        elif error:
+            raise error
+        results.append(result)
+        if result.endpoint:
+            endpoints[public_key] = result.endpoint
+        if result.addresses is not None or result.errored:
+            peer_state.record_check(
+                interface,
+                public_key,
+                result.addresses,
+                result.endpoint or result.applied or peer.Endpoint,
+                result.errored,
+            )
+        if schedule:
+            wait = schedule.record(
+                interface, public_key, result.changed or result.errored, time.monotonic()
+            )
+            with logger.indent():
+                logger.output(f"Next check in {wait:.0f}s")
 
-            if not correct_endpoint.is_hostname:
-                logger.output(f"Endpoint is connected to an IP address, ignoring.")
-                continue
+    something_changed = any(r.changed for r in results)
+    something_errored = any(r.errored for r in results)
+
+    logger.output(
+        f"{len(results)} peers checked, "
+        f"{sum(r.changed for r in results)} changed, "
+        f"{sum(r.errored for r in results)} errored"
+        + (f", {len(deferred)} not due yet." if deferred else ".")
+    )
 
-            current_endpoint = peer.endpoint()
+    if something_changed:
+        metrics.endpoint_changes.inc(sum(r.changed for r in results), interface=interface)
+    applied = True
+    if endpoints or (something_changed and policy.mode == "restart"):
+        with _stage("apply", interface):
+            applied = _apply(interface, cfg, device, endpoints, policy)
 
-            if not current_endpoint:
-                logger.warning(f"Endpoint is never connected.")
-                current_endpoint = Endpoint("0.0.0.0:0")
+    return applied and not something_errored
 
-            if current_endpoint.is_hostname:
-                logger.explode(f"peer.endpoint_host is a string!")
-            
-            logger.output(f"Resolving hostname '{correct_endpoint.addr}' with resolver '{config.resolver}'")
-            correct_address = resolve(correct_endpoint.addr, config.resolver)
 
-            if correct_address is None or len(correct_address) == 0:
-                logger.error(f"  → Failed to resolve!")
-                something_errored = True
-                continue
+def _apply(
+    interface: str,
+    cfg: GlobalConfig,
+    device: RuntimeConfig,
+    endpoints: dict[str, str],
+    policy: InterfacePolicy,
+) -> bool:
+    """把所有 peer 的修改一次性应用到接口，失败时只影响这个接口，返回 False"""
+    if policy.mode == "restart":
+        logger.output(f"Restarting interface as OnChange is 'restart'")
+        cross_platform_start_service(interface, nonce="restart")
+        return True
+
+    current: dict[str, str] = {}
+    if policy.mode == "sync":
+        # 配置文件中的 hostname 会被 wg 自己解析，其他 peer 保持当前的 endpoint
+        for peer in device.peers:
+            cfg_peer = cfg.get_peer_by_public_key(peer.PublicKey)
+            endpoint = cfg_peer.endpoint() if cfg_peer else None
+            if endpoint and endpoint.is_hostname and peer.Endpoint:
+                current[peer.PublicKey] = peer.Endpoint
+        logger.output(f"Syncing interface with {len(endpoints)} new endpoints")
+    else:
+        logger.output(f"Updating {len(endpoints)} endpoints")
+
+    try:
+        if policy.mode == "sync":
+            sync_interface(interface, current | endpoints)
+        else:
+            set_peer_addresses(interface, endpoints)
+    except _WG_ERRORS as e:
+        logger.error(f"Failed to apply changes: {_describe_error(e)}")
+        metrics.apply_failures.inc(interface=interface)
+        return False
+    return True
+
 
+# wg 命令或者 netlink 修改接口失败（netlink 的错误是 OSError）
+_WG_ERRORS = (subprocess.CalledProcessError, OSError)
+
+
+def _describe_error(error: BaseException) -> str:
+    if isinstance(error, subprocess.CalledProcessError):
+        return (error.stderr or error.stdout or "").strip() or str(error)
+    return str(error)
+
+
+def _check_peer_captured(indent: str, interface: str, peer: RuntimePeerConfig, *args):
+    with logger.capture(indent) as lines:
+        try:
+            with trace.span("peer", interface=interface, peer=peer.PublicKey), recording.peer(
+                interface, peer.PublicKey
+            ):
+                return check_peer(interface, peer, *args), lines, None
+        except BaseException as e:
+            return None, lines, e
+
+
+def check_peer(
+    interface: str,
+    peer: RuntimePeerConfig,
+    cfg_peer: PeerConfig,
+    config: RunContext,
+    policy: InterfacePolicy,
+    answers: dict[str, list[str]],
+) -> PeerResult:
+    logger.output(f"Peer: {peer.PublicKey}")
+    with logger.indent():
+        # logger.output(f"Checking peer {peer.asdict()} // TODO")
+        # logger.output(f"config peer {cfg_peer.asdict()} // TODO")
+
+        correct_endpoint = cfg_peer.endpoint()
+        if correct_endpoint is None:
+            logger.output(f"Endpoint is passive, ignoring.")
+            return PeerResult()
+
+        if not correct_endpoint.is_hostname:
+            logger.output(f"Endpoint is connected to an IP address, ignoring.")
+            return PeerResult()
+
+        handshake = peer.latest_handshake()
+        if policy.skip_within is not None and handshake:
+            age = time.time() - handshake
+            if age < policy.skip_within:
+                logger.output(f"Latest handshake {age:.0f}s ago, healthy, skipping.")
+                return PeerResult()
+            logger.output(f"Latest handshake {age:.0f}s ago, checking.")
+
+        current_endpoint = peer.endpoint()
+
+        if not current_endpoint:
+            logger.warning(f"Endpoint is never connected.")
+            current_endpoint = Endpoint("0.0.0.0:0")
+
+        if current_endpoint.is_hostname:
+            logger.explode(f"peer.endpoint_host is a string!")
+
+        correct_address = answers.get(correct_endpoint.addr)
+        if correct_address is not None:
+            logger.output(f"Hostname '{correct_endpoint.addr}' resolved in this cycle")
+        else:
             logger.output(
-                f"  → {len(correct_address)} addresses: {', '.join(correct_address)}"
+                f"Resolving hostname '{correct_endpoint.addr}' with resolver '{','.join(config.resolvers)}'"
             )
+            with _stage("resolve", interface):
+                correct_address = resolve(correct_endpoint.addr, config.resolvers)
 
-            if current_endpoint.addr in correct_address and correct_endpoint.port == current_endpoint.port:
-                logger.output(f"Current endpoint is correct, no action needed.")
-                continue
+        if correct_address is None or len(correct_address) == 0:
+            metrics.resolve_failures.inc(interface=interface)
+            logger.error(f"  → Failed to resolve!")
+            return PeerResult(errored=True)
 
-            if len(correct_address) > 1:
-                logger.output(
-                    "Multiple addresses founded, pinging to find the best one..."
-                )
-                working_address = ping_each_ip(correct_address)
-                if not working_address:
-                    logger.error(f"No peer responded to ping!")
-                    something_errored = True
-                    continue
-                logger.output(f"  * {working_address}")
-            else:
-                working_address = correct_address[0]
+        logger.output(
+            f"  → {len(correct_address)} addresses: {', '.join(correct_address)}"
+        )
 
-            assert working_address is not None
+        result = _choose(
+            interface, peer, current_endpoint, correct_endpoint, correct_address, config, policy
+        )
+        result.addresses = correct_address
+        return result
 
-            if update_by_set:
-                new_endpoint = f"{working_address}:{correct_endpoint.port}"
-                logger.output(f"Updating endpoint to {new_endpoint}")
-                set_peer_address(interface, peer.PublicKey, new_endpoint)
-            something_changed = True
 
-    if something_changed and not update_by_set:
-        logger.output(f"Restarting interface as OnChange is 'restart'")
-        cross_platform_start_service(interface, nonce="restart")
+def _choose(
+    interface: str,
+    peer: RuntimePeerConfig,
+    current_endpoint: Endpoint,
+    correct_endpoint: Endpoint,
+    correct_address: list[str],
+    config: RunContext,
+    policy: InterfacePolicy,
+) -> PeerResult:
+    """在解析到的地址中决定 peer 应该使用哪一个"""
+    probed: list[tuple[str, float]] | None = None
+    if policy.damping and correct_endpoint.port == current_endpoint.port:
+        result, probed = _damp(
+            interface, peer, current_endpoint, correct_address, config, policy
+        )
+        if result is not None:
+            return result
+    elif (
+        current_endpoint.addr in correct_address
+        and correct_endpoint.port == current_endpoint.port
+    ):
+        logger.output(f"Current endpoint is correct, no action needed.")
+        return PeerResult()
+
+    candidates = correct_address
+    rtts: dict[str, float] = {}
+    if len(correct_address) > 1:
+        if probed is not None:
+            reachable = probed
+        else:
+            logger.output(
+                f"Multiple addresses founded, probing ({config.probe}) to find the best one..."
+            )
+            reachable = _probe(interface, correct_address, config)
+            for address, rtt in reachable:
+                logger.output(f"  * {address} ({rtt * 1000:.1f}ms)")
+        rtts = dict(reachable)
+
+        if policy.verify_window is not None:
+            # 屏蔽 ICMP 的地址也要尝试，只是排在后面
+            candidates = [a for a, _ in reachable]
+            candidates += [a for a in correct_address if a not in candidates]
+        elif not reachable:
+            logger.error(f"No peer responded to probe!")
+            return PeerResult(errored=True)
+        else:
+            candidates = [reachable[0][0]]
+
+    if policy.verify_window is not None:
+        return _failover(interface, peer, candidates, correct_endpoint, policy, rtts)
+
+    working_address = candidates[0]
+
+    if policy.mode == "restart":
+        return PeerResult(
+            changed=True, applied=Endpoint.format(working_address, correct_endpoint.port)
+        )
+
+    peer_state.record_choice(
+        interface, peer.PublicKey, working_address, rtts.get(working_address)
+    )
+    new_endpoint = Endpoint.format(working_address, correct_endpoint.port)
+    logger.output(f"New endpoint is {new_endpoint}")
+    return PeerResult(changed=True, endpoint=new_endpoint)
+
+
+def _probe(interface: str, addresses: list[str], config: RunContext) -> list[tuple[str, float]]:
+    with _stage("probe", interface):
+        reachable = probe_addresses(addresses, config.probe, config.probe_timeout)
+    if not reachable:
+        metrics.probe_failures.inc(interface=interface)
+    return reachable
+
+
+def _damp(
+    interface: str,
+    peer: RuntimePeerConfig,
+    current_endpoint: Endpoint,
+    addresses: list[str],
+    config: RunContext,
+    policy: InterfacePolicy,
+) -> tuple[PeerResult | None, list[tuple[str, float]] | None]:
+    """
+    决定是否保留当前地址，返回 (保留时的结果，需要切换时为 None, 已经探测过的所有地址)
+
+    - 选定不到 MinDwell 的地址只要还有回应就保留，即使它暂时不在 DNS 回答中
+    - 当前地址在 DNS 回答中时，只在它没有回应或者其他地址的 RTT 好出 SwitchMargin 时切换
+    """
+    current = current_endpoint.addr
+    choice = peer_state.last_choice(interface, peer.PublicKey)
+    dwell = None
+    if choice is not None and choice[0] == current:
+        dwell = time.time() - choice[2]
+    in_dwell = dwell is not None and policy.min_dwell is not None and dwell < policy.min_dwell
+
+    if current not in addresses:
+        if not in_dwell:
+            return None, None
+        if not _probe(interface, [current], config):
+            logger.output(f"Current endpoint is gone from DNS answer and not responding.")
+            return None, None
+        logger.output(
+            f"Current endpoint is gone from DNS answer but still responding, "
+            f"keeping it ({dwell:.0f}s of {policy.min_dwell:.0f}s dwell)."
+        )
+        return PeerResult(), None
+
+    if in_dwell:
+        logger.output(
+            f"Current endpoint is correct, chosen {dwell:.0f}s ago "
+            f"(dwell {policy.min_dwell:.0f}s), no action needed."
+        )
+        return PeerResult(), None
+    if policy.switch_margin is None or len(addresses) == 1:
+        logger.output(f"Current endpoint is correct, no action needed.")
+        return PeerResult(), None
+
+    unchanged = peer_state.probed_since(interface, peer.PublicKey, current, addresses)
+    if unchanged is not None and unchanged < REPROBE_AFTER:
+        logger.output(
+            f"Current endpoint is correct, DNS answer unchanged since probed {unchanged:.0f}s ago, "
+            "no action needed."
+        )
+        return PeerResult(), None
+
+    logger.output(f"Current endpoint is correct, probing ({config.probe}) for a better one...")
+    reachable = _probe(interface, addresses, config)
+    for address, rtt in reachable:
+        logger.output(f"  * {address} ({rtt * 1000:.1f}ms)")
+    rtts = dict(reachable)
+    current_rtt = rtts.get(current)
+
+    if current_rtt is None:
+        if not reachable:
+            logger.warning(f"No address responded to probe, keeping current endpoint.")
+            return PeerResult(), reachable
+        logger.output(f"Current endpoint did not respond.")
+        return None, reachable
+
+    best, best_rtt = reachable[0]
+    if best != current and policy.is_better(current_rtt, best_rtt):
+        logger.output(
+            f"{best} is faster than current endpoint "
+            f"({best_rtt * 1000:.1f}ms < {current_rtt * 1000:.1f}ms)."
+        )
+        return None, reachable
+
+    peer_state.record_choice(interface, peer.PublicKey, current, current_rtt, keep=True)
+    logger.output(
+        f"Keeping current endpoint ({current_rtt * 1000:.1f}ms, "
+        f"best {best_rtt * 1000:.1f}ms)."
+    )
+    return PeerResult(), reachable
+
+
+def _failover(
+    interface: str,
+    peer: RuntimePeerConfig,
+    candidates: list[str],
+    correct_endpoint: Endpoint,
+    policy: InterfacePolicy,
+    rtts: dict[str, float],
+) -> PeerResult:
+    assert policy.verify_window is not None
+
+    # 上次确认可用的地址优先
+    known = peer_state.known_good(interface, peer.PublicKey)
+    if known in candidates:
+        candidates = [known] + [a for a in candidates if a != known]
+
+    endpoint = failover(
+        interface, peer, candidates, correct_endpoint.port, policy.verify_window
+    )
+    if endpoint is None:
+        fallback = Endpoint.format(candidates[0], correct_endpoint.port)
+        logger.error(f"No address completed a handshake, leaving endpoint at {fallback}")
+        set_peer_address(interface, peer.PublicKey, fallback)
+        return PeerResult(changed=True, errored=True, applied=fallback)
 
-    return not something_errored
+    address = Endpoint(endpoint).addr
+    peer_state.record_good(interface, peer.PublicKey, address)
+    peer_state.record_choice(interface, peer.PublicKey, address, rtts.get(address))
+    return PeerResult(changed=True, applied=endpoint)
@@ -0,0 +1,234 @@
+"""
+记录每个 peer 的状态，oneshot 运行之间也能延续
+
+- 当前状态（endpoints.json）：上一次确认可用（收到握手）的地址、选定的地址和 RTT、
+  最近一次解析到的地址、endpoint 最后变化的时间、连续失败的次数
+- 变化历史（history.jsonl）：解析结果、endpoint 或者失败状态变化时追加一行，
+  文件超过 HISTORY_MAX_SIZE 时丢弃最旧的一半
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from collections.abc import Iterator
+
+from ..common.state import load_json, save_json, state_file
+
+STATE_FILE = "endpoints.json"
+HISTORY_FILE = "history.jsonl"
+# 大约 10 万条记录
+HISTORY_MAX_SIZE = 16 << 20
+
+_lock = threading.Lock()
+_state: dict[str, dict[str, dict]] | None = None
+_dirty = False
+_pending: list[dict] = []
+
+
+def _load() -> dict[str, dict[str, dict]]:
+    global _state
+    if _state is None:
+        data = load_json(STATE_FILE)
+        _state = data if isinstance(data, dict) else {}
+    return _state
+
+
+def _record(interface: str, public_key: str) -> dict:
+    return _load().setdefault(interface, {}).setdefault(public_key, {})
+
+
+def known_good(interface: str, public_key: str) -> str | None:
+    with _lock:
+        record = _load().get(interface, {}).get(public_key)
+    return record.get("address") if record else None
+
+
+def record_good(interface: str, public_key: str, address: str):
+    global _dirty
+    with _lock:
+        record = _record(interface, public_key)
+        record["address"] = address
+        record["verified"] = int(time.time())
+        _dirty = True
+
+
+def last_choice(interface: str, public_key: str) -> tuple[str, float | None, float] | None:
+    """上一次选定的 (地址, RTT 秒, 选定的 unix 时间)，没有记录时返回 None"""
+    with _lock:
+        record = _load().get(interface, {}).get(public_key)
+        if not record or "chosen" not in record:
+            return None
+        return record["chosen"], record.get("rtt"), record.get("since", 0)
+
+
+def record_choice(
+    interface: str, public_key: str, address: str, rtt: float | None, keep: bool = False
+):
+    """
+    记录选定的地址
+
+    keep 为真时表示继续使用当前地址，只更新 RTT；不是由这里选定的地址不知道从什么时候开始使用，不受 MinDwell 限制
+    """
+    global _dirty
+    with _lock:
+        record = _record(interface, public_key)
+        now = int(time.time())
+        if record.get("chosen") != address:
+            record["chosen"] = address
+            record["since"] = 0 if keep else now
+        elif not keep:
+            record["since"] = now
+        record["rtt"] = None if rtt is None else round(rtt, 4)
+        if rtt is not None:
+            record["probed"] = now
+        _dirty = True
+
+
+def probed_since(
+    interface: str, public_key: str, address: str, resolved: list[str]
+) -> float | None:
+    """
+    address 是选定的地址、上次检查解析到的地址和 resolved 相同、并且之后探测过 RTT 时，返回距离探测的秒数；
+    否则返回 None
+    """
+    with _lock:
+        record = _load().get(interface, {}).get(public_key)
+        if (
+            not record
+            or record.get("chosen") != address
+            or record.get("resolved") != sorted(resolved)
+            or "probed" not in record
+        ):
+            return None
+        return time.time() - record["probed"]
+
+
+def record_check(
+    interface: str,
+    public_key: str,
+    resolved: list[str] | None,
+    endpoint: str | None,
+    errored: bool,
+):
+    """记录一次检查的结果；解析结果、endpoint 或者失败状态变化时追加到历史"""
+    global _dirty
+    with _lock:
+        record = _record(interface, public_key)
+        now = int(time.time())
+        endpoint = endpoint or None
+        failures = record.get("failures", 0) + 1 if errored else 0
+        changed = False
+
+        if resolved is not None and record.get("resolved") != sorted(resolved):
+            record["resolved"] = sorted(resolved)
+            changed = True
+        if endpoint != record.get("endpoint"):
+            record["endpoint"] = endpoint
+            record["changed"] = now
+            changed = True
+        if (failures > 0) != (record.get("failures", 0) > 0):
+            changed = True
+        record["failures"] = failures
+        record["checked"] = now
+        _dirty = True
+
+        if changed:
+            _pending.append(
+                {
+                    "time": now,
+                    "interface": interface,
+                    "peer": public_key,
+                    "resolved": record.get("resolved"),
+                    "endpoint": endpoint,
+                    "rtt": record.get("rtt") if record.get("chosen") == _address(endpoint) else None,
+                    "failures": failures,
+                }
+            )
+
+
+def _address(endpoint: str | None) -> str | None:
+    if not endpoint:
+        return None
+    address = endpoint.rpartition(":")[0]
+    return address[1:-1] if address.startswith("[") else address
+
+
+def save():
+    global _dirty, _pending
+    with _lock:
+        pending, _pending = _pending, []
+        data = _state if _dirty else None
+        _dirty = False
+    if data is not None:
+        save_json(STATE_FILE, data)
+    if pending:
+        _append_history(pending)
+
+
+def _append_history(records: list[dict]):
+    file = state_file(HISTORY_FILE)
+    text = "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in records)
+    try:
+        file.parent.mkdir(parents=True, exist_ok=True)
+        # 一次 write 追加所有记录，进程被中断时最多丢失最后一行
+        fd = os.open(file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, text.encode())
+            size = os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+        if size > HISTORY_MAX_SIZE:
+            _compact()
+    except OSError:
+        return  # save_json 已经警告过状态目录不可写
+
+
+def _compact():
+    """只保留较新的一半"""
+    file = state_file(HISTORY_FILE)
+    temp = file.with_name(f".{file.name}.tmp")
+    with open(file, "rb") as f:
+        f.seek(-HISTORY_MAX_SIZE // 2, os.SEEK_END)
+        f.readline()  # 跳过不完整的一行
+        temp.write_bytes(f.read())
+    os.replace(temp, file)
+
+
+def history(interfaces: list[str] | None = None) -> Iterator[dict]:
+    """按时间顺序读取历史记录，损坏的行被跳过"""
+    try:
+        f = open(state_file(HISTORY_FILE), "rb")
+    except FileNotFoundError:
+        return
+    with f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(record, dict):
+                continue
+            if interfaces and record.get("interface") not in interfaces:
+                continue
+            yield record
+
+
+def print_history(interfaces: list[str] | None = None):
+    write = sys.stdout.write
+    try:
+        for record in history(interfaces):
+            when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record.get("time", 0)))
+            line = f"{when} {record.get('interface')} {str(record.get('peer'))[:8]}… "
+            line += record.get("endpoint") or "(none)"
+            if record.get("rtt") is not None:
+                line += f" ({record['rtt'] * 1000:.1f}ms)"
+            line += f" [{', '.join(record.get('resolved') or [])}]"
+            if record.get("failures"):
+                line += f" failing ({record['failures']})"
+            write(line + "\n")
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # 输出被 head 等命令提前关闭
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
@@ -0,0 +1,97 @@
+"""
+按 TTL 提前刷新 peer 的 hostname（常驻模式）
+
+记录快要过期时在后台重新查询，缓存一直保持新鲜，检查周期中不需要等待 DNS；
+查询结果变化时立即只重新检查使用这个 hostname 的 peer，不用等到下一个 --interval
+"""
+
+import asyncio
+import time
+from typing import Callable
+
+from ..common import logger
+from ..common.context import RunContext
+from ..wireguard import get_static_interface
+from .resolve import cache_expires, refresh, save_cache
+
+# 在过期前多久刷新
+LEAD = 2.0
+# 同一个 hostname 两次刷新之间至少间隔多久（TTL 很短的记录不会一直查询）
+MIN_INTERVAL = 5.0
+
+
+class Prefetcher:
+    def __init__(
+        self,
+        config: RunContext,
+        on_change: Callable[[dict[str, set[str]]], None],
+    ):
+        self.config = config
+        self.on_change = on_change
+        self._refreshed: dict[str, float] = {}
+
+    def _users(self) -> dict[str, set[str]]:
+        """{hostname: 使用它的接口}"""
+        users: dict[str, set[str]] = {}
+        # 配置中的问题在检查接口时才输出，这里忽略
+        with logger.capture():
+            for interface in self.config.interfaces:
+                cfg = get_static_interface(interface)
+                if not cfg:
+                    continue
+                for peer in cfg.peers:
+                    endpoint = peer.endpoint()
+                    if endpoint is not None and endpoint.is_hostname:
+                        users.setdefault(endpoint.addr, set()).add(interface)
+        return users
+
+    def _due(self, users: dict[str, set[str]]) -> tuple[list[str], float | None]:
+        """返回 (现在需要刷新的 hostname, 下一次需要刷新的时间)"""
+        now = time.time()
+        due: list[str] = []
+        next_at: float | None = None
+        for host in users:
+            expires = cache_expires(host, self.config.resolvers)
+            if expires is None:
+                continue  # 还没有查询过或者查询失败，交给检查周期
+            at = max(expires - LEAD, self._refreshed.get(host, 0) + MIN_INTERVAL)
+            if at <= now:
+                due.append(host)
+            elif next_at is None or at < next_at:
+                next_at = at
+        return due, next_at
+
+    async def run(self):
+        while True:
+            users = await asyncio.to_thread(self._users)
+            due, next_at = self._due(users)
+
+            if due:
+                now = time.time()
+                for host in due:
+                    self._refreshed[host] = now
+                try:
+                    changed = await asyncio.to_thread(
+                        refresh, due, self.config.resolvers
+                    )
+                    await asyncio.to_thread(save_cache)
+                except Exception as e:
+                    logger.error(f"Prefetch failed: {e}")
+                    changed = set()
+
+                targets: dict[str, set[str]] = {}
+                for host in sorted(changed):
+                    logger.output(
+                        f"DNS answer of '{host}' changed, re-checking {', '.join(sorted(users[host]))}"
+                    )
+                    for interface in users[host]:
+                        targets.setdefault(interface, set()).add(host)
+                if targets:
+                    self.on_change(targets)
+                continue
+
+            # 配置或者缓存可能在检查周期中变化，最多等待一个 interval 后重新计算
+            wait = self.config.interval
+            if next_at is not None:
+                wait = min(wait, next_at - time.time())
+            await asyncio.sleep(max(wait, 0.1))
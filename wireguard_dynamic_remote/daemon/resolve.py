@@ -1,10 +1,45 @@
+import asyncio
 import ipaddress
 import shutil
-import subprocess
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
-from ..common import logger
+from ..common import aio, logger
 from ..common.spawn import execute_capture
+from . import dns
+from .dns_cache import DnsCache
+from .upstream import UpstreamScores, race
+
+QTYPES = (dns.QTYPE_A, dns.QTYPE_AAAA)
+
+# 同时进行的原生查询数量 / 同时运行的 dig 进程数量
+_QUERY_CONCURRENCY = 64
+_FALLBACK_JOBS = 8
+
+_cache = DnsCache()
+_scores = UpstreamScores()
+
+
+def _merge(answers: dict[int, dns.Answer]) -> list[str]:
+    s: list[str] = []
+    for answer in answers.values():
+        for address in answer.addresses:
+            if address not in s:
+                s.append(address)
+    return s
+
+
+async def _query_many(hosts: list[str], servers: list[str]):
+    limit = asyncio.Semaphore(_QUERY_CONCURRENCY)
+
+    async def one(host: str):
+        async with limit:
+            try:
+                return await race(host, servers, QTYPES, _scores)
+            except dns.DnsError as e:
+                return e
+
+    return await asyncio.gather(*(one(host) for host in hosts))
 
 
 class Resolver:
@@ -13,11 +48,142 @@ class Resolver:
     def __init__(self) -> None:
         if sys.platform == "win32":
             self.pwsh = "pwsh" if shutil.which("pwsh") else "powershell.exe"
-            self.resolver = self.resolve_powershell
-            self.kind = f"{self.pwsh} Resolve-DnsName"
+            self.fallback = self.resolve_powershell
+            self.fallback_kind = f"{self.pwsh} Resolve-DnsName"
         else:
-            self.resolver = self.resolve_dig
-            self.kind = "dig"
+            self.fallback = self.resolve_dig
+            self.fallback_kind = "dig"
+
+        self.kind = "native"
+
+    def resolver(self, host: str, resolvers: list[str] | None = None) -> list[str]:
+        servers = resolvers or dns.system_nameservers()
+        if servers:
+            # 缓存以用户指定的 resolver 区分，空字符串表示系统默认
+            cache_key = _cache_key(resolvers)
+            cached = _cache.lookup(host, cache_key, QTYPES)
+            if cached is not None:
+                self.kind = "cache"
+                return cached
+
+            try:
+                return self.resolve_native(host, servers, cache_key)
+            except dns.DnsError as e:
+                return self.recover(host, resolvers, e)
+        self.kind = self.fallback_kind
+        return self.fallback(host, None)
+
+    def recover(
+        self, host: str, resolvers: list[str] | None, error: Exception
+    ) -> list[str]:
+        """原生查询失败后：先用过期的缓存，没有的话用 dig 等外部命令"""
+        stale = _cache.lookup(host, _cache_key(resolvers), QTYPES, stale=True)
+        if stale is not None:
+            logger.warning(f"Resolver failed ({error}), using stale cached answer for '{host}'")
+            self.kind = "stale cache"
+            return stale
+        # 外部命令只使用评分最好的一个普通服务器；只有加密服务器时不回退，以免查询被明文发出
+        plain = [server for server in resolvers or [] if not dns.is_encrypted(server)]
+        if (resolvers and not plain) or not dns.get_transport().allow_fallback:
+            raise error
+        logger.warning(f"Native resolver failed ({error}), using {self.fallback_kind}")
+        self.kind = self.fallback_kind
+        return self.fallback(host, _scores.order(plain)[0] if plain else None)
+
+    def resolve_native(self, host: str, servers: list[str], cache_key: str) -> list[str]:
+        server, answers = aio.run(race(host, servers, QTYPES, _scores))
+        self.kind = f"native ({server})"
+        _cache.store(host, cache_key, answers)
+        return _merge(answers)
+
+    def resolve_many(
+        self, hosts: list[str], resolvers: list[str] | None = None
+    ) -> dict[str, list[str]]:
+        """
+        一次解析多个 hostname，返回 {hostname: 地址列表}
+
+        缓存命中的直接返回，其余的在后台事件循环中同时查询；失败的再逐个走 recover()
+        解析出错的 hostname 对应空列表
+        """
+        servers = resolvers or dns.system_nameservers()
+        cache_key = _cache_key(resolvers)
+        results: dict[str, list[str]] = {}
+        pending: list[str] = []
+        for host in hosts:
+            cached = _cache.lookup(host, cache_key, QTYPES) if servers else None
+            if cached is not None:
+                results[host] = cached
+            else:
+                pending.append(host)
+        cached_count = len(results)
+
+        # 值为 None 表示没有可用的 nameserver，直接使用外部命令
+        failed: dict[str, Exception | None] = {}
+        if servers and pending:
+            answers = aio.run(_query_many(pending, servers))
+            for host, answer in zip(pending, answers):
+                if isinstance(answer, dns.DnsError):
+                    failed[host] = answer
+                else:
+                    _cache.store(host, cache_key, answer[1])
+                    results[host] = _merge(answer[1])
+        else:
+            failed = {host: None for host in pending}
+
+        if failed:
+            # 外部命令也可以同时运行
+            with ThreadPoolExecutor(
+                max_workers=min(len(failed), _FALLBACK_JOBS),
+                thread_name_prefix="resolve",
+            ) as pool:
+                futures = {
+                    host: pool.submit(self._recover_safe, host, resolvers, error)
+                    for host, error in failed.items()
+                }
+                for host, future in futures.items():
+                    results[host] = future.result()
+
+        logger.output(
+            f"Resolved {len(hosts)} hostnames: {cached_count} cached, "
+            f"{len(pending) - len(failed)} queried, {len(failed)} retried"
+        )
+        if len(servers) > 1 and pending:
+            logger.output(f"Resolvers: {_scores.summary(_scores.order(servers))}")
+        return results
+
+    def refresh(self, hosts: list[str], resolvers: list[str] | None = None) -> set[str]:
+        """
+        不管缓存是否过期，重新查询这些 hostname 并更新缓存
+
+        返回地址集合发生变化的 hostname；查询失败的保留原来的缓存，不算变化
+        """
+        servers = resolvers or dns.system_nameservers()
+        if not servers:
+            return set()
+
+        cache_key = _cache_key(resolvers)
+        before = {host: _cache.lookup(host, cache_key, QTYPES, stale=True) for host in hosts}
+        answers = aio.run(_query_many(hosts, servers))
+
+        changed = set()
+        for host, answer in zip(hosts, answers):
+            if isinstance(answer, dns.DnsError):
+                continue
+            _cache.store(host, cache_key, answer[1])
+            if set(_merge(answer[1])) != set(before[host] or []):
+                changed.add(host)
+        return changed
+
+    def _recover_safe(
+        self, host: str, resolvers: list[str] | None, error: Exception | None
+    ):
+        try:
+            if error is None:
+                return self.fallback(host, None)
+            return self.recover(host, resolvers, error)
+        except Exception as e:
+            logger.error(f"Failed to resolve '{host}': {e}")
+            return []
 
     def resolve_powershell(self, host: str, resolver: str | None = None):
         cmd = [
@@ -44,7 +210,8 @@ class Resolver:
             "+short",
         ]
         if resolver:
-            cmd.append(f"@{resolver}")
+            server, port = dns.parse_server(resolver)
+            cmd.extend([f"@{server}", "-p", str(port)])
         cmd.extend([host, "A", host, "AAAA"])
 
         p = execute_capture(cmd, error="ignore")
@@ -70,13 +237,51 @@ class Resolver:
             return False
 
 
-def resolve(host: str, resolver: str | None = None):
-    resolver_instance = Resolver()
-    addresses = resolver_instance.resolver(host, resolver)
+_resolver_instance: Resolver | None = None
+
+
+def _cache_key(resolvers: list[str] | None) -> str:
+    return ",".join(resolvers or [])
+
+
+def use_resolver(resolver: Resolver):
+    """替换解析的实现（--record / replay）"""
+    global _resolver_instance
+    _resolver_instance = resolver
+
+
+def get_resolver() -> Resolver:
+    global _resolver_instance
+    if _resolver_instance is None:
+        _resolver_instance = Resolver()
+    return _resolver_instance
+
+
+def resolve(host: str, resolvers: list[str] | None = None):
+    resolver = get_resolver()
+    addresses = resolver.resolver(host, resolvers)
 
     if len(addresses) == 0:
-        logger.error(
-            f"{resolver_instance.kind} did not return any addresses for host '{host}':\n{p}"
-        )
+        logger.error(f"{resolver.kind} did not return any addresses for host '{host}'")
 
     return addresses
+
+
+def resolve_many(
+    hosts: list[str], resolvers: list[str] | None = None
+) -> dict[str, list[str]]:
+    return get_resolver().resolve_many(hosts, resolvers)
+
+
+def refresh(hosts: list[str], resolvers: list[str] | None = None) -> set[str]:
+    return get_resolver().refresh(hosts, resolvers)
+
+
+def cache_expires(host: str, resolvers: list[str] | None = None) -> float | None:
+    """缓存中 host 的记录最早什么时候过期 (unix 时间)，没有缓存时返回 None"""
+    return _cache.expires(host, _cache_key(resolvers), QTYPES)
+
+
+def save_cache():
+    _cache.save()
+    _scores.save()
@@ -0,0 +1,101 @@
+"""
+每个 peer 单独安排下次检查的时间（常驻模式）
+
+- 刚发生变化或者出错的 peer 按 --interval 检查
+- 稳定的 peer 每次检查后间隔加倍，最多到 MAX_FACTOR 倍（且不超过 MAX_DELAY）
+- 每个间隔都乘上由本机和 peer 决定的固定抖动系数，大量主机不会在同一秒查询 DNS
+"""
+
+import hashlib
+import socket
+import threading
+from pathlib import Path
+
+MAX_FACTOR = 16
+MAX_DELAY = 3600.0
+# 抖动范围：间隔的 ±JITTER/2
+JITTER = 0.2
+
+
+def _host_seed() -> bytes:
+    try:
+        return Path("/etc/machine-id").read_bytes().strip()
+    except OSError:
+        return socket.gethostname().encode()
+
+
+class _Entry:
+    __slots__ = ("delay", "due")
+
+    def __init__(self, delay: float, due: float):
+        self.delay = delay
+        self.due = due
+
+
+class Schedule:
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.cap = max(min(interval * MAX_FACTOR, MAX_DELAY), interval)
+        self._seed = _host_seed()
+        self._entries: dict[tuple[str, str], _Entry] = {}
+        # 多个接口的检查线程同时记录结果
+        self._lock = threading.Lock()
+
+    def jitter(self, interface: str, public_key: str) -> float:
+        """这台主机上这个 peer 固定的抖动系数，范围 [1 - JITTER/2, 1 + JITTER/2)"""
+        digest = hashlib.blake2b(
+            self._seed + interface.encode() + public_key.encode(), digest_size=8
+        ).digest()
+        return 1 + JITTER * (int.from_bytes(digest, "big") / 2**64 - 0.5)
+
+    def is_due(self, interface: str, public_key: str, now: float) -> bool:
+        with self._lock:
+            entry = self._entries.get((interface, public_key))
+            return entry is None or entry.due <= now
+
+    def record(
+        self, interface: str, public_key: str, unstable: bool, now: float
+    ) -> float:
+        """记录一次检查的结果，返回到下次检查的时间"""
+        wait_factor = self.jitter(interface, public_key)
+        with self._lock:
+            entry = self._entries.get((interface, public_key))
+            if unstable or entry is None:
+                delay = self.interval
+            else:
+                delay = min(entry.delay * 2, self.cap)
+
+            wait = delay * wait_factor
+            self._entries[(interface, public_key)] = _Entry(delay, now + wait)
+        return wait
+
+    def prune(self, now: float):
+        """检查周期之后仍然过期的 peer 已经不存在了（或者检查失败），下次当作新 peer"""
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry.due <= now]:
+                del self._entries[key]
+
+    def next_due(self) -> float | None:
+        with self._lock:
+            if not self._entries:
+                return None
+            return min(entry.due for entry in self._entries.values())
+
+    def describe(self, now: float) -> str:
+        next_due = self.next_due()
+        if next_due is None:
+            return "no peers scheduled"
+        with self._lock:
+            delays = [entry.delay for entry in self._entries.values()]
+        return (
+            f"{len(delays)} peers scheduled every {_span(min(delays))}-{_span(max(delays))}, "
+            f"next in {_span(max(next_due - now, 0))}"
+        )
+
+
+def _span(seconds: float) -> str:
+    if seconds < 120:
+        return f"{seconds:.0f}s"
+    if seconds < 7200:
+        return f"{seconds / 60:.0f}min"
+    return f"{seconds / 3600:.1f}h"
@@ -5,11 +5,36 @@ from ..common.spawn import execute_drop
 from ..systemd import systemctl
 
 
+class ServiceManager:
+    """启动 (nonce 为 start) 或重启 (restart) wg-quick 服务的方式"""
+
+    def start(self, interface: str, nonce: str):
+        raise NotImplementedError()
+
+
+class SystemServiceManager(ServiceManager):
+    def start(self, interface: str, nonce: str):
+        if sys.platform == "win32":
+            win32_service_start(interface, nonce)
+        else:
+            systemctl.start(f"wg-quick@{interface}.service", restart=nonce == "restart")
+
+
+_manager: ServiceManager = SystemServiceManager()
+
+
+def use_service_manager(manager: ServiceManager):
+    """替换服务管理的实现（--simulate / --record / replay）"""
+    global _manager
+    _manager = manager
+
+
+def get_service_manager() -> ServiceManager:
+    return _manager
+
+
 def start_service_inner(interface: str, nonce: str):
-    if sys.platform == "win32":
-        win32_service_start(interface, nonce)
-    else:
-        systemctl.start(f"wg-quick@{interface}.service", restart=nonce == "restart")
+    _manager.start(interface, nonce)
 
 
 def cross_platform_start_service(interface: str, nonce="start"):
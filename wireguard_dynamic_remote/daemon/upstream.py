@@ -0,0 +1,197 @@
+"""
+在多个上游 DNS 服务器之间竞速
+
+- 每个服务器记录延迟和失败率的指数加权移动平均 (EWMA)，查询按评分从好到差排序
+- 先只问最好的服务器，一段时间没有回复（hedge）或者出错时再加上下一个，使用第一个有效的回复
+- 评分保存在状态目录，oneshot 运行之间也能延续
+"""
+
+import asyncio
+import threading
+
+from ..common.state import load_json, save_json
+from . import dns
+
+SCORES_FILE = "resolvers.json"
+
+# EWMA 系数：新样本占的比重
+ALPHA = 0.3
+# 失败率折算成多少秒的延迟
+FAILURE_PENALTY = 2.0
+# 没有数据的服务器的假定延迟
+DEFAULT_LATENCY = 0.1
+# 等待多久再向下一个服务器发出查询：最好服务器的平均延迟的 HEDGE_FACTOR 倍，限制在范围内
+HEDGE_FACTOR = 2.0
+HEDGE_MIN = 0.05
+HEDGE_MAX = 0.5
+
+_VALID_RCODES = (dns.RCODE_NOERROR, dns.RCODE_NXDOMAIN)
+
+
+class _Score:
+    __slots__ = ("latency", "failure")
+
+    def __init__(self, latency: float = DEFAULT_LATENCY, failure: float = 0.0):
+        self.latency = latency
+        self.failure = failure
+
+    def value(self) -> float:
+        return self.latency + self.failure * FAILURE_PENALTY
+
+
+class UpstreamScores:
+    def __init__(self, file: str = SCORES_FILE):
+        self.file = file
+        self._scores: dict[str, _Score] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._dirty = False
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+
+        data = load_json(self.file)
+        if not isinstance(data, dict):
+            return
+        for server, item in data.items():
+            try:
+                latency, failure = item
+                self._scores[server] = _Score(float(latency), float(failure))
+            except (TypeError, ValueError):
+                continue
+
+    def _get(self, server: str) -> _Score:
+        self._load()
+        score = self._scores.get(server)
+        if score is None:
+            score = self._scores[server] = _Score()
+        return score
+
+    def order(self, servers: list[str]) -> list[str]:
+        """按评分排序，评分相同时保持用户给出的顺序"""
+        with self._lock:
+            return sorted(servers, key=lambda server: self._get(server).value())
+
+    def hedge_delay(self, server: str) -> float:
+        with self._lock:
+            latency = self._get(server).latency
+        return min(max(latency * HEDGE_FACTOR, HEDGE_MIN), HEDGE_MAX)
+
+    def record_success(self, server: str, latency: float):
+        with self._lock:
+            score = self._get(server)
+            score.latency += ALPHA * (latency - score.latency)
+            score.failure -= ALPHA * score.failure
+            self._dirty = True
+
+    def record_slow(self, server: str, elapsed: float):
+        """查询被更快的服务器抢先，只知道它至少要 elapsed 秒"""
+        with self._lock:
+            score = self._get(server)
+            if elapsed > score.latency:
+                score.latency += ALPHA * (elapsed - score.latency)
+                self._dirty = True
+
+    def record_failure(self, server: str):
+        with self._lock:
+            score = self._get(server)
+            score.failure += ALPHA * (1 - score.failure)
+            self._dirty = True
+
+    def summary(self, servers: list[str]) -> str:
+        with self._lock:
+            return ", ".join(
+                f"{server} ({self._get(server).latency * 1000:.0f}ms, "
+                f"{self._get(server).failure * 100:.0f}% failed)"
+                for server in servers
+            )
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {
+                server: [round(score.latency, 4), round(score.failure, 4)]
+                for server, score in self._scores.items()
+            }
+            self._dirty = False
+        save_json(self.file, data)
+
+
+async def race(
+    host: str,
+    servers: list[str],
+    qtypes: tuple[int, ...],
+    scores: UpstreamScores,
+    timeout: float = dns.DEFAULT_TIMEOUT,
+) -> tuple[str, dict[int, dns.Answer]]:
+    """向多个服务器查询 host，返回 (回答的服务器, {qtype: Answer})；全部失败时抛出 DnsError"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    order = scores.order(servers)
+    running: dict[asyncio.Task, tuple[str, float]] = {}
+    errors: list[str] = []
+
+    def launch():
+        server = order[len(running) + len(errors)]
+        task = asyncio.ensure_future(
+            dns.query(host, server, qtypes, max(deadline - loop.time(), 0.1))
+        )
+        running[task] = (server, loop.time())
+
+    def has_next() -> bool:
+        return len(running) + len(errors) < len(order)
+
+    try:
+        launch()
+        while running or has_next():
+            if not running:
+                launch()
+                continue
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            wait = remaining
+            if has_next():
+                last_server, _ = list(running.values())[-1]
+                wait = min(wait, scores.hedge_delay(last_server))
+
+            done, _ = await asyncio.wait(
+                running, timeout=wait, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                if has_next():
+                    launch()  # 太慢了，同时问下一个
+                continue
+
+            for task in done:
+                server, started = running.pop(task)
+                try:
+                    answers = task.result()
+                except dns.DnsError as e:
+                    scores.record_failure(server)
+                    errors.append(f"{server}: {e}")
+                    continue
+                bad = [a.rcode for a in answers.values() if a.rcode not in _VALID_RCODES]
+                if bad:
+                    scores.record_failure(server)
+                    errors.append(f"{server}: rcode {bad[0]}")
+                    continue
+
+                scores.record_success(server, loop.time() - started)
+                for other_server, other_started in running.values():
+                    scores.record_slow(other_server, loop.time() - other_started)
+                return server, answers
+    finally:
+        for task in running:
+            if task.done() and not task.cancelled():
+                task.exception()  # 标记为已处理
+            task.cancel()
+
+    for server, _ in running.values():
+        scores.record_failure(server)
+        errors.append(f"{server}: timeout")
+    raise dns.DnsError(f"All resolvers failed: {'; '.join(errors)}")
@@ -0,0 +1,6 @@
+"""
+--record 和 replay：记录真实运行时每个周期的输入和做出的修改，之后离线重新运行检查逻辑并比较
+"""
+
+from .player import replay
+from .recorders import install as install_recorders
@@ -0,0 +1,318 @@
+"""
+replay：把 --record 记录的周期重新交给检查逻辑，比较做出的修改是否和记录时相同
+
+每个周期使用记录的运行状态、解析结果和探测结果；检查逻辑问到记录中没有的内容时
+（例如改动后多探测了一组地址），使用之前周期中最后一次看到的结果。
+默认不等待，尽快运行所有周期；realtime 时按原来的周期间隔和解析、探测耗时等待。
+握手时间按记录时的"距今多久"换算到现在；failover 等待握手时仍然真实地等待
+"""
+
+import json
+import shutil
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+from pathlib import Path
+
+from .. import wireguard
+from ..common import logger, recording, state
+from ..common.context import RunContext
+from ..common.networking import Prober, use_prober
+from ..daemon import dns
+from ..daemon.main import run_cycle
+from ..daemon.resolve import Resolver, use_resolver
+from ..daemon.schedule import Schedule
+from ..daemon.service_control import ServiceManager, use_service_manager
+from ..wireguard import Backend, RuntimeConfig
+from ..wireguard.snapshot import parse_dump
+from .recorders import sync_endpoints
+
+
+class _Cycle:
+    """
+    一个记录的周期，按类型整理好的事件
+
+    peer 内的读取、解析和探测按 (peer, ...) 分开排队，多个 peer 并行检查时的先后顺序不影响对应关系
+    """
+
+    def __init__(self, events: list[dict]):
+        head = events[0]
+        self.at: float = head["at"]
+        self.interfaces: list[str] = head["i"]
+        self.only = (
+            None
+            if head["only"] is None
+            else {i: None if hosts is None else set(hosts) for i, hosts in head["only"].items()}
+        )
+        self.configs: dict[str, str] = {}
+        self.reads: dict[tuple, deque[tuple[float, str | None]]] = defaultdict(deque)
+        self.batches: deque[tuple[float, dict[str, list[str]]]] = deque()
+        self.singles: dict[tuple, deque[tuple[float, list[str] | None, str, str]]] = defaultdict(deque)
+        self.probes: dict[tuple, deque[tuple[float, list[tuple[str, float]]]]] = defaultdict(deque)
+        # 记录时还没有到期、没有检查的 peer
+        self.deferred: set[tuple[str, str]] = set()
+        self.decisions: list[tuple[str, str, str]] = []
+
+        for event in events[1:]:
+            kind = event.get("t")
+            peer = event.get("p")
+            if kind == "config":
+                self.configs[event["i"]] = event["c"]
+            elif kind == "wg":
+                self.reads[event["i"], peer].append((self.at + event["dt"], event["d"]))
+            elif kind == "lookup":
+                self.singles[peer, event["h"]].append(
+                    (event["ms"], event["a"], event.get("error", ""), event.get("x", ""))
+                )
+            elif kind == "resolve":
+                self.batches.append((event["ms"], event["a"]))
+            elif kind == "probe":
+                replies = [(address, rtt) for address, rtt in event["r"]]
+                self.probes[(peer, *sorted(event["a"]))].append((event["ms"], replies))
+            elif kind == "deferred":
+                self.deferred.update((event["i"], key) for key in event["peers"])
+            elif kind in ("set", "sync", "service"):
+                self.decisions.append(decision(kind, event["i"], event.get("e") or event.get("n")))
+
+
+def decision(kind: str, interface: str, value) -> tuple[str, str, str]:
+    return kind, interface, json.dumps(value, sort_keys=True)
+
+
+class _Player:
+    """当前周期的记录，和所有假的实现共用"""
+
+    def __init__(self, realtime: bool):
+        self.realtime = realtime
+        self.cycle: _Cycle | None = None
+        self.decisions: list[tuple[str, str, str]] = []
+        self.lock = threading.Lock()
+        # 之前所有周期中最后一次看到的结果
+        self.answers: dict[str, list[str]] = {}
+        self.rtts: dict[str, float | None] = {}
+
+    def load(self, cycle: _Cycle):
+        self.cycle = cycle
+        self.decisions = []
+
+    def wait(self, ms: float):
+        if self.realtime:
+            time.sleep(ms / 1000)
+
+    def decide(self, kind: str, interface: str, value):
+        with self.lock:
+            self.decisions.append(decision(kind, interface, value))
+
+
+class _RecordedSchedule(Schedule):
+    """只有记录时没有到期的 peer 不到期；replay 不安排下次检查"""
+
+    def __init__(self, player: _Player):
+        super().__init__(0)
+        self.player = player
+
+    def is_due(self, interface: str, public_key: str, now: float) -> bool:
+        cycle = self.player.cycle
+        return cycle is None or (interface, public_key) not in cycle.deferred
+
+    def record(self, interface: str, public_key: str, unstable: bool, now: float) -> float:
+        return 0
+
+
+class ReplayBackend(Backend):
+    kind = "replay"
+
+    def __init__(self, player: _Player):
+        self.player = player
+        self.devices: dict[str, RuntimeConfig | None] = {}
+
+    def get_device(self, interface: str):
+        cycle = self.player.cycle
+        assert cycle is not None
+        with self.player.lock:
+            reads = cycle.reads.get((interface, recording.current_peer()))
+            if reads:
+                at, dump = reads.popleft()
+                self.devices[interface] = None if dump is None else _shifted(dump, interface, at)
+            return self.devices.get(interface)
+
+    def set_endpoints(self, interface: str, endpoints: dict[str, str]):
+        if endpoints:
+            self.player.decide("set", interface, endpoints)
+
+    def set_keepalive(self, interface: str, public_key: str, seconds: int):
+        pass
+
+    def strip_config(self, path: str) -> str:
+        with open(path) as f:
+            return f.read()
+
+    def sync_config(self, interface: str, content: str):
+        self.player.decide("sync", interface, sync_endpoints(content))
+
+
+def _shifted(dump: str, interface: str, at: float) -> RuntimeConfig:
+    """握手时间按记录时距今多久换算到现在"""
+    device = parse_dump(dump)[interface]
+    shift = time.time() - at
+    for peer in device.peers:
+        if peer.latest_handshake():
+            peer.LatestHandshake = str(int(peer.latest_handshake() + shift))
+    return device
+
+
+_ERRORS: dict[str, type[Exception]] = {
+    "DnsError": dns.DnsError,
+    "DnsTimeout": dns.DnsTimeout,
+}
+
+
+class ReplayResolver(Resolver):
+    def __init__(self, player: _Player):
+        super().__init__()
+        self.player = player
+        self.kind = "replay"
+
+    def resolver(self, host: str, resolvers: list[str] | None = None) -> list[str]:
+        cycle = self.player.cycle
+        assert cycle is not None
+        with self.player.lock:
+            recorded = cycle.singles.get((recording.current_peer(), host))
+            answer = recorded.popleft() if recorded else None
+        if answer is None:
+            return self.player.answers.get(host, [])
+        ms, addresses, error, kind = answer
+        self.player.wait(ms)
+        if addresses is None:
+            # 和记录时相同的异常类型，检查逻辑才会走同样的处理
+            raise _ERRORS.get(kind, Exception)(error)
+        self.player.answers[host] = addresses
+        return addresses
+
+    def resolve_many(self, hosts: list[str], resolvers: list[str] | None = None):
+        cycle = self.player.cycle
+        assert cycle is not None
+        with self.player.lock:
+            batch = cycle.batches.popleft() if cycle.batches else None
+        if batch is not None:
+            self.player.wait(batch[0])
+            self.player.answers.update(batch[1])
+        return {host: self.player.answers.get(host, []) for host in hosts}
+
+    def refresh(self, hosts: list[str], resolvers: list[str] | None = None) -> set[str]:
+        return set()
+
+
+class ReplayProber(Prober):
+    def __init__(self, player: _Player):
+        self.player = player
+
+    def probe(self, addresses: list[str], mode: str, timeout: float):
+        cycle = self.player.cycle
+        assert cycle is not None
+        with self.player.lock:
+            recorded = cycle.probes.get((recording.current_peer(), *sorted(addresses)))
+            result = recorded.popleft() if recorded else None
+
+        if result is not None:
+            ms, replies = result
+            self.player.wait(ms)
+            for address in addresses:
+                self.player.rtts[address] = None
+            self.player.rtts.update(replies)
+            return replies
+
+        replies = [
+            (address, self.player.rtts[address])
+            for address in addresses
+            if self.player.rtts.get(address) is not None
+        ]
+        replies.sort(key=lambda reply: reply[1])
+        if mode == "ping":
+            return [(replies[0][0], 0.0)] if replies else []
+        return replies
+
+
+class ReplayServiceManager(ServiceManager):
+    def __init__(self, player: _Player):
+        self.player = player
+
+    def start(self, interface: str, nonce: str):
+        self.player.decide("service", interface, nonce)
+
+
+def _describe(decisions: list[tuple[str, str, str]]) -> str:
+    return "; ".join(f"{kind} {value}" for kind, _, value in decisions) or "nothing"
+
+
+def replay(path: str, config: RunContext, realtime: bool = False) -> bool:
+    """
+    重新运行记录中的所有周期（config.interfaces 不为空时只包括这些接口），
+    全部周期做出的修改都和记录时相同时返回 True
+    """
+    root = Path(tempfile.mkdtemp(prefix="wireguard-dynamic-remote.replay."))
+    config_dir = root / "config"
+    config_dir.mkdir()
+    wireguard.CONFIG_FILES_DIR = config_dir
+    state.STATE_DIR = str(root / "state")
+
+    player = _Player(realtime)
+    schedule = _RecordedSchedule(player)
+    wireguard.use_backend(ReplayBackend(player))
+    use_resolver(ReplayResolver(player))
+    use_prober(ReplayProber(player))
+    use_service_manager(ReplayServiceManager(player))
+
+    selected = set(config.interfaces)
+    cycles = same = 0
+    first_at = None
+    started = time.monotonic()
+    try:
+        for index, events in enumerate(recording.read(path)):
+            cycle = _Cycle(events)
+            for interface, content in cycle.configs.items():
+                (config_dir / f"{interface}.conf").write_text(content)
+            wireguard.get_repository().invalidate()
+
+            interfaces = [i for i in cycle.interfaces if not selected or i in selected]
+            only = cycle.only
+            if only is not None and selected:
+                only = {i: hosts for i, hosts in only.items() if i in selected}
+            if not interfaces or only == {}:
+                continue
+
+            if first_at is None:
+                first_at = cycle.at
+            if realtime:
+                delay = (cycle.at - first_at) - (time.monotonic() - started)
+                if delay > 0:
+                    time.sleep(delay)
+
+            player.load(cycle)
+            config.interfaces = interfaces
+            with logger.capture():
+                run_cycle(config, only, schedule)
+
+            cycles += 1
+            differed = False
+            when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(cycle.at))
+            for interface in interfaces:
+                expected = sorted(d for d in cycle.decisions if d[1] == interface)
+                actual = sorted(d for d in player.decisions if d[1] == interface)
+                if expected != actual:
+                    differed = True
+                    logger.warning(f"Cycle {index} ({when}) {interface}:")
+                    logger.output(f"    recorded: {_describe(expected)}")
+                    logger.output(f"    replayed: {_describe(actual)}")
+            same += not differed
+    except (OSError, recording.RecordingError) as e:
+        logger.fatal(f"Can not read recording {path}: {e}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    logger.output(
+        f"Replayed {cycles} cycles in {time.monotonic() - started:.2f}s: "
+        f"{same} made the same changes, {cycles - same} differed."
+    )
+    return same == cycles
@@ -0,0 +1,115 @@
+"""
+包装当前的 WireGuard、解析、探测和服务管理的实现，把读到的结果和做出的修改记录到 --record 文件
+"""
+
+import time
+
+from ..common import recording
+from ..common.networking import Prober, get_prober, use_prober
+from ..daemon.resolve import Resolver, use_resolver
+from ..daemon.service_control import ServiceManager, get_service_manager, use_service_manager
+from ..wireguard import Backend, get_backend, use_backend
+from ..wireguard.config_parser import parse_config_content
+from ..wireguard.snapshot import RuntimeSnapshot, format_dump
+
+
+def _ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 3)
+
+
+class RecordingBackend(Backend):
+    def __init__(self, inner: Backend):
+        self.inner = inner
+        self.kind = inner.kind
+
+    def _record(self, interface: str, device):
+        recording.record(
+            "wg", i=interface, d=None if device is None else format_dump(interface, device)
+        )
+
+    def get_device(self, interface: str):
+        device = self.inner.get_device(interface)
+        self._record(interface, device)
+        return device
+
+    def snapshot(self, interfaces: list[str]) -> RuntimeSnapshot:
+        snapshot = self.inner.snapshot(interfaces)
+        for interface in interfaces:
+            self._record(interface, snapshot.get(interface))
+        return snapshot
+
+    def set_endpoints(self, interface: str, endpoints: dict[str, str]):
+        self.inner.set_endpoints(interface, endpoints)
+        if endpoints:
+            recording.record("set", i=interface, e=endpoints)
+
+    def set_keepalive(self, interface: str, public_key: str, seconds: int):
+        self.inner.set_keepalive(interface, public_key, seconds)
+
+    def strip_config(self, path: str) -> str:
+        return self.inner.strip_config(path)
+
+    def sync_config(self, interface: str, content: str):
+        self.inner.sync_config(interface, content)
+        recording.record("sync", i=interface, e=sync_endpoints(content))
+
+
+def sync_endpoints(content: str) -> dict[str, str]:
+    """sync_config 之后每个 peer 的 endpoint"""
+    cfg = parse_config_content(content)
+    return {peer.PublicKey: peer.Endpoint for peer in cfg.peers if peer.Endpoint}
+
+
+class RecordingResolver(Resolver):
+    def resolver(self, host: str, resolvers: list[str] | None = None) -> list[str]:
+        started = time.perf_counter()
+        try:
+            addresses = super().resolver(host, resolvers)
+        except Exception as e:
+            recording.record(
+                "lookup", h=host, a=None, error=str(e), x=type(e).__name__, ms=_ms(started)
+            )
+            raise
+        recording.record("lookup", h=host, a=addresses, ms=_ms(started), k=self.kind)
+        return addresses
+
+    def resolve_many(self, hosts: list[str], resolvers: list[str] | None = None):
+        started = time.perf_counter()
+        answers = super().resolve_many(hosts, resolvers)
+        recording.record("resolve", a=answers, ms=_ms(started))
+        return answers
+
+
+class RecordingProber(Prober):
+    def __init__(self, inner: Prober):
+        self.inner = inner
+
+    def probe(self, addresses: list[str], mode: str, timeout: float):
+        started = time.perf_counter()
+        replies = self.inner.probe(addresses, mode, timeout)
+        recording.record(
+            "probe",
+            a=addresses,
+            m=mode,
+            r=[[address, round(rtt, 6)] for address, rtt in replies],
+            ms=_ms(started),
+        )
+        return replies
+
+
+class RecordingServiceManager(ServiceManager):
+    def __init__(self, inner: ServiceManager):
+        self.inner = inner
+
+    def start(self, interface: str, nonce: str):
+        recording.record("service", i=interface, n=nonce)
+        self.inner.start(interface, nonce)
+
+
+def install(path: str):
+    """在已经选择好的实现外面加上记录"""
+    recording.enable(path)
+    use_backend(RecordingBackend(get_backend()))
+    use_resolver(RecordingResolver())
+    use_prober(RecordingProber(get_prober()))
+    use_service_manager(RecordingServiceManager(get_service_manager()))
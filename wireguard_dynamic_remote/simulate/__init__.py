@@ -0,0 +1,59 @@
+"""
+--simulate：把 wg、DNS、探测和服务管理换成确定的内存实现，对成千上万个虚拟隧道做长时间测试
+
+虚拟接口的配置文件和状态目录都在一个临时目录中，不会碰到真实的 WireGuard 和 /var/lib；
+场景的格式见 scenario.py
+"""
+
+import atexit
+import shutil
+import tempfile
+from pathlib import Path
+
+from .. import wireguard
+from ..common import logger, state
+from ..common.context import RunContext
+from ..common.networking import use_prober
+from ..daemon.dns import use_transport
+from ..daemon.service_control import use_service_manager
+from .fakes import SimulatedBackend, SimulatedProber, SimulatedServiceManager, SimulatedTransport
+from .scenario import Scenario
+from .world import World
+
+# 虚拟的 DNS 服务器，--resolver 没有指定时使用
+RESOLVER = "192.0.2.53"
+# --simulate 使用内置场景时的参数
+BUILTIN = "builtin"
+
+
+def install(path: str, config: RunContext) -> World:
+    """按场景文件（BUILTIN 时使用默认场景）准备虚拟接口，并替换所有外部交互"""
+    try:
+        scenario = Scenario.load("" if path == BUILTIN else path)
+    except (OSError, ValueError) as e:
+        logger.fatal(f"Invalid simulation scenario {path}: {e}")
+
+    root = Path(tempfile.mkdtemp(prefix="wireguard-dynamic-remote.simulate."))
+    atexit.register(shutil.rmtree, root, ignore_errors=True)
+
+    world = World(scenario)
+    world.write_configs(root / "config")
+    wireguard.CONFIG_FILES_DIR = root / "config"
+    state.STATE_DIR = str(root / "state")
+
+    backend = SimulatedBackend(world)
+    for interface in world.interfaces:
+        backend.up(interface, established=True)
+    wireguard.use_backend(backend)
+    use_transport(SimulatedTransport(world))
+    use_prober(SimulatedProber(world))
+    use_service_manager(SimulatedServiceManager(world, backend))
+
+    if not config.resolvers:
+        config.resolvers = [RESOLVER]
+
+    logger.output(
+        f"Simulating {len(world.interfaces)} interfaces x {scenario.peers} peers, "
+        f"{len(world.records)} hostnames, {len(scenario.events)} events, in {root}"
+    )
+    return world
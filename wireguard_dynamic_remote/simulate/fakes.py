@@ -0,0 +1,237 @@
+"""
+wg、DNS、探测和服务管理的内存实现，行为由 World 决定
+"""
+
+import asyncio
+import threading
+import time
+
+from ..common import logger
+from ..common.networking import Prober
+from ..common.prober import GRACE
+from ..daemon import dns
+from ..daemon.service_control import ServiceManager
+from ..wireguard import Backend, Endpoint, RuntimeConfig, get_static_config_file
+from ..wireguard.config_parser import parse_config_content
+from .world import World
+
+# WireGuard 每两分钟重新握手一次
+REKEY_AFTER = 120
+# 有会话时每次读取状态增加的流量
+TRAFFIC = 1024
+
+
+class _Peer:
+    __slots__ = ("endpoint", "allowed_ips", "keepalive", "handshake", "session", "rx", "tx")
+
+    def __init__(self, endpoint: str, allowed_ips: str):
+        self.endpoint = endpoint
+        self.allowed_ips = allowed_ips
+        self.keepalive = 0
+        self.handshake = 0
+        # 会话建立（或将要建立）的时间，None 表示 endpoint 不通
+        self.session: float | None = None
+        self.rx = 0
+        self.tx = 0
+
+
+class _Device:
+    def __init__(self, private_key: str, listen_port: str):
+        self.private_key = private_key
+        self.listen_port = listen_port
+        self.peers: dict[str, _Peer] = {}
+
+
+class SimulatedBackend(Backend):
+    kind = "simulate"
+
+    def __init__(self, world: World):
+        self.world = world
+        self.devices: dict[str, _Device] = {}
+        self.lock = threading.Lock()
+
+    def _resolve(self, endpoint: str) -> str:
+        """和 wg 一样在设置时把 hostname 解析成第一个地址，解析不到时没有 endpoint"""
+        if not endpoint:
+            return ""
+        parsed = Endpoint(endpoint)
+        if not parsed.is_hostname:
+            return endpoint
+        addresses = self.world.lookup(parsed.addr)
+        return Endpoint.format(addresses[0], parsed.port) if addresses else ""
+
+    def up(self, interface: str, restart: bool = False, established: bool = False):
+        """
+        按配置文件创建接口（wg-quick up），已有的会话在 restart 时断开
+
+        established 表示模拟开始前接口已经运行了一段时间，握手时间分散在最近两分钟内
+        """
+        cfg = parse_config_content(get_static_config_file(interface).read_text())
+        with self.lock:
+            old = self.devices.get(interface)
+            if old and not restart:
+                return
+            device = _Device(cfg.PrivateKey, cfg.ListenPort)
+            now = time.time()
+            for peer in cfg.peers:
+                state = _Peer(self._resolve(peer.Endpoint), peer.AllowedIPs)
+                state.keepalive = int(peer.PersistentKeepalive or 0)
+                if established:
+                    state.session = now - self.world.chance("up", peer.PublicKey) * REKEY_AFTER
+                device.peers[peer.PublicKey] = state
+            self.devices[interface] = device
+
+    def _update(self, device: _Device):
+        now = time.time()
+        for public_key, peer in device.peers.items():
+            address = Endpoint(peer.endpoint).addr if peer.endpoint else ""
+            if not address or not self.world.handshakes(address):
+                peer.session = None
+                continue
+            if peer.session is None:
+                peer.session = now + self.world.vary("handshake", "delay", public_key, address)
+            if now >= peer.session:
+                peer.handshake = int(peer.session + (now - peer.session) // REKEY_AFTER * REKEY_AFTER)
+                peer.rx += TRAFFIC
+                peer.tx += TRAFFIC
+
+    def get_device(self, interface: str):
+        self.world.tick()
+        with self.lock:
+            if interface in self.world.down:
+                self.devices.pop(interface, None)
+            device = self.devices.get(interface)
+            if device is None:
+                return None
+            self._update(device)
+            return RuntimeConfig(
+                {"PrivateKey": device.private_key, "ListenPort": device.listen_port},
+                [
+                    {
+                        "PublicKey": public_key,
+                        "Endpoint": peer.endpoint,
+                        "AllowedIPs": peer.allowed_ips,
+                        "LatestHandshake": str(peer.handshake),
+                        "TransferRx": str(peer.rx),
+                        "TransferTx": str(peer.tx),
+                        "PersistentKeepalive": str(peer.keepalive or ""),
+                    }
+                    for public_key, peer in device.peers.items()
+                ],
+            )
+
+    def _peer(self, interface: str, public_key: str) -> _Peer:
+        device = self.devices.get(interface)
+        if device is None:
+            raise RuntimeError(f"Unable to access interface {interface}: No such device")
+        return device.peers.setdefault(public_key, _Peer("", ""))
+
+    def set_endpoints(self, interface: str, endpoints: dict[str, str]):
+        with self.lock:
+            for public_key, endpoint in endpoints.items():
+                peer = self._peer(interface, public_key)
+                if peer.endpoint != endpoint:
+                    peer.endpoint = endpoint
+                    peer.session = None
+
+    def set_keepalive(self, interface: str, public_key: str, seconds: int):
+        with self.lock:
+            self._peer(interface, public_key).keepalive = seconds
+
+    def strip_config(self, path: str) -> str:
+        # 解析时会忽略 wg-quick 的键
+        with open(path) as f:
+            return f.read()
+
+    def sync_config(self, interface: str, content: str):
+        cfg = parse_config_content(content)
+        with self.lock:
+            device = self.devices.get(interface)
+            if device is None:
+                raise RuntimeError(f"Unable to access interface {interface}: No such device")
+            peers = {}
+            for peer in cfg.peers:
+                state = device.peers.get(peer.PublicKey) or _Peer("", "")
+                endpoint = self._resolve(peer.Endpoint)
+                if endpoint and endpoint != state.endpoint:
+                    state.endpoint = endpoint
+                    state.session = None
+                state.allowed_ips = peer.AllowedIPs
+                peers[peer.PublicKey] = state
+            device.peers = peers
+
+
+class SimulatedTransport(dns.Transport):
+    # 外部命令查询的是真实的 DNS
+    allow_fallback = False
+
+    def __init__(self, world: World):
+        self.world = world
+
+    async def query(self, host, server, qtypes, timeout):
+        self.world.tick()
+        settings = self.world.settings["dns"]
+        attempt = self.world.count("dns", host)
+        if self.world.chance("dns-failure", host, attempt) < settings["failure_rate"]:
+            await asyncio.sleep(timeout)
+            raise dns.DnsTimeout(f"DNS server {server} did not respond in {timeout}s")
+
+        await asyncio.sleep(self.world.vary("dns", "latency", host))
+        addresses = self.world.lookup(host)
+        ttl = settings["ttl"]
+        if addresses is None:
+            return {qtype: dns.Answer(qtype, dns.RCODE_NXDOMAIN, [], ttl) for qtype in qtypes}
+        return {
+            qtype: dns.Answer(
+                qtype,
+                dns.RCODE_NOERROR,
+                [a for a in addresses if (":" in a) == (qtype == dns.QTYPE_AAAA)],
+                ttl,
+            )
+            for qtype in qtypes
+        }
+
+
+class SimulatedProber(Prober):
+    def __init__(self, world: World):
+        self.world = world
+
+    def probe(self, addresses: list[str], mode: str, timeout: float):
+        self.world.tick()
+        if not addresses:
+            return []
+        loss = self.world.settings["probe"]["loss"]
+        replies = []
+        for address in addresses:
+            attempt = self.world.count("probe", address)
+            if not self.world.alive(address) or self.world.chance("loss", address, attempt) < loss:
+                continue
+            rtt = self.world.vary("probe", "latency", address)
+            if rtt < timeout:
+                replies.append((address, rtt))
+        replies.sort(key=lambda reply: reply[1])
+        if not replies:
+            time.sleep(timeout)
+            return []
+
+        # 和真实的实现一样：ping 命令在第一个回复时返回；其他方式在第一个回复之后
+        # 最多再等 GRACE 秒，之后到达的回复不算
+        first = replies[0][1]
+        if mode == "ping":
+            time.sleep(first)
+            return [(replies[0][0], 0.0)]
+        replies = [reply for reply in replies if reply[1] <= first + GRACE]
+        time.sleep(replies[-1][1] if len(replies) == len(addresses) else min(first + GRACE, timeout))
+        return replies
+
+
+class SimulatedServiceManager(ServiceManager):
+    def __init__(self, world: World, backend: SimulatedBackend):
+        self.world = world
+        self.backend = backend
+
+    def start(self, interface: str, nonce: str):
+        logger.output(f"[simulate] {nonce} wg-quick@{interface}")
+        with self.world.lock:
+            self.world.down.discard(interface)
+        self.backend.up(interface, restart=nonce == "restart")
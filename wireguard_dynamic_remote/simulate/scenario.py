@@ -0,0 +1,155 @@
+"""
+模拟场景：虚拟接口的规模、DNS / 探测 / 握手的行为，以及按时间发生的事件
+
+场景是一个 json 文件，所有键都可以省略::
+
+    {
+        "seed": 0,
+        "interfaces": 2,                // 虚拟接口数量 (sim0, sim1, ...)
+        "peers": 100,                   // 每个接口的 peer 数量
+        "hostnames": null,              // 所有 peer 轮流使用的 hostname 数量，null 表示每个 peer 都不同
+        "addresses_per_host": 1,
+        "ipv6": false,                  // 同时生成 AAAA 记录
+        "options": {"OnChange": "update"},   // 写入每个接口配置的扩展键
+        "dns": {"latency": "5ms", "ttl": 60, "failure_rate": 0},
+        "probe": {"latency": "30ms", "jitter": 0.5, "loss": 0},
+        "handshake": {"delay": "100ms", "dead_rate": 0},
+        "events": [
+            {"at": "2m", "change": 0.1},                          // 10% 的 hostname 换成新地址
+            {"every": "10m", "change": 0.01},
+            {"at": "5m", "host": "peer3.sim.test", "addresses": ["198.18.0.9"]},  // null 表示 NXDOMAIN
+            {"at": "6m", "dns": {"failure_rate": 0.5}},           // 修改 dns / probe / handshake 的参数
+            {"at": "8m", "down": ["sim1"]}                        // 接口消失，等待检查时重新启动
+        ]
+    }
+
+latency 是平均值，每个地址（或 hostname）的实际值在 [1 - jitter, 1 + jitter] 倍之间；
+loss 是每次探测丢失的概率，dead_rate 是收不到握手的地址（服务器端口不通）的比例；
+所有随机结果都由 seed 和地址决定，同一个场景每次运行的结果相同
+"""
+
+import json
+
+from ..common.timespan import parse_timespan
+
+DEFAULTS = {
+    "seed": 0,
+    "interfaces": 2,
+    "peers": 100,
+    "hostnames": None,
+    "addresses_per_host": 1,
+    "ipv6": False,
+    "options": {},
+    "dns": {"latency": "5ms", "jitter": 0.5, "ttl": 60, "failure_rate": 0.0},
+    "probe": {"latency": "30ms", "jitter": 0.5, "loss": 0.0},
+    "handshake": {"delay": "100ms", "dead_rate": 0.0},
+    "events": [{"every": "5m", "change": 0.05}],
+}
+
+# 可以被事件修改的参数组
+SETTINGS = ("dns", "probe", "handshake")
+
+
+def _timespan(value) -> float:
+    if isinstance(value, (int, float)):
+        return float(value)
+    return parse_timespan(str(value))
+
+
+def _rate(group: str, key: str, value) -> float:
+    value = float(value)
+    if not 0 <= value <= 1:
+        raise ValueError(f"{group}.{key} must be between 0 and 1, got {value}")
+    return value
+
+
+def parse_settings(group: str, values: dict, base: dict | None = None) -> dict:
+    """合并并校验一组参数，时间统一转换为秒"""
+    unknown = set(values) - set(DEFAULTS[group])
+    if unknown:
+        raise ValueError(f"Unknown keys in {group}: {', '.join(sorted(unknown))}")
+
+    result = dict(base or {})
+    for key, value in values.items():
+        if key in ("latency", "delay"):
+            result[key] = _timespan(value)
+        elif key in ("jitter", "failure_rate", "loss", "dead_rate"):
+            result[key] = _rate(group, key, value)
+        elif key == "ttl":
+            result[key] = int(value)
+    return result
+
+
+class Event:
+    def __init__(self, values: dict):
+        values = dict(values)
+        if "at" in values:
+            self.at = _timespan(values.pop("at"))
+            self.every = None
+        elif "every" in values:
+            self.every = _timespan(values.pop("every"))
+            if self.every <= 0:
+                raise ValueError("Event 'every' must be positive")
+            self.at = self.every
+        else:
+            raise ValueError(f"Event needs 'at' or 'every': {values}")
+
+        self.change = _rate("event", "change", values.pop("change", 0))
+        self.host: str | None = values.pop("host", None)
+        self.addresses: list[str] | None = values.pop("addresses", None)
+        self.down: list[str] = values.pop("down", [])
+        self.settings = {
+            group: parse_settings(group, values.pop(group)) for group in SETTINGS if group in values
+        }
+        if values:
+            raise ValueError(f"Unknown keys in event: {', '.join(sorted(values))}")
+
+    def describe(self) -> str:
+        parts = []
+        if self.change:
+            parts.append(f"change {self.change:.0%} of hostnames")
+        if self.host:
+            parts.append(f"{self.host} -> {self.addresses if self.addresses is not None else 'NXDOMAIN'}")
+        if self.down:
+            parts.append(f"down {', '.join(self.down)}")
+        for group, values in self.settings.items():
+            parts.append(f"{group} {values}")
+        return "; ".join(parts) or "nothing"
+
+
+class Scenario:
+    def __init__(self, values: dict):
+        unknown = set(values) - set(DEFAULTS)
+        if unknown:
+            raise ValueError(f"Unknown keys in scenario: {', '.join(sorted(unknown))}")
+        merged = {**DEFAULTS, **values}
+
+        self.seed = int(merged["seed"])
+        self.interfaces = int(merged["interfaces"])
+        self.peers = int(merged["peers"])
+        self.hostnames = int(merged["hostnames"] or self.interfaces * self.peers)
+        self.addresses_per_host = int(merged["addresses_per_host"])
+        self.ipv6 = bool(merged["ipv6"])
+        self.options: dict[str, str] = dict(merged["options"])
+        if self.interfaces < 1 or self.peers < 1 or self.hostnames < 1:
+            raise ValueError("interfaces, peers and hostnames must be at least 1")
+        if self.addresses_per_host < 1:
+            raise ValueError("addresses_per_host must be at least 1")
+
+        self.settings = {
+            group: parse_settings(
+                group,
+                values.get(group, {}),
+                parse_settings(group, DEFAULTS[group]),
+            )
+            for group in SETTINGS
+        }
+        self.events = [Event(event) for event in merged["events"]]
+
+    @classmethod
+    def load(cls, path: str) -> "Scenario":
+        """path 为空时使用默认场景"""
+        if not path:
+            return cls({})
+        with open(path) as f:
+            return cls(json.load(f))
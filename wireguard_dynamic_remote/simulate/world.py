@@ -0,0 +1,142 @@
+"""
+模拟的外部世界：DNS 记录、地址的可达性和随时间发生的事件，由所有假的实现共用
+"""
+
+import base64
+import hashlib
+import random
+import threading
+import time
+from pathlib import Path
+
+from ..common import logger
+from .scenario import Scenario
+
+PORT = 51820
+
+
+def key(*parts: object) -> str:
+    """确定的、格式正确的 WireGuard 密钥"""
+    digest = hashlib.sha256("/".join(map(str, parts)).encode()).digest()
+    return base64.b64encode(digest).decode()
+
+
+class World:
+    def __init__(self, scenario: Scenario):
+        self.scenario = scenario
+        self.settings = {group: dict(values) for group, values in scenario.settings.items()}
+        self.random = random.Random(scenario.seed)
+        self.lock = threading.RLock()
+        self.started = time.monotonic()
+        self.interfaces = [f"sim{i}" for i in range(scenario.interfaces)]
+
+        # {hostname: 地址列表}，None 表示 NXDOMAIN
+        self.records: dict[str, list[str] | None] = {
+            f"peer{i}.sim.test": self._addresses() for i in range(scenario.hostnames)
+        }
+        self._live: set[str] | None = None
+        self._next = [event.at for event in scenario.events]
+        # 被事件关闭、等待服务重新启动的接口
+        self.down: set[str] = set()
+        # 每个地址 / hostname 被探测或查询的次数，决定每一次是否丢失
+        self._counters: dict[tuple[str, str], int] = {}
+
+    def _addresses(self) -> list[str]:
+        r = self.random
+        result = [
+            f"198.{r.randint(18, 19)}.{r.randint(0, 255)}.{r.randint(1, 254)}"
+            for _ in range(self.scenario.addresses_per_host)
+        ]
+        if self.scenario.ipv6:
+            result += [
+                f"2001:db8:{r.randint(0, 0xFFFF):x}::{r.randint(1, 0xFFFF):x}"
+                for _ in range(self.scenario.addresses_per_host)
+            ]
+        return result
+
+    def chance(self, *parts: object) -> float:
+        """由种子和 parts 决定的 [0, 1) 之间的数"""
+        digest = hashlib.blake2b(
+            "/".join(map(str, (self.scenario.seed, *parts))).encode(), digest_size=8
+        ).digest()
+        return int.from_bytes(digest, "big") / 2**64
+
+    def count(self, kind: str, name: str) -> int:
+        with self.lock:
+            n = self._counters.get((kind, name), 0)
+            self._counters[(kind, name)] = n + 1
+            return n
+
+    def vary(self, group: str, key: str, *parts: object) -> float:
+        """group 的 key（平均值）按 jitter 浮动后的值，parts 相同时结果相同"""
+        settings = self.settings[group]
+        jitter = settings.get("jitter", 0.0)
+        return settings[key] * (1 + jitter * (2 * self.chance(group, key, *parts) - 1))
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def tick(self):
+        """执行所有已经到时间的事件"""
+        with self.lock:
+            elapsed = self.elapsed()
+            for index, event in enumerate(self.scenario.events):
+                while self._next[index] is not None and self._next[index] <= elapsed:
+                    logger.output(f"[simulate] {self._next[index]:.0f}s: {event.describe()}")
+                    self._apply(event)
+                    self._next[index] = self._next[index] + event.every if event.every else None
+
+    def _apply(self, event):
+        if event.change:
+            hosts = list(self.records)
+            count = min(max(round(len(hosts) * event.change), 1), len(hosts))
+            for host in self.random.sample(hosts, count):
+                self.records[host] = self._addresses()
+        if event.host:
+            self.records[event.host] = event.addresses
+        for group, values in event.settings.items():
+            self.settings[group].update(values)
+        self.down.update(event.down)
+        self._live = None
+
+    def lookup(self, host: str) -> list[str] | None:
+        with self.lock:
+            return self.records.get(host.lower().rstrip("."))
+
+    def alive(self, address: str) -> bool:
+        """
+        地址上是否有服务器：只有当前出现在 DNS 记录中的地址才有，
+        其中 dead_rate 比例的地址能 ping 通但 WireGuard 端口不通（见 handshakes）
+        """
+        with self.lock:
+            if self._live is None:
+                self._live = {a for addresses in self.records.values() if addresses for a in addresses}
+            return address in self._live
+
+    def handshakes(self, address: str) -> bool:
+        return self.alive(address) and self.chance("dead", address) >= self.settings["handshake"]["dead_rate"]
+
+    def write_configs(self, directory: Path):
+        """生成每个接口的 wg-quick 配置文件，peer 的 endpoint 是 hostname"""
+        directory.mkdir(parents=True, exist_ok=True)
+        hosts = list(self.records)
+        peers = self.scenario.peers
+        for index, interface in enumerate(self.interfaces):
+            lines = [
+                "[Interface]",
+                f"PrivateKey = {key('private', index)}",
+                f"ListenPort = {PORT + index}",
+                "Address = 10.255.0.1/16",
+                *(f"# {name} = {value}" for name, value in self.scenario.options.items()),
+                "",
+            ]
+            for i in range(peers):
+                number = index * peers + i
+                lines += [
+                    "[Peer]",
+                    f"PublicKey = {key('peer', index, i)}",
+                    f"AllowedIPs = 10.{number >> 16 & 255}.{number >> 8 & 255}.{number & 255}/32",
+                    f"Endpoint = {hosts[number % len(hosts)]}:{PORT}",
+                    "",
+                ]
+            (directory / f"{interface}.conf").write_text("\n".join(lines))
@@ -1,25 +1,16 @@
 import subprocess
 import sys
-from os import environ
 from pathlib import Path
 
 from ..common import logger
 from ..common.context import RunContext
 from ..common.spawn import execute_drop
+from ..common.state import IS_STARTED_BY_SYSTEMD, STATE_DIR, SYSTEMD_SERVICE_NAME
 from . import systemctl
 
-SYSTEMD_SERVICE_NAME = "wireguard-dynamic-remote"
 SYSTEMD_LOCAL_SERVICE_LOCATION = "/usr/local/lib/systemd/system"
 
 
-IS_STARTED_BY_SYSTEMD = environ.get("INVOCATION_ID") is not None
-STATE_DIR = (
-    IS_STARTED_BY_SYSTEMD
-    and environ.get("STATE_DIRECTORY")
-    or f"/var/lib/{SYSTEMD_SERVICE_NAME}"
-)
-
-
 def make_service(config: RunContext) -> str:
     service_args = ""
     for arg in config.rebuild_arguments():
@@ -40,10 +31,54 @@ NotifyAccess=all
 ProtectSystem=strict
 ProtectHome=read-only
 StateDirectory={SYSTEMD_SERVICE_NAME}
-"""
+{_writable_paths(config)}"""
+
+
+def _writable_paths(config: RunContext) -> str:
+    """ProtectSystem=strict 下，指标文件和 unix socket 所在的目录需要可写"""
+    paths = []
+    if config.metrics_textfile:
+        paths.append(str(Path(config.metrics_textfile).parent))
+    if config.metrics_listen and config.metrics_listen.startswith("unix:"):
+        paths.append(str(Path(config.metrics_listen[len("unix:") :]).parent))
+    if not paths:
+        return ""
+    # 前缀 - ：目录不存在时不影响启动
+    return f"ReadWritePaths={' '.join('-' + path for path in paths)}\n"
+
+
+def make_daemon_service(config: RunContext) -> str:
+    service_args = ""
+    for arg in config.rebuild_arguments():
+        service_args += f' \\\n\t\t"{arg}"'
+
+    # 一个周期最长允许运行 2 倍间隔，看门狗至少要比这个宽松
+    watchdog = max(config.interval * 4, 60)
+
+    return f"""[Unit]
+Description=WireGuard Dynamic Remote Change Detecter
+After=network-online.target
+Wants=network-online.target
+
+[Install]
+WantedBy=multi-user.target
+
+[Service]
+Type=notify
+User=root
+ExecStart={sys.executable} -m wireguard_dynamic_remote.binary daemon {service_args}
+Restart=on-failure
+RestartSec=5s
+WatchdogSec={watchdog}s
+NotifyAccess=main
+ProtectSystem=strict
+ProtectHome=read-only
+StateDirectory={SYSTEMD_SERVICE_NAME}
+{_writable_paths(config)}"""
 
 
 def make_timer(config: RunContext) -> str:
+    # FixedRandomDelay 让每台主机的延迟固定但各不相同，大量主机不会同时触发
     return f"""[Unit]
 Description=WireGuard Dynamic Remote Change Detecter Timer
 After=network.target
@@ -55,6 +90,8 @@ WantedBy=timers.target
 OnBootSec=5min
 OnUnitActiveSec={str(config.interval)}s
 OnUnitInactiveSec={str(config.interval)}s
+RandomizedDelaySec={str(max(config.interval // 5, 1))}s
+FixedRandomDelay=yes
 """
 
 
@@ -79,15 +116,23 @@ def _services():
     return service_file, timer_file
 
 
-def install_service(config: RunContext):
+def install_service(config: RunContext, timer: bool = False):
     service_file, timer_file = _services()
 
     something_modified = False
 
     logger.output(f"Installing service to {service_file.parent}")
 
-    something_modified |= write_on_change(service_file, make_service(config))
-    something_modified |= write_on_change(timer_file, make_timer(config))
+    if timer:
+        something_modified |= write_on_change(service_file, make_service(config))
+        something_modified |= write_on_change(timer_file, make_timer(config))
+    else:
+        something_modified |= write_on_change(service_file, make_daemon_service(config))
+        if timer_file.exists():
+            logger.output("Removing timer from previous oneshot installation")
+            systemctl.disable(timer_file.name, now=True)
+            timer_file.unlink()
+            something_modified = True
 
     logger.output(f"Service files installed successfully")
 
@@ -97,21 +142,30 @@ def install_service(config: RunContext):
         logger.output("Reloading systemd daemon")
         systemctl.daemon_reload()
 
-    logger.output("Enabling and starting timer")
-    execute_drop(
-        ["systemctl", "enable", f"{SYSTEMD_SERVICE_NAME}.timer"],
-    )
+    if timer:
+        logger.output("Enabling and starting timer")
+        execute_drop(
+            ["systemctl", "enable", f"{SYSTEMD_SERVICE_NAME}.timer"],
+        )
+
+        systemctl.start(f"{SYSTEMD_SERVICE_NAME}.timer", restart=True)
+        systemctl.print_status(
+            f"{SYSTEMD_SERVICE_NAME}.service", f"{SYSTEMD_SERVICE_NAME}.timer"
+        )
+    else:
+        logger.output("Enabling and starting daemon")
+        execute_drop(
+            ["systemctl", "enable", service_file.name],
+        )
 
-    systemctl.start(f"{SYSTEMD_SERVICE_NAME}.timer", restart=True)
-    systemctl.print_status(
-        f"{SYSTEMD_SERVICE_NAME}.service", f"{SYSTEMD_SERVICE_NAME}.timer"
-    )
+        systemctl.start(service_file.name, restart=True)
+        systemctl.print_status(service_file.name)
 
 
 def uninstall_service():
     service_file, timer_file = _services()
 
-    systemctl.disable(timer_file.name, now=True)
+    systemctl.disable(timer_file.name, service_file.name, now=True)
     systemctl.stop(service_file.name)
     systemctl.reset_failed(timer_file.name, service_file.name)
 
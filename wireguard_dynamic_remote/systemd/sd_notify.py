@@ -13,8 +13,26 @@ def ready():
     sd_notify("READY=1")
 
 
+def stopping():
+    sd_notify("STOPPING=1")
+
+
 def status(message: str):
     sd_notify(f"STATUS={message}")
 
+
 def watchdog():
     sd_notify("WATCHDOG=1")
+
+
+def watchdog_interval() -> float | None:
+    """返回 systemd 要求的看门狗间隔（秒），未启用时返回 None"""
+    usec = os.environ.get("WATCHDOG_USEC")
+    if not usec or not usec.isdigit():
+        return None
+
+    pid = os.environ.get("WATCHDOG_PID")
+    if pid and pid.isdigit() and int(pid) != os.getpid():
+        return None
+
+    return int(usec) / 1000 / 1000
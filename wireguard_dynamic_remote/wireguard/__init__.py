@@ -1,27 +1,28 @@
 import os
-import subprocess
 import sys
+import threading
 from pathlib import Path
 
-from ..common import logger
-from ..common.spawn import execute_capture, execute_drop
-from .config_parser import parse_config_content
-from .type import Endpoint, GlobalConfig, PeerConfig
+from ..common import logger, trace
+from .backend import BACKENDS, Backend, get_backend, select_backend, use_backend
+from .config_parser import parse_config_content, replace_endpoints
+from .repository import ConfigRepository
+from .snapshot import RuntimeSnapshot
+from .type import (
+    Endpoint,
+    GlobalConfig,
+    PeerConfig,
+    RuntimeConfig,
+    RuntimePeerConfig,
+)
 
 
 def get_runtime_interface(interface: str):
-    try:
-        output = execute_capture(
-            commandline=["wg", "showconf", interface],
-            error="raise",
-        )
-    except subprocess.CalledProcessError as p:
-        stderr = p.stderr.strip()
-        if "No such device" in stderr:
-            return None
-        raise RuntimeError(f"Failed to get WireGuard interface config:\n{stderr}")
+    return get_backend().get_device(interface)
 
-    return parse_config_content(output)
+
+def get_runtime_snapshot(interfaces: list[str]) -> RuntimeSnapshot:
+    return get_backend().snapshot(interfaces)
 
 
 if sys.platform == "win32":
@@ -30,12 +31,20 @@ else:
     CONFIG_FILES_DIR = Path("/etc/wireguard")
 
 
-def get_static_interface(interface: str):
-    file = CONFIG_FILES_DIR.joinpath(interface).with_suffix(".conf")
-    if not file.exists():
-        return None
+_repository: ConfigRepository | None = None
+_repository_lock = threading.Lock()
+
 
-    return parse_config_content(file.read_text())
+def get_repository() -> ConfigRepository:
+    global _repository
+    with _repository_lock:
+        if _repository is None or _repository.directory != CONFIG_FILES_DIR:
+            _repository = ConfigRepository(CONFIG_FILES_DIR)
+        return _repository
+
+
+def get_static_interface(interface: str):
+    return get_repository().get(interface)
 
 
 def get_static_config_file(interface: str):
@@ -44,10 +53,25 @@ def get_static_config_file(interface: str):
 
 def list_config_files() -> list[str]:
     logger.output(f"Listing config files in {CONFIG_FILES_DIR}")
-    return [file.stem for file in CONFIG_FILES_DIR.glob("*.conf")]
+    return get_repository().list_interfaces()
 
 
 def set_peer_address(interface: str, peer_public_key: str, address: str):
-    execute_drop(
-        ["wg", "set", interface, "peer", peer_public_key, "endpoint", address],
-    )
+    with trace.span("set_peer_address", "wireguard", interface=interface, peer=peer_public_key):
+        get_backend().set_endpoints(interface, {peer_public_key: address})
+
+
+def set_peer_addresses(interface: str, endpoints: dict[str, str]):
+    with trace.span("set_peer_addresses", "wireguard", interface=interface, peers=len(endpoints)):
+        get_backend().set_endpoints(interface, endpoints)
+
+
+def sync_interface(interface: str, endpoints: dict[str, str]):
+    """
+    按配置文件同步运行中的接口（代替重启 wg-quick），其中 endpoints 中的 peer 使用给定的地址
+
+    其他 peer 和未改变的设置不受影响，已有的会话不会断开
+    """
+    content = get_backend().strip_config(str(get_static_config_file(interface)))
+    with trace.span("sync_config", "wireguard", interface=interface):
+        get_backend().sync_config(interface, replace_endpoints(content, endpoints))
@@ -0,0 +1,182 @@
+import subprocess
+import sys
+import threading
+
+from ..common import logger
+from ..common.spawn import execute_capture, execute_drop
+from .config_parser import parse_config_content
+from .snapshot import RuntimeSnapshot, parse_dump
+from .type import Endpoint, RuntimeConfig
+
+
+class Backend:
+    """读取和修改运行中 WireGuard 接口的方式"""
+
+    kind = ""
+
+    def get_device(self, interface: str) -> RuntimeConfig | None:
+        raise NotImplementedError()
+
+    def snapshot(self, interfaces: list[str]) -> RuntimeSnapshot:
+        """一次性读取多个接口的状态"""
+        devices = {}
+        for interface in interfaces:
+            device = self.get_device(interface)
+            if device is not None:
+                devices[interface] = device
+        return RuntimeSnapshot(devices)
+
+    def set_endpoints(self, interface: str, endpoints: dict[str, str]):
+        """一次修改多个 peer 的 endpoint，{公钥: "ip:端口"}"""
+        raise NotImplementedError()
+
+    def set_keepalive(self, interface: str, public_key: str, seconds: int):
+        raise NotImplementedError()
+
+    def strip_config(self, path: str) -> str:
+        """去掉 wg-quick 配置文件中 wg 不认识的键"""
+        return execute_capture(["wg-quick", "strip", path], error="raise")
+
+    def sync_config(self, interface: str, content: str):
+        """
+        像 `wg syncconf` 一样让接口和配置一致（wg 格式，不含 wg-quick 的键）
+
+        只修改有差异的部分，不影响其他 peer 的会话；netlink 也使用 wg 命令实现
+        """
+        # 包含私钥，通过标准输入传递，不写入文件（服务的 /tmp 也是只读的）
+        execute_drop(["wg", "syncconf", interface, "/dev/stdin"], error="raise", input=content)
+
+
+class CliBackend(Backend):
+    kind = "wg"
+
+    def get_device(self, interface: str):
+        try:
+            output = execute_capture(
+                commandline=["wg", "showconf", interface],
+                error="raise",
+            )
+        except subprocess.CalledProcessError as p:
+            stderr = p.stderr.strip()
+            if "No such device" in stderr:
+                return None
+            raise RuntimeError(f"Failed to get WireGuard interface config:\n{stderr}")
+
+        return parse_config_content(output, RuntimeConfig)
+
+    def snapshot(self, interfaces: list[str]):
+        # 不管多少个接口都只运行一次 wg
+        try:
+            output = execute_capture(["wg", "show", "all", "dump"], error="raise")
+        except subprocess.CalledProcessError as p:
+            # 失败时不能当作没有任何接口（那样会启动所有接口的服务），逐个读取，真正的错误会被抛出
+            logger.warning(f"wg show all dump failed, reading interfaces one by one: {p.stderr.strip()}")
+            return super().snapshot(interfaces)
+        devices = parse_dump(output)
+        return RuntimeSnapshot(
+            {name: devices[name] for name in interfaces if name in devices}
+        )
+
+    def set_endpoints(self, interface: str, endpoints: dict[str, str]):
+        if not endpoints:
+            return
+        cmd = ["wg", "set", interface]
+        for public_key, address in endpoints.items():
+            cmd.extend(["peer", public_key, "endpoint", address])
+        execute_drop(cmd, error="raise")
+
+    def set_keepalive(self, interface: str, public_key: str, seconds: int):
+        execute_drop(
+            [
+                "wg",
+                "set",
+                interface,
+                "peer",
+                public_key,
+                "persistent-keepalive",
+                str(seconds) if seconds else "off",
+            ],
+            error="raise",
+        )
+
+
+class NetlinkBackend(Backend):
+    kind = "netlink"
+
+    def __init__(self) -> None:
+        from .netlink import WireguardNetlink
+
+        self.netlink = WireguardNetlink()
+
+    def get_device(self, interface: str):
+        result = self.netlink.get_device(interface)
+        if result is None:
+            return None
+
+        device, peers = result
+        for peer in peers:
+            peer["AllowedIPs"] = ", ".join(peer["AllowedIPs"])
+            for key in ("LatestHandshake", "TransferRx", "TransferTx"):
+                if key in peer:
+                    peer[key] = str(peer[key])
+        return RuntimeConfig(device, peers)
+
+    def set_endpoints(self, interface: str, endpoints: dict[str, str]):
+        if not endpoints:
+            return
+        parsed = {}
+        for public_key, address in endpoints.items():
+            endpoint = Endpoint(address)
+            if endpoint.is_hostname:
+                raise ValueError(f"Endpoint '{address}' must be an IP address")
+            parsed[public_key] = (endpoint.addr, int(endpoint.port))
+        self.netlink.set_endpoints(interface, parsed)
+
+    def set_keepalive(self, interface: str, public_key: str, seconds: int):
+        self.netlink.set_keepalive(interface, public_key, seconds)
+
+
+BACKENDS = ["auto", "netlink", "wg"]
+
+_backend: Backend | None = None
+_backend_lock = threading.Lock()
+
+
+def select_backend(name: str = "auto") -> Backend:
+    global _backend
+
+    with _backend_lock:
+        _backend = _create_backend(name)
+        return _backend
+
+
+def use_backend(backend: Backend) -> Backend:
+    """直接使用给定的实现（--simulate / --record / replay）"""
+    global _backend
+
+    with _backend_lock:
+        _backend = backend
+        return _backend
+
+
+def _create_backend(name: str) -> Backend:
+    if name in ("auto", "netlink") and sys.platform == "linux":
+        try:
+            return NetlinkBackend()
+        except OSError as e:
+            if name == "netlink":
+                logger.fatal(f"WireGuard netlink backend is not available: {e}")
+            logger.output(f"WireGuard netlink is not available ({e}), using wg command.")
+    elif name == "netlink":
+        logger.fatal(f"WireGuard netlink backend is not supported on {sys.platform}.")
+
+    return CliBackend()
+
+
+def get_backend() -> Backend:
+    global _backend
+
+    with _backend_lock:
+        if _backend is None:
+            _backend = _create_backend("auto")
+        return _backend
@@ -1,4 +1,4 @@
-from .type import GlobalConfig, PeerConfig
+from .type import GlobalConfig
 
 
 def parse_seems_like_comment_config(line: str, known_keys: dict[str, str]):
@@ -49,7 +49,7 @@ def parse_key_values(lines: list[str], keymap: dict[str, str]):
     return result
 
 
-def parse_config_content(content: str):
+def parse_config_content(content: str, config_type: type[GlobalConfig] = GlobalConfig):
     stage = 0  # 0 = global(ignore), 1 = interface, 2 = peer
     cache_lines: list[str] = []
 
@@ -90,7 +90,47 @@ def parse_config_content(content: str):
     if len(interface) == 0:
         raise ValueError("No [Interface] section found")
 
-    interface_dict = parse_key_values(interface, GlobalConfig.known_keys_list())
-    peers_dict_list = [parse_key_values(p, PeerConfig.known_keys_list()) for p in peers]
+    interface_dict = parse_key_values(interface, config_type.known_keys_list())
+    peer_keys = config_type._peer_type.known_keys_list()
+    peers_dict_list = [parse_key_values(p, peer_keys) for p in peers]
 
-    return GlobalConfig(interface_dict, peers_dict_list)
+    return config_type(interface_dict, peers_dict_list)
+
+
+def replace_endpoints(content: str, endpoints: dict[str, str]) -> str:
+    """把配置文本中指定 peer 的 Endpoint 换成新的值，{公钥: 新 endpoint}"""
+    output: list[str] = []
+    peer_start = -1
+    public_key = None
+    endpoint_line = -1
+
+    def finish():
+        if public_key not in endpoints:
+            return
+        line = f"Endpoint = {endpoints[public_key]}"
+        if endpoint_line >= 0:
+            output[endpoint_line] = line
+        else:
+            output.insert(peer_start + 1, line)
+
+    for line in content.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("["):
+            if peer_start >= 0:
+                finish()
+            peer_start = len(output) if stripped.startswith("[Peer]") else -1
+            public_key = None
+            endpoint_line = -1
+        elif peer_start >= 0 and "=" in stripped and not stripped.startswith("#"):
+            key, value = stripped.split("=", 1)
+            key = key.strip().lower()
+            if key == "publickey":
+                public_key = value.strip()
+            elif key == "endpoint":
+                endpoint_line = len(output)
+        output.append(line)
+
+    if peer_start >= 0:
+        finish()
+
+    return "\n".join(output) + "\n"
@@ -0,0 +1,325 @@
+"""
+通过 generic netlink 直接和内核 WireGuard 模块通信（只支持 Linux）
+
+只实现了本程序需要的部分：
+    WG_CMD_GET_DEVICE 读取接口和所有 peer
+    WG_CMD_SET_DEVICE 一次修改多个 peer 的 endpoint
+"""
+
+import base64
+import errno
+import ipaddress
+import os
+import socket
+import struct
+import threading
+
+NETLINK_GENERIC = 16
+
+NLM_F_REQUEST = 0x01
+NLM_F_MULTI = 0x02
+NLM_F_ACK = 0x04
+NLM_F_DUMP = 0x300
+
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+
+NLA_F_NESTED = 0x8000
+NLA_TYPE_MASK = 0x3FFF
+
+GENL_ID_CTRL = 0x10
+CTRL_CMD_GETFAMILY = 3
+CTRL_ATTR_FAMILY_ID = 1
+CTRL_ATTR_FAMILY_NAME = 2
+
+WG_GENL_NAME = "wireguard"
+WG_GENL_VERSION = 1
+WG_CMD_GET_DEVICE = 0
+WG_CMD_SET_DEVICE = 1
+
+WGDEVICE_A_IFINDEX = 1
+WGDEVICE_A_IFNAME = 2
+WGDEVICE_A_PRIVATE_KEY = 3
+WGDEVICE_A_PUBLIC_KEY = 4
+WGDEVICE_A_FLAGS = 5
+WGDEVICE_A_LISTEN_PORT = 6
+WGDEVICE_A_FWMARK = 7
+WGDEVICE_A_PEERS = 8
+
+WGPEER_A_PUBLIC_KEY = 1
+WGPEER_A_PRESHARED_KEY = 2
+WGPEER_A_FLAGS = 3
+WGPEER_A_ENDPOINT = 4
+WGPEER_A_PERSISTENT_KEEPALIVE_INTERVAL = 5
+WGPEER_A_LAST_HANDSHAKE_TIME = 6
+WGPEER_A_RX_BYTES = 7
+WGPEER_A_TX_BYTES = 8
+WGPEER_A_ALLOWEDIPS = 9
+
+WGPEER_F_UPDATE_ONLY = 4
+
+WGALLOWEDIP_A_FAMILY = 1
+WGALLOWEDIP_A_IPADDR = 2
+WGALLOWEDIP_A_CIDR_MASK = 3
+
+# 一个 SET_DEVICE 消息里最多放多少个 peer，避免超过 socket 缓冲区
+SET_BATCH_SIZE = 500
+
+
+class NetlinkError(OSError):
+    def __init__(self, code: int, message: str | None = None):
+        super().__init__(code, message or os.strerror(code))
+
+
+def _align(length: int) -> int:
+    return (length + 3) & ~3
+
+
+def attr(kind: int, payload: bytes) -> bytes:
+    length = 4 + len(payload)
+    return struct.pack("=HH", length, kind) + payload + b"\0" * (_align(length) - length)
+
+
+def nested(kind: int, *children: bytes) -> bytes:
+    return attr(kind | NLA_F_NESTED, b"".join(children))
+
+
+def parse_attrs(data: bytes) -> list[tuple[int, bytes]]:
+    result = []
+    offset = 0
+    while offset + 4 <= len(data):
+        length, kind = struct.unpack_from("=HH", data, offset)
+        if length < 4:
+            break
+        result.append((kind & NLA_TYPE_MASK, data[offset + 4 : offset + length]))
+        offset += _align(length)
+    return result
+
+
+def encode_sockaddr(address: str, port: int) -> bytes:
+    ip = ipaddress.ip_address(address)
+    if ip.version == 4:
+        return struct.pack("=H", socket.AF_INET) + struct.pack("!H", port) + ip.packed + b"\0" * 8
+    return (
+        struct.pack("=H", socket.AF_INET6)
+        + struct.pack("!HI", port, 0)
+        + ip.packed
+        + struct.pack("=I", 0)
+    )
+
+
+def decode_sockaddr(data: bytes) -> str | None:
+    if len(data) < 2:
+        return None
+    (family,) = struct.unpack_from("=H", data)
+    if family == socket.AF_INET and len(data) >= 8:
+        (port,) = struct.unpack_from("!H", data, 2)
+        return f"{ipaddress.IPv4Address(data[4:8])}:{port}"
+    if family == socket.AF_INET6 and len(data) >= 24:
+        (port,) = struct.unpack_from("!H", data, 2)
+        return f"[{ipaddress.IPv6Address(data[8:24])}]:{port}"
+    return None
+
+
+def _key(data: bytes) -> str:
+    return base64.b64encode(data).decode()
+
+
+def _decode_allowed_ip(data: bytes) -> str | None:
+    family = address = cidr = None
+    for kind, value in parse_attrs(data):
+        if kind == WGALLOWEDIP_A_FAMILY:
+            (family,) = struct.unpack("=H", value[:2])
+        elif kind == WGALLOWEDIP_A_IPADDR:
+            address = value
+        elif kind == WGALLOWEDIP_A_CIDR_MASK:
+            cidr = value[0]
+    if address is None or cidr is None:
+        return None
+    if family == socket.AF_INET:
+        return f"{ipaddress.IPv4Address(address[:4])}/{cidr}"
+    return f"{ipaddress.IPv6Address(address[:16])}/{cidr}"
+
+
+def decode_peer(data: bytes) -> dict:
+    """把一个 WGDEVICE_A_PEERS 子项解码为 dict，键名和 wg showconf 一致"""
+    peer: dict = {"AllowedIPs": []}
+    for kind, value in parse_attrs(data):
+        if kind == WGPEER_A_PUBLIC_KEY:
+            peer["PublicKey"] = _key(value)
+        elif kind == WGPEER_A_PRESHARED_KEY:
+            if any(value):
+                peer["PresharedKey"] = _key(value)
+        elif kind == WGPEER_A_ENDPOINT:
+            endpoint = decode_sockaddr(value)
+            if endpoint:
+                peer["Endpoint"] = endpoint
+        elif kind == WGPEER_A_PERSISTENT_KEEPALIVE_INTERVAL:
+            (interval,) = struct.unpack("=H", value[:2])
+            if interval:
+                peer["PersistentKeepalive"] = str(interval)
+        elif kind == WGPEER_A_LAST_HANDSHAKE_TIME:
+            seconds, _ = struct.unpack("=qq", value[:16])
+            peer["LatestHandshake"] = seconds
+        elif kind == WGPEER_A_RX_BYTES:
+            (peer["TransferRx"],) = struct.unpack("=Q", value[:8])
+        elif kind == WGPEER_A_TX_BYTES:
+            (peer["TransferTx"],) = struct.unpack("=Q", value[:8])
+        elif kind == WGPEER_A_ALLOWEDIPS:
+            for _, item in parse_attrs(value):
+                allowed = _decode_allowed_ip(item)
+                if allowed:
+                    peer["AllowedIPs"].append(allowed)
+    return peer
+
+
+class WireguardNetlink:
+    """一个 generic netlink socket，线程安全（内部加锁串行化请求）"""
+
+    def __init__(self) -> None:
+        self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_GENERIC)
+        self._sock.bind((0, 0))
+        self._seq = 0
+        self._lock = threading.Lock()
+        self.family_id = self._resolve_family(WG_GENL_NAME)
+
+    def close(self):
+        self._sock.close()
+
+    def _request(self, msg_type: int, flags: int, cmd: int, version: int, payload: bytes):
+        """发送一个请求，返回所有响应消息的 payload（已去掉 genl 头）"""
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+            body = struct.pack("=BBH", cmd, version, 0) + payload
+            header = struct.pack("=IHHII", 16 + len(body), msg_type, flags, seq, 0)
+            self._sock.send(header + body)
+
+            messages: list[bytes] = []
+            while True:
+                data = self._sock.recv(1 << 20)
+                offset = 0
+                while offset + 16 <= len(data):
+                    length, kind, msg_flags, msg_seq, _ = struct.unpack_from(
+                        "=IHHII", data, offset
+                    )
+                    message = data[offset + 16 : offset + length]
+                    offset += _align(length)
+                    if length < 16 or msg_seq != seq:
+                        continue
+
+                    if kind == NLMSG_DONE:
+                        return messages
+                    if kind == NLMSG_ERROR:
+                        (code,) = struct.unpack_from("=i", message)
+                        if code != 0:
+                            raise NetlinkError(-code)
+                        return messages
+
+                    messages.append(message[4:])
+                    if not msg_flags & NLM_F_MULTI and not flags & NLM_F_ACK:
+                        return messages
+
+    def _resolve_family(self, name: str) -> int:
+        try:
+            replies = self._request(
+                GENL_ID_CTRL,
+                NLM_F_REQUEST,
+                CTRL_CMD_GETFAMILY,
+                1,
+                attr(CTRL_ATTR_FAMILY_NAME, name.encode() + b"\0"),
+            )
+        except NetlinkError as e:
+            if e.errno == errno.ENOENT:
+                raise NetlinkError(e.errno, f"Generic netlink family '{name}' not found")
+            raise
+        for reply in replies:
+            for kind, value in parse_attrs(reply):
+                if kind == CTRL_ATTR_FAMILY_ID:
+                    return struct.unpack("=H", value[:2])[0]
+        raise NetlinkError(errno.ENOENT, f"Generic netlink family '{name}' not found")
+
+    def get_device(self, interface: str) -> tuple[dict, list[dict]] | None:
+        """返回 (接口 dict, peer dict 列表)，接口不存在时返回 None"""
+        try:
+            replies = self._request(
+                self.family_id,
+                NLM_F_REQUEST | NLM_F_DUMP,
+                WG_CMD_GET_DEVICE,
+                WG_GENL_VERSION,
+                attr(WGDEVICE_A_IFNAME, interface.encode() + b"\0"),
+            )
+        except NetlinkError as e:
+            if e.errno in (errno.ENODEV, errno.ENOENT, errno.EOPNOTSUPP):
+                return None
+            raise
+
+        device: dict = {}
+        peers: list[dict] = []
+        for reply in replies:
+            for kind, value in parse_attrs(reply):
+                if kind == WGDEVICE_A_PRIVATE_KEY:
+                    if any(value):
+                        device["PrivateKey"] = _key(value)
+                elif kind == WGDEVICE_A_LISTEN_PORT:
+                    (port,) = struct.unpack("=H", value[:2])
+                    if port:
+                        device["ListenPort"] = str(port)
+                elif kind == WGDEVICE_A_FWMARK:
+                    (fwmark,) = struct.unpack("=I", value[:4])
+                    if fwmark:
+                        device["FwMark"] = str(fwmark)
+                elif kind == WGDEVICE_A_PEERS:
+                    for _, item in parse_attrs(value):
+                        peer = decode_peer(item)
+                        # 一个 peer 的 AllowedIPs 太多时会被拆到下一个消息里
+                        if peers and peer.get("PublicKey") in (None, peers[-1]["PublicKey"]):
+                            peers[-1]["AllowedIPs"].extend(peer["AllowedIPs"])
+                        else:
+                            peers.append(peer)
+
+        return device, peers
+
+    def set_endpoints(self, interface: str, endpoints: dict[str, tuple[str, int]]):
+        """修改多个 peer 的 endpoint，{公钥: (ip, 端口)}；不会创建不存在的 peer"""
+        items = list(endpoints.items())
+        for start in range(0, len(items), SET_BATCH_SIZE):
+            peers = []
+            for index, (public_key, (address, port)) in enumerate(
+                items[start : start + SET_BATCH_SIZE]
+            ):
+                peers.append(
+                    nested(
+                        index,
+                        attr(WGPEER_A_PUBLIC_KEY, base64.b64decode(public_key)),
+                        attr(WGPEER_A_FLAGS, struct.pack("=I", WGPEER_F_UPDATE_ONLY)),
+                        attr(WGPEER_A_ENDPOINT, encode_sockaddr(address, port)),
+                    )
+                )
+
+            self._request(
+                self.family_id,
+                NLM_F_REQUEST | NLM_F_ACK,
+                WG_CMD_SET_DEVICE,
+                WG_GENL_VERSION,
+                attr(WGDEVICE_A_IFNAME, interface.encode() + b"\0")
+                + nested(WGDEVICE_A_PEERS, *peers),
+            )
+
+    def set_keepalive(self, interface: str, public_key: str, seconds: int):
+        self._request(
+            self.family_id,
+            NLM_F_REQUEST | NLM_F_ACK,
+            WG_CMD_SET_DEVICE,
+            WG_GENL_VERSION,
+            attr(WGDEVICE_A_IFNAME, interface.encode() + b"\0")
+            + nested(
+                WGDEVICE_A_PEERS,
+                nested(
+                    0,
+                    attr(WGPEER_A_PUBLIC_KEY, base64.b64decode(public_key)),
+                    attr(WGPEER_A_FLAGS, struct.pack("=I", WGPEER_F_UPDATE_ONLY)),
+                    attr(WGPEER_A_PERSISTENT_KEEPALIVE_INTERVAL, struct.pack("=H", seconds)),
+                ),
+            ),
+        )
@@ -0,0 +1,163 @@
+"""
+解析后的静态配置文件缓存
+
+以 (mtime, inode, size) 判断文件是否变化，未变化时不再读取和解析。
+常驻模式下用 inotify 监视配置目录，有变化时才重新 stat；oneshot 模式下缓存保存在状态目录中。
+"""
+
+import os
+import threading
+from pathlib import Path
+from typing import Callable
+
+from ..common import logger
+from ..common.state import load_json, save_json
+from .config_parser import parse_config_content
+from .type import GlobalConfig
+
+CACHE_FILE = "config-cache.json"
+
+# 状态目录里不保存密钥，检查流程也用不到它们
+_SECRET_KEYS = ("privatekey", "presharedkey")
+
+type FileKey = tuple[int, int, int]
+
+
+def _file_key(path: Path) -> FileKey | None:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_ino, st.st_size)
+
+
+def _strip_secrets(values: dict[str, str]) -> dict[str, str]:
+    return {k: v for k, v in values.items() if k.lower() not in _SECRET_KEYS}
+
+
+class ConfigRepository:
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self._entries: dict[str, tuple[FileKey, GlobalConfig]] = {}
+        self._listing: tuple[FileKey, list[str]] | None = None
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._dirty = False
+        # 被 inotify 监视时，只有收到事件的文件才需要重新 stat
+        self._watching = False
+        self._stale: set[str] = set()
+
+    def path_of(self, interface: str) -> Path:
+        return self.directory.joinpath(interface).with_suffix(".conf")
+
+    def get(self, interface: str) -> GlobalConfig | None:
+        with self._lock:
+            self._load()
+
+            entry = self._entries.get(interface)
+            if self._watching and entry and interface not in self._stale:
+                return entry[1]
+
+            path = self.path_of(interface)
+            key = _file_key(path)
+            self._stale.discard(interface)
+            if key is None:
+                if self._entries.pop(interface, None):
+                    self._dirty = True
+                return None
+
+            if entry and entry[0] == key:
+                return entry[1]
+
+            config = parse_config_content(path.read_text())
+            self._entries[interface] = (key, config)
+            self._dirty = True
+            return config
+
+    def list_interfaces(self) -> list[str]:
+        with self._lock:
+            key = _file_key(self.directory)
+            if key is None:
+                return []
+            if self._listing and self._listing[0] == key:
+                return list(self._listing[1])
+
+            names = sorted(file.stem for file in self.directory.glob("*.conf"))
+            self._listing = (key, names)
+            return list(names)
+
+    def invalidate(self, names: set[str] | None = None):
+        """names 为 None 时全部失效"""
+        with self._lock:
+            self._listing = None
+            if names is None:
+                self._stale.update(self._entries.keys())
+                return
+            for name in names:
+                if name.endswith(".conf"):
+                    self._stale.add(name[: -len(".conf")])
+
+    def watch(self, on_change: Callable[[set[str] | None], None]):
+        """
+        开始用 inotify 监视配置目录（只能在 asyncio 事件循环中调用）
+
+        on_change 收到发生变化的接口名，None 表示全部
+        """
+        import asyncio
+
+        from ..common.inotify import DirectoryWatcher
+
+        watcher = DirectoryWatcher(self.directory)
+
+        def readable():
+            changed = watcher.read()
+            if not watcher.watching:
+                # 目录不存在了，不再有通知，回到每次 stat
+                logger.warning(f"Stopped watching {self.directory}, it no longer exists")
+                asyncio.get_running_loop().remove_reader(watcher.fileno())
+                with self._lock:
+                    self._watching = False
+            self.invalidate(changed)
+            if changed is None:
+                on_change(None)
+                return
+            interfaces = {n[: -len(".conf")] for n in changed if n.endswith(".conf")}
+            if interfaces:
+                on_change(interfaces)
+
+        asyncio.get_running_loop().add_reader(watcher.fileno(), readable)
+        with self._lock:
+            self._watching = True
+        return watcher
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+
+        data = load_json(CACHE_FILE)
+        if not isinstance(data, dict) or data.get("directory") != str(self.directory):
+            return
+        for interface, item in data.get("files", {}).items():
+            try:
+                key, values, peers = item
+                self._entries[interface] = (tuple(key), GlobalConfig(values, peers))
+            except (TypeError, ValueError):
+                continue
+            # 文件可能在程序没有运行时被修改过，inotify 不会报告，第一次使用时必须 stat
+            self._stale.add(interface)
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            files = {
+                interface: [
+                    list(key),
+                    _strip_secrets(config.asdict()),
+                    [_strip_secrets(peer.asdict()) for peer in config.peers],
+                ]
+                for interface, (key, config) in self._entries.items()
+            }
+            self._dirty = False
+        save_json(CACHE_FILE, {"directory": str(self.directory), "files": files})
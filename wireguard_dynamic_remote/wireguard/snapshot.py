@@ -0,0 +1,98 @@
+import time
+
+from .type import RuntimeConfig
+
+# wg show all dump 每行的字段数
+_DUMP_INTERFACE_FIELDS = 5
+_DUMP_PEER_FIELDS = 9
+
+
+def _none(value: str) -> str:
+    return "" if value in ("(none)", "off") else value
+
+
+def parse_dump(output: str) -> dict[str, RuntimeConfig]:
+    """
+    一次遍历解析 `wg show all dump` 的输出
+
+    接口行: 接口 私钥 公钥 监听端口 fwmark
+    peer 行: 接口 公钥 预共享密钥 endpoint allowed-ips 最后握手 接收 发送 keepalive
+    """
+    interfaces: dict[str, dict] = {}
+    peers: dict[str, list[dict]] = {}
+
+    for line in output.splitlines():
+        fields = line.split("\t")
+        if len(fields) == _DUMP_INTERFACE_FIELDS:
+            name, private_key, _, listen_port, fwmark = fields
+            interfaces[name] = {
+                "PrivateKey": _none(private_key),
+                "ListenPort": listen_port if listen_port != "0" else "",
+                "FwMark": _none(fwmark),
+            }
+            peers[name] = []
+        elif len(fields) == _DUMP_PEER_FIELDS:
+            (
+                name,
+                public_key,
+                preshared_key,
+                endpoint,
+                allowed_ips,
+                handshake,
+                rx,
+                tx,
+                keepalive,
+            ) = fields
+            peers.setdefault(name, []).append(
+                {
+                    "PublicKey": public_key,
+                    "PresharedKey": _none(preshared_key),
+                    "Endpoint": _none(endpoint),
+                    "AllowedIPs": _none(allowed_ips).replace(",", ", "),
+                    "LatestHandshake": handshake,
+                    "TransferRx": rx,
+                    "TransferTx": tx,
+                    "PersistentKeepalive": _none(keepalive),
+                }
+            )
+
+    return {
+        name: RuntimeConfig(interface, peers.get(name, []))
+        for name, interface in interfaces.items()
+    }
+
+
+def format_dump(name: str, device: RuntimeConfig) -> str:
+    """parse_dump 的反过程（只用于一个接口），私钥和预共享密钥不输出"""
+    lines = [f"{name}\t(none)\t(none)\t{device.ListenPort or 0}\t{device.FwMark or 'off'}"]
+    for peer in device.peers:
+        lines.append(
+            "\t".join(
+                [
+                    name,
+                    peer.PublicKey,
+                    "(none)",
+                    peer.Endpoint or "(none)",
+                    peer.AllowedIPs.replace(", ", ",") or "(none)",
+                    str(peer.latest_handshake()),
+                    peer.TransferRx or "0",
+                    peer.TransferTx or "0",
+                    peer.PersistentKeepalive or "off",
+                ]
+            )
+        )
+    return "\n".join(lines)
+
+
+class RuntimeSnapshot:
+    """某一时刻所有运行中接口的状态，一个检查周期内共用"""
+
+    def __init__(self, devices: dict[str, RuntimeConfig]):
+        self.devices = devices
+        self.taken_at = time.time()
+
+    def get(self, interface: str) -> RuntimeConfig | None:
+        return self.devices.get(interface)
+
+    def __contains__(self, interface: str) -> bool:
+        return interface in self.devices
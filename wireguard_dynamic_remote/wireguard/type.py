@@ -1,23 +1,52 @@
 import ipaddress
 
+from ..common import logger
+from ..common.timespan import parse_timespan
 
-def make_name_map(object):
-    known_keys = {}
-    for key in dir(object):
-        if key.startswith("_") or callable(getattr(object, key)):
-            continue
-        known_keys[key.lower()] = key
 
-    return known_keys
+class _ConfigMeta(type):
+    """
+    把类上声明的 `Key = ""` 字段收集为 schema
 
+    字段和小写名称映射在定义类时计算一次（而不是每个实例都 dir() 一遍），
+    同时把字段改为 __slots__，大量 peer 时内存占用更小
+    """
+
+    def __new__(mcs, name: str, bases: tuple, namespace: dict):
+        fields = {
+            key: value
+            for key, value in namespace.items()
+            if not key.startswith("_") and isinstance(value, str)
+        }
+        for key in fields:
+            del namespace[key]
+        namespace["__slots__"] = tuple(namespace.get("__slots__", ())) + tuple(fields)
+
+        cls = super().__new__(mcs, name, bases, namespace)
+
+        defaults: dict[str, str] = {}
+        for base in reversed(cls.__mro__[1:]):
+            defaults.update(getattr(base, "_defaults", {}))
+        defaults.update(fields)
+
+        cls._defaults = defaults
+        cls._name_map = {key.lower(): key for key in defaults}
+        return cls
+
+
+class Config(metaclass=_ConfigMeta):
+    __slots__ = ("_others",)
+
+    _defaults: dict[str, str]
+    _name_map: dict[str, str]
 
-class Config:
     def __init__(self, peer: dict):
         self._others = {}
-        self._known_keys = dict()
 
-        known_keys = make_name_map(self)
+        for key, value in self._defaults.items():
+            setattr(self, key, value)
 
+        known_keys = self._name_map
         for key, value in peer.items():
             lkey = key.lower()
             if lkey in known_keys:
@@ -25,26 +54,31 @@ class Config:
             else:
                 self._others[lkey] = value
 
-        self._known_keys = known_keys
-
     def get(self, key: str) -> str | None:
         lkey = key.lower()
-        if lkey in self._known_keys:
-            return getattr(self, self._known_keys[lkey], None)
+        if lkey in self._name_map:
+            return getattr(self, self._name_map[lkey], None)
 
         return self._others.get(lkey, None)
 
+    def asdict(self) -> dict[str, str]:
+        """所有非空字段和未知字段，可以重新传给构造函数"""
+        result = {key: getattr(self, key) for key in self._defaults}
+        result = {key: value for key, value in result.items() if value != ""}
+        result.update(self._others)
+        return result
+
     @classmethod
     def known_keys_list(cls) -> dict[str, str]:
-        return make_name_map(cls)
+        return cls._name_map
 
     def __str__(self) -> str:
         max_key_len = max(
-            len(k) for k in [*dict.keys(self._others), *self._known_keys.values()]
+            len(k) for k in [*dict.keys(self._others), *self._defaults.keys()]
         )
 
         r = ""
-        for key in self._known_keys.values():
+        for key in self._defaults.keys():
             value = getattr(self, key)
             if value == "":
                 continue
@@ -84,6 +118,12 @@ class Endpoint:
         self.addr = addr
         self.port = port
 
+    @staticmethod
+    def format(addr: str, port: str | int) -> str:
+        if ":" in addr:
+            return f"[{addr}]:{port}"
+        return f"{addr}:{port}"
+
 
 class PeerConfig(Config):
     PublicKey = ""
@@ -101,7 +141,24 @@ class PeerConfig(Config):
         return "[Peer]\n" + super().__str__()
 
 
+class RuntimePeerConfig(PeerConfig):
+    """运行中的 peer，多了 wg show 才有的字段"""
+
+    PresharedKey = ""
+    LatestHandshake = ""
+    TransferRx = ""
+    TransferTx = ""
+
+    def latest_handshake(self) -> int:
+        """最后一次握手的 unix 时间，从未握手时为 0"""
+        return int(self.LatestHandshake or 0)
+
+
 class GlobalConfig(Config):
+    __slots__ = ("peers", "_peer_index")
+
+    _peer_type = PeerConfig
+
     peers: list[PeerConfig]  # don't set default value
 
     ListenPort = ""
@@ -109,6 +166,10 @@ class GlobalConfig(Config):
 
     # my addition
     OnChange = ""
+    SkipIfHandshakeWithin = ""
+    VerifyHandshake = ""
+    SwitchMargin = ""
+    MinDwell = ""
 
     # wg-quick
     PostUp = ""
@@ -124,13 +185,52 @@ class GlobalConfig(Config):
     def __init__(self, interface: dict, peers: list[dict]):
         super().__init__(interface)
 
-        self.peers = [PeerConfig(p) for p in peers]
+        self.peers = [self._peer_type(p) for p in peers]
+        self._peer_index: dict[str, PeerConfig] = {}
+        for peer in self.peers:
+            self._peer_index.setdefault(peer.PublicKey, peer)
+
+    def _timespan(self, key: str) -> float | None:
+        value = getattr(self, key)
+        if not value:
+            return None
+        try:
+            return parse_timespan(value)
+        except ValueError as e:
+            logger.warning(f"{key} is invalid: {e}")
+            return None
+
+    def skip_if_handshake_within(self) -> float | None:
+        """握手在这个时间内的 peer 不需要检查，未设置时返回 None"""
+        return self._timespan("SkipIfHandshakeWithin")
+
+    def verify_handshake(self) -> float | None:
+        """设置新地址后等待握手的时间，超时就换下一个地址；未设置时返回 None"""
+        return self._timespan("VerifyHandshake")
+
+    def min_dwell(self) -> float | None:
+        """选定一个地址后至少使用多久（地址仍然可用时），未设置时返回 None"""
+        return self._timespan("MinDwell")
+
+    def switch_margin(self) -> tuple[float, bool] | None:
+        """
+        当前地址仍然有效时，新地址的 RTT 至少好多少才切换，未设置时返回 None
+
+        "20%" 返回 (0.2, True)，表示比例；"30ms" 返回 (0.03, False)，表示绝对时间
+        """
+        value = self.SwitchMargin.strip()
+        if not value:
+            return None
+        try:
+            if value.endswith("%"):
+                return float(value[:-1]) / 100, True
+            return parse_timespan(value), False
+        except ValueError as e:
+            logger.warning(f"SwitchMargin is invalid: {e}")
+            return None
 
     def get_peer_by_public_key(self, public_key: str) -> PeerConfig | None:
-        for peer in self.peers:
-            if peer.PublicKey == public_key:
-                return peer
-        return None
+        return self._peer_index.get(public_key)
 
     def __str__(self) -> str:
         r = "[Interface]\n" + super().__str__()
@@ -139,3 +239,11 @@ class GlobalConfig(Config):
             r += "\n\n" + str(peer)
 
         return r
+
+
+class RuntimeConfig(GlobalConfig):
+    _peer_type = RuntimePeerConfig
+
+    peers: list[RuntimePeerConfig]
+
+    FwMark = ""